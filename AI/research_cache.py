@@ -0,0 +1,119 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+
+# یکسان‌سازی حروف عربی/فارسی و ارقام تا «تاريخ ايران» و «تاریخ ایران» یک کلید شوند
+_CHAR_MAP = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ك': 'ک', 'ة': 'ه', 'ۀ': 'ه', 'أ': 'ا', 'إ': 'ا', 'آ': 'ا',
+    '\u200c': ' ', '\u200f': ' ', '\u200e': ' ',
+    **{chr(0x06F0 + i): str(i) for i in range(10)},
+    **{chr(0x0660 + i): str(i) for i in range(10)},
+})
+_DIACRITICS = re.compile('[\u064b-\u065f\u0670]')
+_NON_WORD = re.compile(r'[^\w]+')
+
+
+def normalize_query(text):
+    """کلید نرمال شده: NFKC، حروف یکسان، بدون اعراب، علائم نگارشی و فاصله اضافه، حروف کوچک"""
+    text = unicodedata.normalize('NFKC', text or '').translate(_CHAR_MAP)
+    text = _DIACRITICS.sub('', text).replace('\u0640', '')
+    return ' '.join(_NON_WORD.sub(' ', text).lower().split())
+
+
+class ResearchCache:
+    """
+    کش دیسکی (SQLite) مراحل شبکه‌ای تحقیق با کلید متن نرمال شده:
+        kind='query'  متن کاربر -> عبارت جستجوی استخراج شده توسط مدل
+        kind='pages'  عبارت جستجو -> خلاصه نتایج parse شده
+    ورودی‌ها بعد از RESEARCH_CACHE_TTL ثانیه منقضی و وقتی حجم کل از RESEARCH_CACHE_MAX_BYTES
+    بیشتر شود کم‌استفاده‌ترین‌ها (LRU بر اساس accessed_at) حذف می‌شوند.
+    فایل بین پروسس‌ها مشترک است (WAL)؛ هر ترد اتصال خودش را دارد.
+    """
+
+    def __init__(self, path=None, ttl=None, max_bytes=None):
+        self.path = str(path or getattr(settings, 'RESEARCH_CACHE_PATH', settings.BASE_DIR / 'research_cache.sqlite3'))
+        self.ttl = ttl or getattr(settings, 'RESEARCH_CACHE_TTL', 7 * 24 * 3600)
+        self.max_bytes = max_bytes or getattr(settings, 'RESEARCH_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+        self._local = threading.local()
+
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS research_cache ('
+                ' key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,'
+                ' expires_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS research_cache_accessed ON research_cache (accessed_at)')
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def make_key(kind, text):
+        return f'{kind}:' + hashlib.sha1(normalize_query(text).encode()).hexdigest()
+
+    def get(self, kind, text):
+        key = self.make_key(kind, text)
+        now = time.time()
+        connection = self.connection()
+        row = connection.execute('SELECT value, expires_at FROM research_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            connection.execute('DELETE FROM research_cache WHERE key = ?', (key,))
+            return None
+        connection.execute('UPDATE research_cache SET accessed_at = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, kind, text, value, ttl=None):
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        connection = self.connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO research_cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+            (self.make_key(kind, text), data, len(data.encode()), now + (ttl or self.ttl), now)
+        )
+        self.evict(now)
+
+    def evict(self, now=None):
+        """حذف منقضی‌ها و سپس قدیمی‌ترین دسترسی‌ها تا حجم کل زیر max_bytes برسد"""
+        connection = self.connection()
+        connection.execute('DELETE FROM research_cache WHERE expires_at <= ?', (now or time.time(),))
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM research_cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        for key, size in connection.execute(
+            'SELECT key, size FROM research_cache ORDER BY accessed_at'
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            connection.execute('DELETE FROM research_cache WHERE key = ?', (key,))
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        self.connection().execute('DELETE FROM research_cache')
+
+
+_research_cache = None
+_research_cache_lock = threading.Lock()
+
+
+def get_research_cache() -> ResearchCache:
+    global _research_cache
+    if _research_cache is None:
+        with _research_cache_lock:
+            if _research_cache is None:
+                _research_cache = ResearchCache()
+    return _research_cache
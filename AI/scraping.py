@@ -0,0 +1,83 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from bs4 import BeautifulSoup
+from django.conf import settings
+
+from AIchat.http_client import get_async_client
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def parse_results(html):
+    """استخراج «عنوان: خلاصه» از یک صفحه نتایج DuckDuckGo (در پروسس‌های parse pool اجرا می‌شود)"""
+    soup = BeautifulSoup(html, "html.parser")
+    summaries = []
+    for result in soup.select(".result"):
+        title_tag = result.select_one(".result__a")
+        snippet_tag = result.select_one(".result__snippet")
+
+        title = title_tag.get_text(strip=True) if title_tag else ""
+        snippet = snippet_tag.get_text(strip=True) if snippet_tag else ""
+
+        if title or snippet:
+            summaries.append(f"{title}: {snippet}")
+    return summaries
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """
+    pool پروسس مشترک برای parse کردن HTML؛ BeautifulSoup پایتون خالص است و روی event loop
+    یا زیر GIL بقیه درخواست‌ها را معطل می‌کند. spawn به جای fork چون پروسس اصلی ترد دارد.
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        with _parse_pool_lock:
+            if _parse_pool is None:
+                _parse_pool = ProcessPoolExecutor(
+                    max_workers=getattr(settings, 'SCRAPE_PARSE_WORKERS', 2),
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+    return _parse_pool
+
+
+async def scrape_pages(query, pages=None, concurrency=None, budget=None, base_url=None):
+    """
+    دریافت همزمان صفحات نتایج (حداکثر concurrency درخواست باز روی AsyncClient مشترک) و parse
+    هر صفحه در parse pool به محض رسیدن. بعد از budget ثانیه کارهای باقی‌مانده لغو و نتایج
+    صفحه‌های آماده (به ترتیب صفحه) برگردانده می‌شوند.
+    خروجی: (summaries, complete) که complete یعنی همه صفحه‌ها سالم رسیده‌اند
+    """
+    pages = pages or getattr(settings, 'SCRAPE_PAGES', 5)
+    concurrency = concurrency or getattr(settings, 'SCRAPE_CONCURRENCY', 5)
+    budget = budget or getattr(settings, 'SCRAPE_LATENCY_BUDGET', 8.0)
+    base_url = base_url or getattr(settings, 'SCRAPE_SEARCH_URL', 'https://duckduckgo.com/html/')
+    headers = {"User-Agent": "Mozilla/5.0"}
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    client = get_async_client()
+
+    async def fetch_and_parse(page):
+        params = {"q": query, "s": page * 70}  # پارامتر s برای صفحه بعد
+        async with semaphore:
+            response = await client.get(base_url, params=params, headers=headers, timeout=budget)
+        return await loop.run_in_executor(get_parse_pool(), parse_results, response.text)
+
+    tasks = [asyncio.create_task(fetch_and_parse(page)) for page in range(pages)]
+    done, pending = await asyncio.wait(tasks, timeout=budget)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    summaries = []
+    complete = True
+    for task in tasks:
+        if task in done and task.exception() is None:
+            summaries.extend(task.result())
+        else:
+            complete = False
+    return summaries, complete
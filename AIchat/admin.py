@@ -1,3 +1,26 @@
 from django.contrib import admin
 
-# Register your models here.
+from AIchat.models import AIJob, AIUsageBucket, LegalChatSession, LegalChatTurn
+
+
+@admin.register(LegalChatSession)
+class LegalChatSessionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'session_key', 'user', 'summary_tokens', 'created_at', 'updated_at']
+
+
+@admin.register(LegalChatTurn)
+class LegalChatTurnAdmin(admin.ModelAdmin):
+    list_display = ['id', 'session', 'role', 'tokens', 'created_at']
+
+
+@admin.register(AIJob)
+class AIJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'job_id', 'feature', 'provider', 'lane', 'status', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status', 'lane', 'feature']
+
+
+@admin.register(AIUsageBucket)
+class AIUsageBucketAdmin(admin.ModelAdmin):
+    list_display = ['bucket', 'provider', 'model', 'feature', 'cache', 'error', 'calls', 'input_tokens',
+                    'output_tokens', 'cost_usd']
+    list_filter = ['provider', 'feature', 'cache']
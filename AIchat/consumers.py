@@ -1,52 +1,260 @@
+import asyncio
 import json
-from channels.generic.websocket import AsyncWebsocketConsumer
+import logging
+import time
+from urllib.parse import parse_qs
+
 import httpx
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from httpx_sse import aconnect_sse
+
+from AI.features import FEATURES, AIFeatures, bind_feature_args, client_provider
+from AIchat.gateway import LLMError
+from AIchat.http_client import get_async_client
+from AIchat.memory import ConversationMemory
+from AIchat.usage import get_usage_recorder
+
+SYSTEM_PROMPT = "You are a helpful, professional Persian legal advisor. Only answer legal questions."
+ERROR_MESSAGE = "خطا در ارتباط با سرور مشاور حقوقی. لطفاً بعداً تلاش کنید."
+AI_ERROR_MESSAGE = "خطا در ارتباط با سرویس هوش مصنوعی. لطفاً بعداً تلاش کنید."
+
+logger = logging.getLogger(__name__)
+
 
 class LegalChatConsumer(AsyncWebsocketConsumer):
+    """
+    پاسخ مدل به صورت استریم: هر تکه SSE به محض رسیدن با {"type": "delta", "text": ...}
+    فرستاده می‌شود و در پایان {"type": "done", "message": <کل پاسخ>} می‌آید.
+    قطع اتصال یا {"action": "cancel"} درخواست در حال اجرا را لغو می‌کند.
+    تاریخچه در ConversationMemory با بودجه توکن نگه داشته می‌شود؛ با ?session=<session_id>
+    همان نشست بعد از اتصال مجدد ادامه پیدا می‌کند.
+    فقط کاربران احراز هویت شده وصل می‌شوند، چون هر پیام با کلید API سرور به مدل می‌رود.
+    """
+
     async def connect(self):
+        self.stream_task = None
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.close(code=4001)
+            return
         await self.accept()
-        self.chat_history = []
+        session_key = parse_qs(self.scope.get("query_string", b"").decode()).get("session", [None])[0]
+        self.memory = await database_sync_to_async(ConversationMemory.open)(session_key, user)
+        await self.send(text_data=json.dumps({
+            "type": "session",
+            "session_id": self.memory.session_key,
+            "history": self.memory.history(),
+        }, ensure_ascii=False))
 
     async def disconnect(self, close_code):
-        pass
+        await self.cancel_stream()
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
-        user_message = data["message"]
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data)
+        except (TypeError, ValueError):
+            data = None
+        if isinstance(data, dict) and data.get("action") == "cancel":
+            await self.cancel_stream()
+            return
+        user_message = data.get("message") if isinstance(data, dict) else None
+        if not isinstance(user_message, str) or not user_message.strip():
+            # فریم نامعتبر اتصال را نمی‌بندد و استریم در حال اجرا را هم لغو نمی‌کند
+            await self.send(text_data=json.dumps({"type": "error", "message": ERROR_MESSAGE}, ensure_ascii=False))
+            return
+
+        # پیام جدید در حین استریم، پاسخ قبلی را لغو می‌کند
+        await self.cancel_stream()
+        await database_sync_to_async(self.memory.add_turn)("user", user_message)
+        # استریم در تسک جدا اجرا می‌شود تا disconnect و cancel در همین حین دریافت شوند
+        self.stream_task = asyncio.create_task(self.stream_reply(self.memory.build_messages()))
 
-        self.chat_history.append({"role": "user", "content": user_message})
+    async def cancel_stream(self):
+        task = getattr(self, "stream_task", None)
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.stream_task = None
 
-        # تماس با Claude API
-        response_text = await self.ask_claude(self.chat_history)
+    async def stream_reply(self, history):
+        parts = []
+        usage = {}
+        started = time.monotonic()
+        ttft = None
+        try:
+            async for text in self.ask_claude_stream(history, usage):
+                if ttft is None:
+                    ttft = time.monotonic() - started
+                parts.append(text)
+                await self.send(text_data=json.dumps({"type": "delta", "text": text}, ensure_ascii=False))
+        except asyncio.CancelledError as e:
+            self.record_usage("legal_chat", usage, started, ttft, error=e)
+            # پیام بی‌پاسخ در تاریخچه نمی‌ماند تا پیام بعدی با تاریخچه سالم ارسال شود
+            await asyncio.shield(database_sync_to_async(self.memory.discard_last_user_turn)())
+            raise
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            self.record_usage("legal_chat", usage, started, ttft, error=e)
+            await database_sync_to_async(self.memory.discard_last_user_turn)()
+            await self.send(text_data=json.dumps({"type": "error", "message": ERROR_MESSAGE}, ensure_ascii=False))
+            return
 
-        self.chat_history.append({"role": "assistant", "content": response_text})
+        self.record_usage("legal_chat", usage, started, ttft)
+        response_text = "".join(parts)
+        await database_sync_to_async(self.memory.add_turn)("assistant", response_text)
+        await self.send(text_data=json.dumps({"type": "done", "message": response_text}, ensure_ascii=False))
+        # خلاصه‌سازی بعد از ارسال پاسخ انجام می‌شود و زمان پاسخ را زیاد نمی‌کند
+        await self.compact_memory()
 
-        await self.send(text_data=json.dumps({
-            "message": response_text
-        }))
+    async def compact_memory(self):
+        if not self.memory.needs_compaction():
+            return
+        folded = self.memory.turns_to_fold()
+        try:
+            summary = await self.summarize(self.memory.summary_request(self.memory.session.summary, folded))
+        except (httpx.HTTPError, ValueError, KeyError, IndexError):
+            summary = self.memory.fallback_summary(folded)
+        await database_sync_to_async(self.memory.apply_summary)(summary, folded)
 
-    async def ask_claude(self, history):
+    @staticmethod
+    def record_usage(feature, usage, started, ttft=None, error=None):
+        """ثبت مصرف فراخوانی مستقیم Messages API در UsageRecorder (AIchat/usage.py)"""
+        get_usage_recorder().record(
+            "anthropic", getattr(settings, "CLAUDE_MODEL", "claude-3-sonnet-20240229"), feature,
+            usage.get("input_tokens", 0), usage.get("output_tokens", 0), time.monotonic() - started,
+            ttft=ttft, error=error,
+        )
+
+    async def summarize(self, prompt):
         headers = {
-            "x-api-key": "YOUR_CLAUDE_API_KEY",
+            "x-api-key": settings.CLAUDE_API_KEY,
+            "anthropic-version": getattr(settings, "CLAUDE_API_VERSION", "2023-06-01"),
+            "Content-Type": "application/json"
+        }
+        body = {
+            "model": getattr(settings, "CLAUDE_MODEL", "claude-3-sonnet-20240229"),
+            "max_tokens": getattr(settings, "LEGAL_CHAT_SUMMARY_TOKENS", 500),
+            "temperature": 0,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+        started = time.monotonic()
+        try:
+            response = await get_async_client().post(settings.CLAUDE_API_URL, headers=headers, json=body)
+            response.raise_for_status()
+            data = response.json()
+        except (Exception, asyncio.CancelledError) as e:
+            self.record_usage("legal_chat_summary", {}, started, error=e)
+            raise
+        latency = time.monotonic() - started
+        self.record_usage("legal_chat_summary", data.get("usage") or {}, started, ttft=latency)
+        return data["content"][0]["text"]
+
+    async def ask_claude_stream(self, history, usage=None):
+        """
+        تکه‌های متن پاسخ از رویدادهای content_block_delta استریم Messages API.
+        استریم تا انتها خوانده می‌شود (بعد از message_stop) تا اتصال به pool برگردد.
+        توکن‌های مصرفی (message_start و message_delta) در دیکشنری usage نوشته می‌شوند.
+        """
+        usage = usage if usage is not None else {}
+        headers = {
+            "x-api-key": settings.CLAUDE_API_KEY,
+            "anthropic-version": getattr(settings, "CLAUDE_API_VERSION", "2023-06-01"),
             "Content-Type": "application/json"
         }
 
         body = {
-            "model": "claude-3-sonnet-20240229",
-            "max_tokens": 1024,
+            "model": getattr(settings, "CLAUDE_MODEL", "claude-3-sonnet-20240229"),
+            "max_tokens": getattr(settings, "CLAUDE_MAX_TOKENS", 1024),
             "temperature": 0.7,
-            "system": "You are a helpful, professional Persian legal advisor. Only answer legal questions.",
-            "messages": history
+            "system": self.memory.system_prompt(SYSTEM_PROMPT),
+            "messages": history,
+            "stream": True,
         }
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.post(
-                    "https://api.anthropic.com/v1/messages",
-                    headers=headers,
-                    json=body
-                )
-                result = response.json()
-                return result["content"][0]["text"]
-            except Exception as e:
-                return "خطا در ارتباط با سرور مشاور حقوقی. لطفاً بعداً تلاش کنید."
+        client = get_async_client()
+        async with aconnect_sse(client, "POST", settings.CLAUDE_API_URL, headers=headers, json=body) as event_source:
+            event_source.response.raise_for_status()
+            async for sse in event_source.aiter_sse():
+                if sse.event == "content_block_delta":
+                    delta = json.loads(sse.data)["delta"]
+                    if delta.get("type") == "text_delta":
+                        yield delta["text"]
+                elif sse.event == "message_start":
+                    message_usage = json.loads(sse.data)["message"].get("usage") or {}
+                    usage["input_tokens"] = message_usage.get("input_tokens", 0)
+                    usage["output_tokens"] = message_usage.get("output_tokens", 0)
+                elif sse.event == "message_delta":
+                    # output_tokens در message_delta تجمعی است
+                    usage["output_tokens"] = (json.loads(sse.data).get("usage") or {}).get(
+                        "output_tokens", usage.get("output_tokens", 0)
+                    )
+                elif sse.event == "error":
+                    raise ValueError(sse.data)
+
+
+class AIFeatureConsumer(AsyncWebsocketConsumer):
+    """
+    اجرای قابلیت‌های AI (AI/features.py) روی ASGI بدون بلاک کردن ورکر.
+    درخواست: {"id": ..., "feature": "summarizing", "args": {...}, "provider": اختیاری}
+    پاسخ: {"type": "result", "id": ..., "result": ...} یا {"type": "error", "id": ..., "message": ...}
+    چند درخواست یک اتصال همزمان اجرا می‌شوند (حداکثر AI_WS_MAX_INFLIGHT) و با قطع اتصال لغو می‌شوند.
+    """
+
+    features = FEATURES
+
+    async def connect(self):
+        self.user = self.scope.get("user")
+        if self.user is None or not self.user.is_authenticated:
+            await self.close(code=4001)
+            return
+        self.tasks = set()
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        for task in list(getattr(self, "tasks", ())):
+            task.cancel()
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+        except ValueError:
+            return
+        if not isinstance(data, dict):
+            await self.send_json({"type": "error", "id": None, "message": "invalid request"})
+            return
+        feature, args = data.get("feature"), data.get("args", {})
+        if not isinstance(feature, str) or feature not in self.features or not isinstance(args, dict):
+            await self.send_json({"type": "error", "id": data.get("id"), "message": "invalid feature"})
+            return
+        try:
+            bind_feature_args(feature, args)
+        except TypeError:
+            await self.send_json({"type": "error", "id": data.get("id"), "message": "invalid arguments"})
+            return
+        if len(self.tasks) >= getattr(settings, "AI_WS_MAX_INFLIGHT", 4):
+            await self.send_json({"type": "error", "id": data.get("id"), "message": "too many requests"})
+            return
+        task = asyncio.create_task(self.run_feature(data.get("id"), feature, args, client_provider(data.get("provider"))))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run_feature(self, request_id, feature, args, provider):
+        method = getattr(AIFeatures(provider=provider), feature)
+        try:
+            result = await method(**args)
+        except (LLMError, httpx.HTTPError, ValueError, KeyError, IndexError):
+            await self.send_json({"type": "error", "id": request_id, "message": AI_ERROR_MESSAGE})
+            return
+        except Exception:
+            # خطای پیش‌بینی نشده هم باید به کلاینت جواب بدهد، نه اینکه درخواست بی‌پاسخ بماند
+            logger.exception("AI feature %s failed", feature)
+            await self.send_json({"type": "error", "id": request_id, "message": AI_ERROR_MESSAGE})
+            return
+        await self.send_json({"type": "result", "id": request_id, "result": result})
+
+    async def send_json(self, content):
+        await self.send(text_data=json.dumps(content, ensure_ascii=False))
@@ -0,0 +1,298 @@
+import asyncio
+import math
+import random
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import httpx
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from AIchat.http_client import get_async_client
+
+RETRY_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """خطای نهایی سرویس مدل بعد از تمام تلاش‌های مجدد"""
+
+    def __init__(self, provider, message, status_code=None):
+        super().__init__(f'{provider}: {message}')
+        self.provider = provider
+        self.message = message
+        self.status_code = status_code
+
+
+class BaseProvider:
+    """
+    یک سرویس‌دهنده مدل زبانی با رابط یکسان:
+        await provider.chat(messages, model=None, max_tokens=None, temperature=None)
+    خروجی دیکشنری {'text', 'provider', 'model', 'input_tokens', 'output_tokens'} است.
+    همه درخواست‌ها از AsyncClient مشترک پروسس (http_client) می‌روند و تعداد درخواست
+    همزمان هر سرویس‌دهنده با max_concurrency محدود است.
+    """
+
+    name = None
+    base_url = None
+    default_model = None
+
+    def __init__(self, name=None, api_key=None, base_url=None, model=None, max_concurrency=4,
+                 timeout=None, retries=None, backoff=0.5, backoff_max=8.0):
+        self.name = name or self.name
+        self.api_key = api_key
+        self.base_url = base_url or self.base_url
+        self.default_model = model or self.default_model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout or getattr(settings, 'LLM_REQUEST_TIMEOUT', 120)
+        self.retries = retries if retries is not None else getattr(settings, 'LLM_RETRIES', 2)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        # Semaphore به event loop وابسته است؛ برای هر loop یکی ساخته می‌شود
+        self._semaphores = {}
+
+    def semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            for old_loop in [old_loop for old_loop in self._semaphores if old_loop.is_closed()]:
+                del self._semaphores[old_loop]
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def chat(self, messages, model=None, max_tokens=None, temperature=None):
+        model = model or self.default_model
+        async with self.semaphore():
+            data = await self.request_with_retries(self.build_request(messages, model, max_tokens, temperature))
+        result = self.parse_response(data)
+        result.update({'provider': self.name, 'model': model})
+        return result
+
+    async def request_with_retries(self, request):
+        url, headers, body = request
+        for attempt in range(self.retries + 1):
+            try:
+                response = await get_async_client().post(url, headers=headers, json=body, timeout=self.timeout)
+            except httpx.TransportError as e:
+                if attempt >= self.retries:
+                    raise LLMError(self.name, f'connection failed: {e!r}')
+                await asyncio.sleep(self.retry_delay(attempt))
+                continue
+
+            if response.status_code < 400:
+                return response.json()
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= self.retries:
+                raise LLMError(self.name, response.text[:500], response.status_code)
+            await asyncio.sleep(self.retry_delay(attempt, response.headers.get('retry-after')))
+
+    def retry_delay(self, attempt, retry_after=None):
+        """backoff نمایی با full jitter؛ Retry-After سرور در صورت معقول بودن رعایت می‌شود"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def build_request(self, messages, model, max_tokens, temperature):
+        """(url, headers, body)"""
+        raise NotImplementedError
+
+    def parse_response(self, data):
+        raise NotImplementedError
+
+
+class OpenAICompatibleProvider(BaseProvider):
+    """DeepSeek و OpenRouter (رابط chat/completions سازگار با OpenAI)"""
+
+    def build_request(self, messages, model, max_tokens, temperature):
+        body = {'model': model, 'messages': messages, 'stream': False}
+        if max_tokens:
+            body['max_tokens'] = max_tokens
+        if temperature is not None:
+            body['temperature'] = temperature
+        headers = {'Authorization': f'Bearer {self.api_key}', 'Content-Type': 'application/json'}
+        return f'{self.base_url}/chat/completions', headers, body
+
+    def parse_response(self, data):
+        usage = data.get('usage') or {}
+        return {
+            'text': data['choices'][0]['message']['content'],
+            'input_tokens': usage.get('prompt_tokens', 0),
+            'output_tokens': usage.get('completion_tokens', 0),
+        }
+
+
+class CohereProvider(BaseProvider):
+    """Cohere v2 chat"""
+
+    name = 'cohere'
+    base_url = 'https://api.cohere.com/v2'
+    default_model = 'command-a-03-2025'
+
+    def build_request(self, messages, model, max_tokens, temperature):
+        body = {'model': model, 'messages': messages}
+        if max_tokens:
+            body['max_tokens'] = max_tokens
+        if temperature is not None:
+            body['temperature'] = temperature
+        headers = {'Authorization': f'Bearer {self.api_key}', 'Content-Type': 'application/json'}
+        return f'{self.base_url}/chat', headers, body
+
+    def parse_response(self, data):
+        tokens = (data.get('usage') or {}).get('tokens') or {}
+        return {
+            'text': data['message']['content'][0]['text'],
+            'input_tokens': int(tokens.get('input_tokens', 0)),
+            'output_tokens': int(tokens.get('output_tokens', 0)),
+        }
+
+
+class MockProvider(BaseProvider):
+    """
+    سرویس‌دهنده محلی بدون شبکه برای تست و توسعه؛ متن آخرین پیام کاربر را برمی‌گرداند.
+    latency ثانیه تأخیر شبیه‌سازی می‌کند و responder (اختیاری) پاسخ را از روی messages می‌سازد.
+    """
+
+    name = 'mock'
+    default_model = 'mock-1'
+
+    def __init__(self, latency=0.0, responder=None, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.responder = responder
+
+    async def chat(self, messages, model=None, max_tokens=None, temperature=None):
+        model = model or self.default_model
+        async with self.semaphore():
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if self.responder is not None:
+                text = self.responder(messages)
+            else:
+                user_messages = [m['content'] for m in messages if m['role'] == 'user']
+                text = f'[{model}] {user_messages[-1] if user_messages else ""}'
+        return {
+            'text': text,
+            'provider': self.name,
+            'model': model,
+            'input_tokens': sum(math.ceil(len(m['content']) / 3) for m in messages),
+            'output_tokens': math.ceil(len(text) / 3),
+        }
+
+
+class LLMGateway:
+    """
+    نقطه واحد دسترسی به همه سرویس‌دهنده‌ها بر اساس تنظیمات LLM_PROVIDERS:
+        await gateway.chat('cohere', system_message, user_prompt)
+        gateway.chat_sync(...)  برای کدهای sync (اسکریپت‌ها، ورکرها) از طریق run_sync
+    """
+
+    def __init__(self, config=None):
+        self.config = config if config is not None else getattr(settings, 'LLM_PROVIDERS', {})
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def get_provider(self, name) -> BaseProvider:
+        provider = self._providers.get(name)
+        if provider is None:
+            with self._lock:
+                provider = self._providers.get(name)
+                if provider is None:
+                    if name not in self.config:
+                        raise LLMError(name, 'provider is not configured')
+                    options = dict(self.config[name])
+                    provider_class = import_string(options.pop('class'))
+                    provider = self._providers[name] = provider_class(name=name, **options)
+        return provider
+
+    def register(self, name, provider: BaseProvider):
+        """جایگزین کردن یک سرویس‌دهنده (مثلا با MockProvider در تست)"""
+        with self._lock:
+            self._providers[name] = provider
+
+    async def chat(self, provider, system_message, user_prompt, **kwargs):
+        messages = [{'role': 'user', 'content': user_prompt}]
+        if system_message:
+            messages.insert(0, {'role': 'system', 'content': system_message})
+        return await self.chat_messages(provider, messages, **kwargs)
+
+    async def chat_messages(self, provider, messages, model=None, feature=None, **kwargs):
+        """
+        درخواست‌های همزمان یکسان (همان provider، model، messages و پارامترها) با
+        SingleFlight (AIchat/singleflight.py) فقط یک بار به سرویس‌دهنده می‌روند.
+        مصرف هر فراخوانی با feature در UsageRecorder (AIchat/usage.py) ثبت می‌شود؛
+        منتظرهای ادغام شده با cache=coalesced و بدون توکن.
+        """
+        from AIchat.usage import get_usage_recorder
+        provider_client = self.get_provider(provider)
+        model = model or provider_client.default_model
+        led = False
+
+        def call():
+            nonlocal led
+            led = True
+            return provider_client.chat(messages, model=model, **kwargs)
+
+        started = time.monotonic()
+        try:
+            if getattr(settings, 'LLM_SINGLE_FLIGHT', True):
+                from AIchat.singleflight import get_single_flight, make_flight_key
+                key = make_flight_key(provider, model, messages, kwargs)
+                result = await get_single_flight().do(key, call)
+            else:
+                result = await call()
+        except (Exception, asyncio.CancelledError) as e:
+            get_usage_recorder().record(provider, model, feature, latency=time.monotonic() - started,
+                                        cache='miss' if led else 'coalesced', error=e)
+            raise
+        latency = time.monotonic() - started
+        if led:
+            # پاسخ غیر استریم: اولین توکن همراه کل پاسخ می‌رسد
+            get_usage_recorder().record(provider, model, feature, result.get('input_tokens') or 0,
+                                        result.get('output_tokens') or 0, latency, ttft=latency)
+        else:
+            get_usage_recorder().record(provider, model, feature, latency=latency, ttft=latency, cache='coalesced')
+        return result
+
+    def chat_sync(self, provider, system_message, user_prompt, **kwargs):
+        return run_sync(self.chat(provider, system_message, user_prompt, **kwargs))
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def run_sync(coroutine, timeout=None):
+    """
+    اجرای coroutine از کد sync روی یک event loop ثابت در thread پس‌زمینه.
+    برخلاف async_to_sync که برای هر فراخوانی loop تازه می‌سازد، اینجا AsyncClient و
+    اتصال‌های keep-alive بین فراخوانی‌ها حفظ می‌شوند. نباید از داخل همین loop صدا زده شود.
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='llm-gateway-loop', daemon=True).start()
+                _loop = loop
+    future = asyncio.run_coroutine_threadsafe(coroutine, _loop)
+    try:
+        return future.result(timeout)
+    except FutureTimeoutError:
+        # coroutine بعد از timeout روی loop ادامه پیدا نمی‌کند
+        future.cancel()
+        raise
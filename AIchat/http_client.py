@@ -0,0 +1,32 @@
+import asyncio
+
+import httpx
+from django.conf import settings
+
+_clients = {}
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    یک AsyncClient مشترک برای هر event loop پروسس (daphne یک loop دارد)
+    با connection pool و keep-alive؛ به جای ساختن کلاینت و اتصال TLS جدید برای هر پیام.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                getattr(settings, 'LLM_HTTP_TIMEOUT', 60),
+                connect=getattr(settings, 'LLM_HTTP_CONNECT_TIMEOUT', 10),
+            ),
+            limits=httpx.Limits(
+                max_connections=getattr(settings, 'LLM_HTTP_MAX_CONNECTIONS', 100),
+                max_keepalive_connections=getattr(settings, 'LLM_HTTP_MAX_KEEPALIVE', 20),
+                keepalive_expiry=getattr(settings, 'LLM_HTTP_KEEPALIVE_EXPIRY', 30),
+            ),
+        )
+        # کلاینت loop های بسته شده (مثلا async_to_sync) نگه داشته نمی‌شوند
+        for old_loop in [old_loop for old_loop in _clients if old_loop.is_closed()]:
+            del _clients[old_loop]
+        _clients[loop] = client
+    return client
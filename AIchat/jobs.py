@@ -0,0 +1,202 @@
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import timedelta
+
+import httpx
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from AI.features import FEATURES, AIFeatures, bind_feature_args, client_provider
+from AIchat.gateway import LLMError, run_sync
+from AIchat.models import AIJob
+from AIchat.usage import get_usage_recorder
+
+logger = logging.getLogger(__name__)
+
+
+class JobError(ValueError):
+    """درخواست کار نامعتبر (feature یا آرگومان‌ها)"""
+
+
+def make_dedup_key(feature, provider, args):
+    data = json.dumps([feature, provider, args], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def submit_job(user, feature, args=None, provider=None, lane='default'):
+    """
+    ثبت کار در صف و برگشت فوری؛ اگر کار یکسانی در صف یا در حال اجرا باشد همان برگردانده می‌شود.
+    خروجی: (job, created)
+    """
+    args = args or {}
+    if not isinstance(feature, str) or feature not in FEATURES:
+        raise JobError('invalid feature')
+    if not isinstance(lane, str) or lane not in AIJob.LANE_PRIORITIES:
+        raise JobError('invalid lane')
+    if not isinstance(args, dict):
+        raise JobError('invalid arguments')
+    provider = client_provider(provider)
+    try:
+        bind_feature_args(feature, args)
+    except TypeError:
+        raise JobError('invalid arguments')
+
+    dedup_key = make_dedup_key(feature, provider, args)
+    existing = AIJob.objects.filter(dedup_key=dedup_key, status__in=AIJob.IN_FLIGHT).first()
+    if existing is not None:
+        return existing, False
+    try:
+        with transaction.atomic():
+            job = AIJob.objects.create(
+                user=user, feature=feature, provider=provider, args=args, lane=lane,
+                priority=AIJob.LANE_PRIORITIES[lane], dedup_key=dedup_key,
+            )
+        return job, True
+    except IntegrityError:
+        # درخواست همزمان دیگری همین کار را ثبت کرد
+        existing = AIJob.objects.filter(dedup_key=dedup_key, status__in=AIJob.IN_FLIGHT).first()
+        if existing is None:
+            raise
+        return existing, False
+
+
+def claim_jobs(worker, limit, bulk_limit=None):
+    """
+    برداشتن حداکثر limit کار به ترتیب priority و زمان ثبت. هر کار با یک UPDATE شرطی
+    (status=queued) گرفته می‌شود تا چند ورکر بدون قفل ردیف (که SQLite ندارد) یک کار را برندارند.
+    از lane bulk حداکثر bulk_limit کار برداشته می‌شود تا ظرفیت برای laneهای بالاتر بماند.
+    """
+    queryset = AIJob.objects.filter(status=AIJob.STATUS_QUEUED)
+    if bulk_limit is not None and bulk_limit <= 0:
+        queryset = queryset.exclude(lane='bulk')
+    claimed = []
+    bulk_claimed = 0
+    for job_id, lane in queryset.order_by('priority', 'id').values_list('id', 'lane')[:limit * 2]:
+        if lane == 'bulk' and bulk_limit is not None and bulk_claimed >= bulk_limit:
+            break
+        now = timezone.now()
+        updated = AIJob.objects.filter(id=job_id, status=AIJob.STATUS_QUEUED).update(
+            status=AIJob.STATUS_RUNNING, worker=worker, started_at=now, heartbeat_at=now,
+        )
+        if updated:
+            claimed.append((job_id, lane))
+            bulk_claimed += lane == 'bulk'
+            if len(claimed) >= limit:
+                break
+    return claimed
+
+
+def execute_job(job_id):
+    """
+    اجرای یک کار (داخل پروسس‌های pool ورکر). خطای موقت سرویس مدل تا AI_JOB_MAX_ATTEMPTS
+    بار کار را به صف برمی‌گرداند. کاری که از AI_JOB_TIMEOUT بیشتر طول بکشد لغو و شکست خورده ثبت می‌شود.
+    در تمام مدت اجرا heartbeat_at جلو می‌رود تا requeue_stale_jobs کار زنده را دوباره به صف نفرستد.
+    """
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job_id, stop), name=f'ai-job-heartbeat-{job_id}',
+                                 daemon=True)
+    heartbeat.start()
+    try:
+        _execute_job(job_id)
+    finally:
+        stop.set()
+        heartbeat.join()
+        # پروسس‌های pool با atexit خارج نمی‌شوند؛ مصرف هر کار همان موقع نوشته می‌شود
+        get_usage_recorder().flush()
+
+
+def _heartbeat(job_id, stop):
+    interval = getattr(settings, 'AI_JOB_HEARTBEAT_INTERVAL', 30)
+    try:
+        while not stop.wait(interval):
+            try:
+                AIJob.objects.filter(id=job_id, status=AIJob.STATUS_RUNNING).update(heartbeat_at=timezone.now())
+            except Exception:
+                logger.exception('AI job %s heartbeat failed', job_id)
+    finally:
+        connection.close()
+
+
+def _execute_job(job_id):
+    job = AIJob.objects.get(id=job_id)
+    attempts = job.attempts + 1
+    try:
+        result = run_sync(getattr(AIFeatures(provider=job.provider), job.feature)(**job.args),
+                          timeout=getattr(settings, 'AI_JOB_TIMEOUT', 600))
+    except FutureTimeoutError:
+        finish_job(job_id, AIJob.STATUS_FAILED, error='timed out', attempts=attempts)
+        return
+    except (LLMError, httpx.HTTPError) as e:
+        if attempts < getattr(settings, 'AI_JOB_MAX_ATTEMPTS', 2):
+            AIJob.objects.filter(id=job_id).update(status=AIJob.STATUS_QUEUED, attempts=attempts, error=str(e)[:1000])
+        else:
+            finish_job(job_id, AIJob.STATUS_FAILED, error=str(e), attempts=attempts)
+        return
+    except Exception as e:
+        finish_job(job_id, AIJob.STATUS_FAILED, error=repr(e), attempts=attempts)
+        return
+    finish_job(job_id, AIJob.STATUS_DONE, result=result, attempts=attempts)
+
+
+def finish_job(job_id, status, result=None, error='', attempts=None):
+    fields = {'status': status, 'result': result, 'error': error[:1000], 'finished_at': timezone.now()}
+    if attempts is not None:
+        fields['attempts'] = attempts
+    AIJob.objects.filter(id=job_id).update(**fields)
+
+
+def requeue_stale_jobs():
+    """
+    کارهای در حال اجرایی که heartbeat آن‌ها بیشتر از AI_JOB_HEARTBEAT_TIMEOUT ثانیه جلو نرفته
+    (پروسس ورکر از کار افتاده) به صف برمی‌گردند یا بعد از AI_JOB_MAX_ATTEMPTS تلاش شکست خورده ثبت می‌شوند.
+    کار زنده و طولانی heartbeat دارد و دوباره اجرا نمی‌شود؛ سقف زمان اجرای آن را خود execute_job اعمال می‌کند.
+    """
+    now = timezone.now()
+    silent_since = now - timedelta(seconds=getattr(settings, 'AI_JOB_HEARTBEAT_TIMEOUT', 120))
+    max_attempts = getattr(settings, 'AI_JOB_MAX_ATTEMPTS', 2)
+    stale = AIJob.objects.filter(
+        Q(heartbeat_at__lt=silent_since) | Q(heartbeat_at__isnull=True, started_at__lt=silent_since),
+        status=AIJob.STATUS_RUNNING,
+    )
+    failed = stale.filter(attempts__gte=max_attempts - 1).update(
+        status=AIJob.STATUS_FAILED, error='timed out', finished_at=timezone.now()
+    )
+    # stale دوباره ارزیابی می‌شود و کارهای failed شده بالا را شامل نمی‌شود
+    requeued = stale.update(status=AIJob.STATUS_QUEUED, worker='', attempts=F('attempts') + 1)
+    return requeued, failed
+
+
+def requeue_jobs(worker, job_ids):
+    """
+    برگرداندن کارهای در حال اجرای این ورکر به صف وقتی پروسس اجرای آن‌ها از بین رفته (مثلا pool شکسته).
+    مثل requeue_stale_jobs کاری که به سقف AI_JOB_MAX_ATTEMPTS رسیده شکست خورده ثبت می‌شود
+    تا کاری که خودش پروسس را از کار می‌اندازد بی‌پایان تکرار نشود.
+    """
+    max_attempts = getattr(settings, 'AI_JOB_MAX_ATTEMPTS', 2)
+    jobs = AIJob.objects.filter(id__in=list(job_ids), status=AIJob.STATUS_RUNNING, worker=worker)
+    failed = jobs.filter(attempts__gte=max_attempts - 1).update(
+        status=AIJob.STATUS_FAILED, error='worker process died', finished_at=timezone.now()
+    )
+    requeued = jobs.update(status=AIJob.STATUS_QUEUED, worker='', attempts=F('attempts') + 1)
+    return requeued, failed
+
+
+def job_payload(job):
+    data = {
+        'job_id': str(job.job_id),
+        'feature': job.feature,
+        'lane': job.lane,
+        'status': job.status,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == AIJob.STATUS_DONE:
+        data['result'] = job.result
+    elif job.status == AIJob.STATUS_FAILED:
+        data['error'] = 'generation failed'
+    return data
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from AI.features import AIFeatures
+from AI.scraping import parse_results
+from AIchat.gateway import MockProvider, get_gateway, run_sync
+
+
+def fixture_page(results):
+    items = ''.join(
+        f'<div class="result"><a class="result__a" href="#">عنوان نتیجه {i}</a>'
+        f'<a class="result__snippet">{"متن خلاصه نتیجه جستجو " * 20}{i}</a></div>'
+        for i in range(results)
+    )
+    return f'<html><body>{items}</body></html>'.encode()
+
+
+class Command(BaseCommand):
+    help = 'اندازه‌گیری زمان research_in_internet روی یک سرور HTML محلی (ترتیبی قدیمی، ترتیبی، همزمان، با بودجه)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delay', type=float, default=0.3, help='تأخیر سرور برای هر صفحه (ثانیه)')
+        parser.add_argument('--results', type=int, default=30, help='تعداد نتیجه در هر صفحه')
+        parser.add_argument('--rounds', type=int, default=3)
+
+    def handle(self, *args, **options):
+        page = fixture_page(options['results'])
+        delay = options['delay']
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                time.sleep(delay)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(page)))
+                self.end_headers()
+                try:
+                    self.wfile.write(page)
+                except (BrokenPipeError, ConnectionResetError):
+                    # درخواست‌های لغو شده بعد از پایان بودجه
+                    pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}/html/'
+        # مدل با Mock جایگزین می‌شود تا فقط مرحله جستجو و parse اندازه‌گیری شود
+        get_gateway().register('bench', MockProvider(name='bench', responder=lambda messages: '1' + messages[-1]['content']))
+        features = AIFeatures(provider='bench')
+
+        def legacy():
+            summaries = []
+            for page_number in range(5):
+                response = requests.get(url, params={'q': 'تحقیق', 's': page_number * 70})
+                summaries.extend(parse_results(response.text))
+            return [True, ' '.join(summaries)]
+
+        def current():
+            return run_sync(features.research_in_internet('تحقیق'))
+
+        cache_path = os.path.join(tempfile.mkdtemp(), 'research_cache.sqlite3')
+        rows = [
+            ('legacy (requests, sequential)', legacy, {}),
+            ('async, concurrency=1', current, {'SCRAPE_CONCURRENCY': 1}),
+            ('async, concurrency=5', current, {'SCRAPE_CONCURRENCY': 5}),
+            (f'async, budget={delay * 1.5:.2f}s', current, {'SCRAPE_CONCURRENCY': 2, 'SCRAPE_LATENCY_BUDGET': delay * 1.5}),
+            ('research cache hit', current, {'RESEARCH_CACHE_ENABLED': True, 'RESEARCH_CACHE_PATH': cache_path}),
+        ]
+        try:
+            with override_settings(SCRAPE_SEARCH_URL=url, RESEARCH_CACHE_ENABLED=False):
+                current()  # گرم کردن parse pool و اتصال‌ها
+                self.stdout.write(f'{"mode":<32}{"ms":>9}{"chars":>9}')
+                for name, func, overrides in rows:
+                    with override_settings(**overrides):
+                        timings = []
+                        for _ in range(options['rounds']):
+                            start = time.perf_counter()
+                            result = func()
+                            timings.append(time.perf_counter() - start)
+                    self.stdout.write(f'{name:<32}{min(timings) * 1000:>9.0f}{len(result[1]):>9}')
+        finally:
+            server.shutdown()
+            shutil.rmtree(os.path.dirname(cache_path), ignore_errors=True)
@@ -0,0 +1,104 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from AIchat.jobs import claim_jobs, execute_job, finish_job, requeue_jobs, requeue_stale_jobs
+from AIchat.models import AIJob
+
+
+class Command(BaseCommand):
+    help = 'اجرای کارهای صف AI (AIJob) در یک pool پروسس؛ laneهای بالاتر زودتر و bulk با ظرفیت محدود'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='تعداد پروسس اجرا (AI_JOB_WORKERS)')
+        parser.add_argument('--bulk-slots', type=int, default=None,
+                            help='حداکثر کار همزمان lane bulk (AI_JOB_BULK_SLOTS)')
+        parser.add_argument('--poll', type=float, default=1.0, help='فاصله بررسی صف وقتی کاری نیست (ثانیه)')
+        parser.add_argument('--once', action='store_true', help='بعد از خالی شدن صف خارج شود')
+
+    def handle(self, *args, **options):
+        workers = options['workers'] or getattr(settings, 'AI_JOB_WORKERS', 4)
+        bulk_slots = options['bulk_slots'] or getattr(settings, 'AI_JOB_BULK_SLOTS', max(1, workers - 1))
+        name = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        pool = self.create_pool(workers)
+        running = {}
+        next_stale_check = 0
+        self.stdout.write(f'AI worker {name} started with {workers} processes')
+        try:
+            while True:
+                if time.monotonic() >= next_stale_check:
+                    requeue_stale_jobs()
+                    next_stale_check = time.monotonic() + 60
+
+                free = workers - len(running)
+                if free and not self.stopping:
+                    bulk_running = sum(1 for _, lane in running.values() if lane == 'bulk')
+                    claimed = claim_jobs(name, free, bulk_limit=bulk_slots - bulk_running)
+                    try:
+                        for job_id, lane in claimed:
+                            running[pool.submit(execute_job, job_id)] = (job_id, lane)
+                    except BrokenProcessPool:
+                        job_ids = {job_id for job_id, _ in claimed} | {job_id for job_id, _ in running.values()}
+                        pool = self.replace_pool(pool, workers, name, job_ids)
+                        running = {}
+                close_old_connections()
+
+                if not running:
+                    if self.stopping or (options['once'] and not AIJob.objects.filter(
+                            status=AIJob.STATUS_QUEUED).exists()):
+                        break
+                    time.sleep(options['poll'])
+                    continue
+
+                done, _ = wait(list(running), timeout=options['poll'], return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    error = future.exception()
+                    if isinstance(error, BrokenProcessPool):
+                        # همه کارهای باقی مانده pool همین خطا را دارند و پایین به صف برمی‌گردند
+                        broken = True
+                        continue
+                    job_id, _ = running.pop(future)
+                    if error is not None:
+                        # خطا بیرون از execute_job (مثلا آرگومان غیر قابل pickle)
+                        self.stderr.write(f'job {job_id} failed: {error!r}')
+                        finish_job(job_id, AIJob.STATUS_FAILED, error=repr(error))
+                if broken:
+                    pool = self.replace_pool(pool, workers, name, {job_id for job_id, _ in running.values()})
+                    running = {}
+        finally:
+            pool.shutdown(wait=True)
+
+    @staticmethod
+    def create_pool(workers):
+        # spawn چون این پروسس ترد دارد؛ هر پروسس pool جنگو را یک بار setup می‌کند
+        return ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup
+        )
+
+    def replace_pool(self, pool, workers, name, job_ids):
+        """
+        یکی از پروسس‌های pool ناگهان مرده (OOM، segfault) و pool دیگر کاری نمی‌پذیرد:
+        کارهای گرفته شده به صف برمی‌گردند و pool تازه ساخته می‌شود تا ورکر به کار ادامه دهد
+        """
+        requeued, failed = requeue_jobs(name, job_ids)
+        self.stderr.write(f'process pool broken; {requeued} jobs requeued, {failed} failed, restarting pool')
+        pool.shutdown(wait=False, cancel_futures=True)
+        return self.create_pool(workers)
+
+    def stop(self, signum, frame):
+        """کارهای در حال اجرا تمام می‌شوند ولی کار جدید برداشته نمی‌شود"""
+        self.stopping = True
@@ -0,0 +1,159 @@
+import math
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+from AIchat.models import LegalChatSession, LegalChatTurn
+
+
+def estimate_tokens(text):
+    """
+    تخمین ارزان تعداد توکن بدون توکنایزر مدل؛ برای متن فارسی حدود ۳ کاراکتر در هر توکن
+    (کمی بیشتر از واقعی تا بودجه رد نشود)
+    """
+    return max(1, math.ceil(len(text or '') / 3))
+
+
+class ConversationMemory:
+    """
+    حافظه گفتگوی یک نشست با بودجه توکن:
+    - نوبت‌ها در LegalChatTurn ذخیره می‌شوند تا اتصال مجدد از صفر شروع نشود
+    - به مدل فقط خلاصه (summary) و پنجره‌ای از آخرین نوبت‌ها که در context_tokens جا شوند ارسال می‌شود
+    - وقتی نوبت‌های خلاصه نشده از بودجه بیشتر شوند، قدیمی‌ترها در خلاصه ادغام و از حافظه بیرون می‌روند
+    متدها sync هستند؛ در consumer با database_sync_to_async صدا زده می‌شوند.
+    """
+
+    def __init__(self, session: LegalChatSession, context_tokens=None, summary_tokens=None, min_window_turns=None):
+        self.session = session
+        self.context_tokens = context_tokens or getattr(settings, 'LEGAL_CHAT_CONTEXT_TOKENS', 6000)
+        self.summary_tokens = summary_tokens or getattr(settings, 'LEGAL_CHAT_SUMMARY_TOKENS', 500)
+        self.min_window_turns = min_window_turns or getattr(settings, 'LEGAL_CHAT_MIN_WINDOW_TURNS', 4)
+        # فقط نوبت‌های خلاصه نشده در حافظه هستند، پس اندازه آن با بودجه محدود است
+        self.turns = [] if session.pk is None else list(
+            session.turns.filter(id__gt=session.summarized_until_id).order_by('id')
+            .values('id', 'role', 'content', 'tokens')
+        )
+
+    @classmethod
+    def open(cls, session_key=None, user=None):
+        """
+        ادامه نشست session_key همین کاربر یا یک نشست جدید که ردیف آن با اولین نوبت ساخته می‌شود
+        (اتصال بدون پیام ردیفی نمی‌سازد). نشست بدون کاربر با داشتن session_key ادامه داده نمی‌شود.
+        """
+        session = None
+        if session_key and user is not None:
+            try:
+                session = LegalChatSession.objects.filter(
+                    session_key=uuid.UUID(str(session_key)), user=user
+                ).first()
+            except ValueError:
+                session = None
+        if session is None:
+            session = LegalChatSession(session_key=uuid.uuid4(), user=user)
+        return cls(session)
+
+    @property
+    def session_key(self):
+        return str(self.session.session_key)
+
+    def history(self):
+        """نوبت‌های خلاصه نشده برای نمایش به کاربر بعد از اتصال مجدد"""
+        return [{'role': turn['role'], 'content': turn['content']} for turn in self.turns]
+
+    def add_turn(self, role, content):
+        if self.session.pk is None:
+            self.session.save()
+        turn = LegalChatTurn.objects.create(
+            session=self.session, role=role, content=content, tokens=estimate_tokens(content)
+        )
+        self.turns.append({'id': turn.id, 'role': role, 'content': content, 'tokens': turn.tokens})
+        return turn
+
+    def discard_last_user_turn(self):
+        """حذف پیام کاربری که پاسخ نگرفت (لغو یا خطا)"""
+        if self.turns and self.turns[-1]['role'] == 'user':
+            LegalChatTurn.objects.filter(id=self.turns.pop()['id']).delete()
+
+    def system_prompt(self, base_prompt):
+        if not self.session.summary:
+            return base_prompt
+        return f'{base_prompt}\n\nخلاصه گفتگوی قبلی با کاربر:\n{self.session.summary}'
+
+    def build_messages(self):
+        """
+        آخرین نوبت‌ها از جدید به قدیم تا جایی که در بودجه (منهای خلاصه) جا شوند.
+        پیام اول همیشه از طرف کاربر است (شرط Messages API).
+        """
+        budget = self.context_tokens - self.session.summary_tokens
+        window = []
+        for turn in reversed(self.turns):
+            if window and budget - turn['tokens'] < 0:
+                break
+            budget -= turn['tokens']
+            window.append(turn)
+        window.reverse()
+        while window and window[0]['role'] != 'user':
+            window.pop(0)
+        return [{'role': turn['role'], 'content': turn['content']} for turn in window]
+
+    def needs_compaction(self):
+        unsummarized = sum(turn['tokens'] for turn in self.turns)
+        return (unsummarized + self.session.summary_tokens > self.context_tokens
+                and len(self.turns) > self.min_window_turns)
+
+    def turns_to_fold(self):
+        """
+        قدیمی‌ترین نوبت‌ها تا جایی که باقی‌مانده نصف بودجه شود (نه کمتر از min_window_turns نوبت)
+        تا خلاصه‌سازی در هر پیام تکرار نشود. تعداد نوبت‌ها زوج است تا جفت سوال و جواب جدا نشوند.
+        """
+        target = self.context_tokens // 2
+        remaining = sum(turn['tokens'] for turn in self.turns)
+        count = 0
+        while len(self.turns) - count > self.min_window_turns and remaining > target:
+            remaining -= self.turns[count]['tokens']
+            count += 1
+        if count % 2:
+            count += 1 if len(self.turns) - count > self.min_window_turns else -1
+        return self.turns[:count]
+
+    def apply_summary(self, summary, folded):
+        """ذخیره خلاصه جدید و بیرون بردن نوبت‌های ادغام شده از پنجره"""
+        if not folded:
+            return
+        summary = self.truncate(summary, self.summary_tokens)
+        with transaction.atomic():
+            self.session.summary = summary
+            self.session.summary_tokens = estimate_tokens(summary)
+            self.session.summarized_until_id = folded[-1]['id']
+            self.session.save(update_fields=['summary', 'summary_tokens', 'summarized_until_id', 'updated_at'])
+        folded_ids = {turn['id'] for turn in folded}
+        self.turns = [turn for turn in self.turns if turn['id'] not in folded_ids]
+
+    def fallback_summary(self, folded):
+        """خلاصه بدون مدل وقتی فراخوانی خلاصه‌ساز شکست بخورد: ابتدای هر نوبت"""
+        lines = [self.session.summary] if self.session.summary else []
+        for turn in folded:
+            prefix = 'کاربر' if turn['role'] == 'user' else 'مشاور'
+            lines.append(f'{prefix}: {turn["content"][:200]}')
+        # جدیدترین‌ها مهم‌ترند، پس از ابتدا بریده می‌شود
+        return self.truncate('\n'.join(lines), self.summary_tokens, keep_end=True)
+
+    @staticmethod
+    def truncate(text, tokens, keep_end=False):
+        limit = tokens * 3
+        if len(text) <= limit:
+            return text
+        return text[-limit:] if keep_end else text[:limit]
+
+    @staticmethod
+    def summary_request(previous_summary, folded):
+        """متن درخواست خلاصه‌سازی برای مدل"""
+        transcript = '\n'.join(
+            f'{"کاربر" if turn["role"] == "user" else "مشاور"}: {turn["content"]}' for turn in folded
+        )
+        return (
+            'خلاصه قبلی:\n' + (previous_summary or '-') +
+            '\n\nادامه گفتگو:\n' + transcript +
+            '\n\nیک خلاصه کوتاه و به‌روز فارسی از نکات حقوقی، واقعیت‌های پرونده و سوالات کاربر بنویس.'
+        )
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('user', '0007_customuser_can_message_me'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LegalChatSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_key', models.UUIDField(unique=True)),
+                ('summary', models.TextField(blank=True, default='')),
+                ('summary_tokens', models.PositiveIntegerField(default=0)),
+                ('summarized_until_id', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='legal_chat_sessions', to='user.customuser')),
+            ],
+            options={
+                'verbose_name': 'Legal Chat Session',
+                'verbose_name_plural': 'Legal Chat Sessions',
+            },
+        ),
+        migrations.CreateModel(
+            name='LegalChatTurn',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('user', 'User'), ('assistant', 'Assistant')], max_length=10)),
+                ('content', models.TextField()),
+                ('tokens', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='turns', to='AIchat.legalchatsession')),
+            ],
+            options={
+                'verbose_name': 'Legal Chat Turn',
+                'verbose_name_plural': 'Legal Chat Turns',
+                'indexes': [models.Index(fields=['session', 'id'], name='AIchat_lega_session_b0149d_idx')],
+            },
+        ),
+    ]
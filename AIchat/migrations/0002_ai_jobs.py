@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:03
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AIchat', '0001_legal_chat_memory'),
+        ('user', '0007_customuser_can_message_me'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('feature', models.CharField(max_length=50)),
+                ('provider', models.CharField(max_length=50)),
+                ('args', models.JSONField(default=dict)),
+                ('lane', models.CharField(choices=[('interactive', 'Interactive'), ('default', 'Default'), ('bulk', 'Bulk')], default='default', max_length=12)),
+                ('priority', models.PositiveSmallIntegerField(default=1)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('dedup_key', models.CharField(max_length=64)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('worker', models.CharField(blank=True, default='', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ai_jobs', to='user.customuser')),
+            ],
+            options={
+                'verbose_name': 'AI Job',
+                'verbose_name_plural': 'AI Jobs',
+                'indexes': [models.Index(fields=['status', 'priority', 'id'], name='AIchat_aijo_status_2ae31f_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('dedup_key',), name='aijob_unique_in_flight')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AIchat', '0002_ai_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIUsageBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('provider', models.CharField(max_length=50)),
+                ('model', models.CharField(max_length=100)),
+                ('feature', models.CharField(max_length=50)),
+                ('cache', models.CharField(choices=[('miss', 'Miss'), ('hit', 'Hit'), ('coalesced', 'Coalesced')], default='miss', max_length=10)),
+                ('error', models.CharField(blank=True, default='', max_length=50)),
+                ('calls', models.PositiveIntegerField(default=0)),
+                ('input_tokens', models.PositiveBigIntegerField(default=0)),
+                ('output_tokens', models.PositiveBigIntegerField(default=0)),
+                ('latency_ms_total', models.PositiveBigIntegerField(default=0)),
+                ('latency_ms_max', models.PositiveIntegerField(default=0)),
+                ('ttft_ms_total', models.PositiveBigIntegerField(default=0)),
+                ('cost_usd', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name': 'AI Usage Bucket',
+                'verbose_name_plural': 'AI Usage Buckets',
+                'indexes': [models.Index(fields=['feature', 'bucket'], name='AIchat_aius_feature_861676_idx')],
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'provider', 'model', 'feature', 'cache', 'error'), name='aiusage_unique_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AIchat', '0003_ai_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aijob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from user.models import CustomUser
 #
@@ -14,3 +16,146 @@ from user.models import CustomUser
 #     content = models.TextField()
 #     timestamp = models.DateTimeField(auto_now_add=True)
 #     read_by = models.ManyToManyField(CustomUser, related_name='read_messages', blank=True)
+
+
+class LegalChatSession(models.Model):
+    """
+    نشست مشاور حقوقی؛ با session_key بعد از اتصال مجدد ادامه پیدا می‌کند.
+    نوبت‌های قدیمی‌تر از summarized_until_id در summary خلاصه شده‌اند و دیگر به مدل ارسال نمی‌شوند.
+    """
+    session_key = models.UUIDField(unique=True)
+    user = models.ForeignKey(CustomUser, null=True, blank=True, on_delete=models.CASCADE,
+                             related_name='legal_chat_sessions')
+    summary = models.TextField(blank=True, default='')
+    summary_tokens = models.PositiveIntegerField(default=0)
+    summarized_until_id = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.session_key} - {self.user_id}'
+
+    class Meta:
+        verbose_name = 'Legal Chat Session'
+        verbose_name_plural = 'Legal Chat Sessions'
+
+
+class LegalChatTurn(models.Model):
+    ROLE_CHOICES = (
+        ('user', 'User'),
+        ('assistant', 'Assistant'),
+    )
+
+    session = models.ForeignKey(LegalChatSession, on_delete=models.CASCADE, related_name='turns')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    content = models.TextField()
+    tokens = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.session_id} - {self.role}'
+
+    class Meta:
+        verbose_name = 'Legal Chat Turn'
+        verbose_name_plural = 'Legal Chat Turns'
+        indexes = [
+            models.Index(fields=['session', 'id']),
+        ]
+
+
+class AIJob(models.Model):
+    """
+    کار پس‌زمینه یکی از قابلیت‌های AI (AI/features.py) که ورکر run_ai_worker اجرا می‌کند.
+    کارهای یکسان (همان feature، provider و args) تا وقتی در صف یا در حال اجرا هستند یک ردیف
+    مشترک دارند (dedup_key با قید یکتای شرطی). priority از lane گرفته می‌شود؛ عدد کمتر زودتر.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+    IN_FLIGHT = (STATUS_QUEUED, STATUS_RUNNING)
+    LANE_CHOICES = (
+        ('interactive', 'Interactive'),
+        ('default', 'Default'),
+        ('bulk', 'Bulk'),
+    )
+    LANE_PRIORITIES = {'interactive': 0, 'default': 1, 'bulk': 2}
+
+    job_id = models.UUIDField(unique=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, null=True, blank=True, on_delete=models.SET_NULL, related_name='ai_jobs')
+    feature = models.CharField(max_length=50)
+    provider = models.CharField(max_length=50)
+    args = models.JSONField(default=dict)
+    lane = models.CharField(max_length=12, choices=LANE_CHOICES, default='default')
+    priority = models.PositiveSmallIntegerField(default=1)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    dedup_key = models.CharField(max_length=64)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # پروسس اجراکننده تا وقتی کار زنده است این زمان را جلو می‌برد (AI_JOB_HEARTBEAT_INTERVAL)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.job_id} - {self.feature} - {self.status}'
+
+    class Meta:
+        verbose_name = 'AI Job'
+        verbose_name_plural = 'AI Jobs'
+        indexes = [
+            models.Index(fields=['status', 'priority', 'id']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['dedup_key'], condition=models.Q(status__in=['queued', 'running']),
+                                    name='aijob_unique_in_flight'),
+        ]
+
+
+class AIUsageBucket(models.Model):
+    """
+    مصرف فراخوانی‌های مدل جمع شده در بازه‌های یک دقیقه‌ای (AIchat/usage.py)؛
+    برای گزارش توکن، هزینه و latency هر feature با کوئری روی همین جدول.
+    """
+    CACHE_CHOICES = (
+        ('miss', 'Miss'),
+        ('hit', 'Hit'),
+        ('coalesced', 'Coalesced'),
+    )
+
+    bucket = models.DateTimeField()
+    provider = models.CharField(max_length=50)
+    model = models.CharField(max_length=100)
+    feature = models.CharField(max_length=50)
+    cache = models.CharField(max_length=10, choices=CACHE_CHOICES, default='miss')
+    error = models.CharField(max_length=50, blank=True, default='')
+    calls = models.PositiveIntegerField(default=0)
+    input_tokens = models.PositiveBigIntegerField(default=0)
+    output_tokens = models.PositiveBigIntegerField(default=0)
+    latency_ms_total = models.PositiveBigIntegerField(default=0)
+    latency_ms_max = models.PositiveIntegerField(default=0)
+    ttft_ms_total = models.PositiveBigIntegerField(default=0)
+    cost_usd = models.FloatField(default=0)
+
+    def __str__(self):
+        return f'{self.bucket} - {self.provider}/{self.model} - {self.feature}'
+
+    class Meta:
+        verbose_name = 'AI Usage Bucket'
+        verbose_name_plural = 'AI Usage Buckets'
+        indexes = [
+            models.Index(fields=['feature', 'bucket']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'provider', 'model', 'feature', 'cache', 'error'],
+                                    name='aiusage_unique_bucket'),
+        ]
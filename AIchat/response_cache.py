@@ -0,0 +1,195 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from AI.research_cache import normalize_query
+
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_input(text):
+    """نرمال‌سازی امن برای تطابق دقیق: فقط NFKC و فاصله‌ها؛ متن و علائم دست نمی‌خورند"""
+    return _SPACES.sub(' ', unicodedata.normalize('NFKC', text or '')).strip()
+
+
+def simhash(text, bits=64):
+    """
+    SimHash روی سه‌تایی کلمات متن نرمال شده (normalize_query) برای تشخیص متن تقریبا یکسان.
+    خروجی: (simhash، تعداد کلمات، امضای اعداد متن)؛ اعداد (مثل سطح خلاصه‌سازی --50--) در
+    SimHash وزن کمی دارند ولی معنی را عوض می‌کنند، پس جدا و دقیق مقایسه می‌شوند.
+    """
+    words = normalize_query(text).split()
+    numbers = hashlib.blake2b(' '.join(sorted(w for w in words if w.isdigit())).encode(), digest_size=8).hexdigest()
+    shingles = [' '.join(words[i:i + 3]) for i in range(max(1, len(words) - 2))]
+    weights = [0] * bits
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'big')
+        for bit in range(bits):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(bits) if weights[bit] > 0), len(words), numbers
+
+
+class ResponseCache:
+    """
+    کش پاسخ مدل با کلید (provider، model، هش system prompt، ورودی نرمال شده، پارامترها).
+    - تطابق دقیق: LRU داخل پروسس و سپس کش مشترک جنگو (LLM_RESPONSE_CACHE_ALIAS) بین پروسس‌ها
+    - تطابق تقریبی (اختیاری، LLM_RESPONSE_CACHE_NEAR_DUPLICATES): SimHash ورودی با ۴ باند ۱۶ بیتی
+      ایندکس می‌شود و ورودی با همان system prompt، پارامترها و اعداد و فاصله همینگ حداکثر
+      LLM_RESPONSE_CACHE_NEAR_BITS پاسخ همان را می‌گیرد
+    - حذف: TTL و سپس کم‌استفاده‌ترین ورودی وقتی تعداد از LLM_RESPONSE_CACHE_MAX_ENTRIES بیشتر شود
+    شمارنده‌های hit / miss از stats() خوانده می‌شوند.
+    """
+
+    bands = 4
+    band_bits = 16
+
+    def __init__(self, max_entries=None, ttl=None, near_duplicates=None, near_bits=None, min_words=None, alias=None):
+        self.max_entries = max_entries or getattr(settings, 'LLM_RESPONSE_CACHE_MAX_ENTRIES', 2000)
+        self.ttl = ttl or getattr(settings, 'LLM_RESPONSE_CACHE_TTL', 24 * 3600)
+        self.near_duplicates = near_duplicates if near_duplicates is not None else getattr(
+            settings, 'LLM_RESPONSE_CACHE_NEAR_DUPLICATES', False
+        )
+        self.near_bits = near_bits if near_bits is not None else getattr(settings, 'LLM_RESPONSE_CACHE_NEAR_BITS', 3)
+        self.min_words = min_words or getattr(settings, 'LLM_RESPONSE_CACHE_MIN_WORDS', 30)
+        alias = alias if alias is not None else getattr(settings, 'LLM_RESPONSE_CACHE_ALIAS', 'default')
+        self.shared = caches[alias] if alias else None
+        # key -> (value, expires_at, namespace, fingerprint)
+        self._entries = OrderedDict()
+        self._index = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'near_hits': 0, 'shared_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @staticmethod
+    def namespace(provider, model, system_message, params):
+        system_hash = hashlib.sha256((system_message or '').encode()).hexdigest()
+        params = json.dumps(params or {}, sort_keys=True, default=str)
+        return hashlib.sha256(f'{provider}|{model}|{system_hash}|{params}'.encode()).hexdigest()[:32]
+
+    @staticmethod
+    def make_key(namespace, user_prompt):
+        return 'llm:response:' + hashlib.sha256(f'{namespace}|{normalize_input(user_prompt)}'.encode()).hexdigest()
+
+    def get(self, provider, model, system_message, user_prompt, params=None):
+        namespace = self.namespace(provider, model, system_message, params)
+        key = self.make_key(namespace, user_prompt)
+        now = time.time()
+        with self._lock:
+            value = self._get_local(key, now)
+            if value is not None:
+                self._stats['hits'] += 1
+                return value
+
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self._store_local(key, value, now + self.ttl, namespace, None)
+                with self._lock:
+                    self._stats['shared_hits'] += 1
+                return value
+
+        if self.near_duplicates:
+            fingerprint = self.fingerprint(user_prompt)
+            if fingerprint is not None:
+                with self._lock:
+                    value = self._get_near(namespace, fingerprint, now)
+                    if value is not None:
+                        self._stats['near_hits'] += 1
+                        return value
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, provider, model, system_message, user_prompt, value, params=None):
+        namespace = self.namespace(provider, model, system_message, params)
+        key = self.make_key(namespace, user_prompt)
+        fingerprint = self.fingerprint(user_prompt) if self.near_duplicates else None
+        self._store_local(key, value, time.time() + self.ttl, namespace, fingerprint)
+        if self.shared is not None:
+            self.shared.set(key, value, timeout=self.ttl)
+        with self._lock:
+            self._stats['stores'] += 1
+
+    def fingerprint(self, user_prompt):
+        """متن‌های کوتاه برای تطابق تقریبی قابل اعتماد نیستند"""
+        value, words, numbers = simhash(user_prompt)
+        return (value, numbers) if words >= self.min_words else None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        lookups = stats['hits'] + stats['near_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = round((lookups - stats['misses']) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+
+    def _get_local(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _get_near(self, namespace, fingerprint, now):
+        candidates = set()
+        for band_key in self._band_keys(namespace, fingerprint):
+            candidates.update(self._index.get(band_key, ()))
+        for key in candidates:
+            entry = self._entries.get(key)
+            if entry is not None and bin(entry[3][0] ^ fingerprint[0]).count('1') <= self.near_bits:
+                return self._get_local(key, now)
+        return None
+
+    def _store_local(self, key, value, expires_at, namespace, fingerprint):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, namespace, fingerprint)
+            if fingerprint is not None:
+                for band_key in self._band_keys(namespace, fingerprint):
+                    self._index.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def _remove(self, key):
+        value, expires_at, namespace, fingerprint = self._entries.pop(key)
+        if fingerprint is not None:
+            for band_key in self._band_keys(namespace, fingerprint):
+                keys = self._index.get(band_key)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._index[band_key]
+
+    def _band_keys(self, namespace, fingerprint):
+        value, numbers = fingerprint
+        mask = (1 << self.band_bits) - 1
+        return [(namespace, numbers, band, value >> (band * self.band_bits) & mask) for band in range(self.bands)]
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache()
+    return _response_cache
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from AIchat import consumers
+
+websocket_urlpatterns = [
+    path('ws/legal-chat/', consumers.LegalChatConsumer.as_asgi(), name='ws-legal-chat'),
+    path('ws/ai/', consumers.AIFeatureConsumer.as_asgi(), name='ws-ai-features'),
+]
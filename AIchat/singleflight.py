@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from filelock import FileLock, Timeout
+
+from AIchat.gateway import LLMError
+
+
+def make_flight_key(provider, model, messages, params):
+    data = json.dumps([provider, model, messages, params], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class _Flight:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    ادغام درخواست‌های همزمان یکسان به مدل: فقط اولین درخواست (leader) به سرویس‌دهنده می‌رود
+    و بقیه منتظر همان نتیجه یا همان خطا می‌مانند.
+
+    داخل پروسس: برای هر کلید یک task مشترک روی همان event loop. لغو شدن یک منتظر بقیه را
+    لغو نمی‌کند؛ فقط وقتی همه منتظرها لغو شوند فراخوانی اصلی هم لغو می‌شود.
+
+    بین پروسس‌ها (LLM_SINGLE_FLIGHT_CROSS_PROCESS): leader هر پروسس قفل فایل کلید را در
+    LLM_SINGLE_FLIGHT_DIR می‌گیرد. اگر قفل دست پروسس دیگری باشد، منتظر آزاد شدن آن می‌ماند و
+    نتیجه یا خطای نوشته شده در فایل <key>.json را برمی‌دارد. اگر leader بدون نتیجه رها کند
+    (لغو یا از کار افتادن پروسس)، منتظر خودش فراخوانی را انجام می‌دهد.
+    هر پروسسی که پرواز جدید می‌سازد (وب یا ورکر) هر LLM_SINGLE_FLIGHT_PRUNE_INTERVAL ثانیه یک بار
+    فایل‌های کلیدهای قدیمی را در یک ترد پس‌زمینه پاک می‌کند.
+    """
+
+    def __init__(self, cross_process=None, lock_dir=None, wait_timeout=None, poll_interval=0.05,
+                 prune_interval=None):
+        self.cross_process = cross_process if cross_process is not None else getattr(
+            settings, 'LLM_SINGLE_FLIGHT_CROSS_PROCESS', True
+        )
+        self.lock_dir = lock_dir or getattr(settings, 'LLM_SINGLE_FLIGHT_DIR', None) or os.path.join(
+            tempfile.gettempdir(), 'hooshaai-singleflight'
+        )
+        self.wait_timeout = wait_timeout or getattr(settings, 'LLM_SINGLE_FLIGHT_WAIT', 300)
+        self.poll_interval = poll_interval
+        self.prune_interval = prune_interval or getattr(settings, 'LLM_SINGLE_FLIGHT_PRUNE_INTERVAL', 600)
+        self._next_prune = time.monotonic() + self.prune_interval
+        if self.cross_process:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        # Task به event loop وابسته است؛ پروازها برای هر loop جدا نگه داشته می‌شوند
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = {'leaders': 0, 'followers': 0, 'remote_followers': 0}
+
+    async def do(self, key, factory):
+        """
+        factory یک تابع بدون آرگومان که coroutine فراخوانی اصلی را می‌سازد.
+        خروجی باید قابل تبدیل به JSON باشد (برای اشتراک بین پروسس‌ها).
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flights = self._flights.setdefault(loop, {})
+            flight = flights.get(key)
+            if flight is None:
+                run = self._run_cross_process(key, factory) if self.cross_process else factory()
+                flight = flights[key] = _Flight(loop.create_task(run))
+                flight.task.add_done_callback(lambda task: self._forget(loop, key, flight))
+                self._stats['leaders'] += 1
+                self._maybe_prune()
+            else:
+                self._stats['followers'] += 1
+            flight.waiters += 1
+
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            flight.waiters -= 1
+            # آخرین منتظر لغو شد؛ دیگر کسی نتیجه را نمی‌خواهد
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        flight.waiters -= 1
+        # هر منتظر کپی خودش را می‌گیرد
+        return dict(result) if isinstance(result, dict) else result
+
+    def _forget(self, loop, key, flight):
+        with self._lock:
+            flights = self._flights.get(loop)
+            if flights is not None and flights.get(key) is flight:
+                del flights[key]
+                if not flights:
+                    del self._flights[loop]
+        # خطای task بدون منتظر (همه لغو شده‌اند) گزارش نشود
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    async def _run_cross_process(self, key, factory):
+        lock = FileLock(os.path.join(self.lock_dir, f'{key}.lock'))
+        result_path = os.path.join(self.lock_dir, f'{key}.json')
+        waited_since = None
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            attempted_at = time.time()
+            try:
+                lock.acquire(timeout=0)
+            except Timeout:
+                # پروسس دیگری همین درخواست را در حال اجرا دارد
+                if waited_since is None:
+                    waited_since = attempted_at
+                    with self._lock:
+                        self._stats['remote_followers'] += 1
+                if time.monotonic() >= deadline:
+                    return await factory()
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            try:
+                if waited_since is not None:
+                    outcome = self._read_outcome(result_path, waited_since)
+                    if outcome is not None:
+                        return self._unpack(outcome)
+                    # leader بدون نتیجه رها کرد؛ این پروسس leader می‌شود
+                try:
+                    result = await factory()
+                except Exception as e:
+                    # لغو (CancelledError) نوشته نمی‌شود تا منتظرها خودشان فراخوانی کنند
+                    self._write_outcome(result_path, {'error': {
+                        'provider': getattr(e, 'provider', 'unknown'),
+                        'message': getattr(e, 'message', repr(e)),
+                        'status_code': getattr(e, 'status_code', None),
+                    }})
+                    raise
+                self._write_outcome(result_path, {'result': result})
+                return result
+            finally:
+                lock.release()
+
+    @staticmethod
+    def _write_outcome(path, outcome):
+        outcome['finished_at'] = time.time()
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(outcome, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _read_outcome(path, since):
+        """فقط نتیجه‌ای که بعد از شروع انتظار تمام شده (نه نتیجه کهنه یک پرواز قبلی)"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                outcome = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return outcome if outcome.get('finished_at', 0) >= since else None
+
+    @staticmethod
+    def _unpack(outcome):
+        if 'error' in outcome:
+            error = outcome['error']
+            raise LLMError(error['provider'], error['message'], error['status_code'])
+        return outcome['result']
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _maybe_prune(self):
+        """داخل self._lock صدا زده می‌شود؛ prune سررسید شده در ترد جدا تا event loop بلاک نشود"""
+        if not self.cross_process or time.monotonic() < self._next_prune:
+            return
+        self._next_prune = time.monotonic() + self.prune_interval
+        threading.Thread(target=self.prune, name='single-flight-prune', daemon=True).start()
+
+    def prune(self, max_age=3600):
+        """
+        حذف فایل‌های قفل و نتیجه کلیدهایی که max_age ثانیه استفاده نشده‌اند.
+        هر کلید فقط وقتی پاک می‌شود که قفل آن بدون انتظار گرفته شود؛ پاک کردن فایل قفلی که
+        پروسس دیگری نگه داشته به منتظر بعدی فایل تازه و قفل جدا می‌دهد (دو leader).
+        """
+        if not self.cross_process:
+            return 0
+        removed = 0
+        cutoff = time.time() - max_age
+        keys = {name.rsplit('.', 1)[0] for name in os.listdir(self.lock_dir) if name.endswith(('.json', '.lock'))}
+        for key in keys:
+            paths = [os.path.join(self.lock_dir, f'{key}{suffix}') for suffix in ('.lock', '.json')]
+            try:
+                if any(os.path.exists(path) and os.path.getmtime(path) >= cutoff for path in paths):
+                    continue
+                lock = FileLock(paths[0])
+                lock.acquire(timeout=0)
+            except (OSError, Timeout):
+                continue
+            try:
+                for path in paths:
+                    try:
+                        os.remove(path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+            finally:
+                lock.release()
+        return removed
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
@@ -1,3 +1,314 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from asgiref.testing import ApplicationCommunicator
+from filelock import FileLock
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from AI.features import client_provider
+from AIchat.consumers import ERROR_MESSAGE, AIFeatureConsumer, LegalChatConsumer
+from AIchat.jobs import JobError, claim_jobs, requeue_jobs, requeue_stale_jobs, submit_job
+from AIchat.memory import ConversationMemory
+from AIchat.models import AIJob, LegalChatSession, LegalChatTurn
+from AIchat.singleflight import SingleFlight
+from setting.models import Role
+from user.models import CustomUser
+
+
+def sse_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'.encode()
+
+
+class FakeMessagesAPI(BaseHTTPRequestHandler):
+    """
+    نسخه محلی استریم Messages API: mode کلاس مشخص می‌کند پاسخ کامل باشد (ok)،
+    بعد از اولین تکه منتظر بماند (slow) یا خطای 500 برگرداند (error)
+    """
+
+    mode = 'ok'
+    release = threading.Event()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.mode == 'error':
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        self.wfile.write(sse_event('message_start', {'message': {'usage': {'input_tokens': 12, 'output_tokens': 1}}}))
+        self.wfile.write(sse_event('content_block_delta', {'delta': {'type': 'text_delta', 'text': 'سلام'}}))
+        self.wfile.flush()
+        if self.mode == 'slow':
+            self.release.wait(5)
+            return
+        self.wfile.write(sse_event('content_block_delta', {'delta': {'type': 'text_delta', 'text': ' دنیا'}}))
+        self.wfile.write(sse_event('message_delta', {'usage': {'output_tokens': 4}}))
+        self.wfile.write(sse_event('message_stop', {}))
+
+    def log_message(self, *args):
+        pass
+
+
+class LegalChatConsumerTests(TransactionTestCase):
+    """استریم مشاور حقوقی در برابر یک سرور SSE محلی"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeMessagesAPI)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.api_url = f'http://127.0.0.1:{cls.server.server_address[1]}/v1/messages'
+
+    @classmethod
+    def tearDownClass(cls):
+        FakeMessagesAPI.release.set()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        role = Role.objects.create(name='member', dev_name='member')
+        self.user = CustomUser.objects.create(username='lawyer', email='lawyer@test.local', phone='phone-lawyer',
+                                              full_name='lawyer', role=role)
+        FakeMessagesAPI.mode = 'ok'
+        FakeMessagesAPI.release.clear()
+        settings_override = override_settings(CLAUDE_API_URL=self.api_url, CLAUDE_API_KEY='test-key')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def communicator(self, user):
+        return ApplicationCommunicator(LegalChatConsumer.as_asgi(), {
+            'type': 'websocket', 'path': '/ws/legal-chat/', 'query_string': b'', 'headers': [],
+            'subprotocols': [], 'user': user,
+        })
+
+    async def connect(self):
+        communicator = self.communicator(self.user)
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await communicator.receive_output(5))['type'], 'websocket.accept')
+        session = json.loads((await communicator.receive_output(5))['text'])
+        self.assertEqual(session['type'], 'session')
+        return communicator
+
+    async def ask(self, communicator, message):
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps({'message': message})})
+
+    @staticmethod
+    async def receive_frame(communicator):
+        return json.loads((await communicator.receive_output(5))['text'])
+
+    async def test_anonymous_connection_is_closed(self):
+        communicator = self.communicator(AnonymousUser())
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.assertEqual(await communicator.receive_output(5), {'type': 'websocket.close', 'code': 4001})
+
+    async def test_stream_sends_deltas_then_done(self):
+        communicator = await self.connect()
+        await self.ask(communicator, 'سوال')
+        self.assertEqual(await self.receive_frame(communicator), {'type': 'delta', 'text': 'سلام'})
+        self.assertEqual(await self.receive_frame(communicator), {'type': 'delta', 'text': ' دنیا'})
+        self.assertEqual(await self.receive_frame(communicator), {'type': 'done', 'message': 'سلام دنیا'})
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(5)
+
+        turns = [(turn.role, turn.content) async for turn in LegalChatTurn.objects.order_by('id')]
+        self.assertEqual(turns, [('user', 'سوال'), ('assistant', 'سلام دنیا')])
+
+    async def test_cancel_stops_stream_and_drops_unanswered_turn(self):
+        FakeMessagesAPI.mode = 'slow'
+        communicator = await self.connect()
+        await self.ask(communicator, 'سوال')
+        self.assertEqual(await self.receive_frame(communicator), {'type': 'delta', 'text': 'سلام'})
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps({'action': 'cancel'})})
+
+        self.assertTrue(await communicator.receive_nothing(0.5))
+        self.assertFalse(await LegalChatTurn.objects.aexists())
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(5)
+
+    async def test_provider_error_sends_error_frame(self):
+        FakeMessagesAPI.mode = 'error'
+        communicator = await self.connect()
+        await self.ask(communicator, 'سوال')
+        self.assertEqual(await self.receive_frame(communicator), {'type': 'error', 'message': ERROR_MESSAGE})
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(5)
+
+        self.assertFalse(await LegalChatTurn.objects.aexists())
+
+    async def test_invalid_frames_get_error_replies(self):
+        communicator = await self.connect()
+        for text in ('not json', json.dumps([1, 2]), json.dumps({}), json.dumps({'message': 5}),
+                     json.dumps({'message': '  '})):
+            await communicator.send_input({'type': 'websocket.receive', 'text': text})
+            self.assertEqual(await self.receive_frame(communicator), {'type': 'error', 'message': ERROR_MESSAGE})
+        await self.ask(communicator, 'سوال')
+        self.assertEqual(await self.receive_frame(communicator), {'type': 'delta', 'text': 'سلام'})
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(5)
+
+    def test_session_is_created_on_first_turn_and_resumed_only_by_owner(self):
+        memory = ConversationMemory.open(None, self.user)
+        self.assertFalse(LegalChatSession.objects.exists())
+        memory.add_turn('user', 'سوال')
+        self.assertTrue(LegalChatSession.objects.filter(session_key=memory.session_key, user=self.user).exists())
+
+        self.assertEqual(ConversationMemory.open(memory.session_key, self.user).history(),
+                         [{'role': 'user', 'content': 'سوال'}])
+        other = CustomUser.objects.create(username='other', email='other@test.local', phone='phone-other',
+                                          full_name='other', role=self.user.role)
+        self.assertNotEqual(ConversationMemory.open(memory.session_key, other).session_key, memory.session_key)
+
+
+@override_settings(AI_FEATURES_PROVIDER='mock')
+class AIFeatureConsumerTests(TransactionTestCase):
+    """هر فریم ورودی /ws/ai/ (حتی نامعتبر) یک پاسخ می‌گیرد"""
+
+    def setUp(self):
+        role = Role.objects.create(name='member', dev_name='member')
+        self.user = CustomUser.objects.create(username='teacher', email='teacher@test.local', phone='phone-teacher',
+                                              full_name='teacher', role=role)
+
+    async def connect(self):
+        communicator = ApplicationCommunicator(AIFeatureConsumer.as_asgi(), {
+            'type': 'websocket', 'path': '/ws/ai/', 'query_string': b'', 'headers': [],
+            'subprotocols': [], 'user': self.user,
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await communicator.receive_output(5))['type'], 'websocket.accept')
+        return communicator
+
+    @staticmethod
+    async def request(communicator, frame):
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps(frame)})
+        return json.loads((await communicator.receive_output(5))['text'])
+
+    async def test_invalid_frames_get_error_replies(self):
+        communicator = await self.connect()
+        self.assertEqual(await self.request(communicator, [1, 2]),
+                         {'type': 'error', 'id': None, 'message': 'invalid request'})
+        self.assertEqual(await self.request(communicator, {'id': 1, 'feature': ['summarizing']}),
+                         {'type': 'error', 'id': 1, 'message': 'invalid feature'})
+        reply = await self.request(communicator, {'id': 2, 'feature': 'summarizing',
+                                                  'args': {'user_text': 5, 'num_summarizing': 10}})
+        self.assertEqual(reply, {'type': 'error', 'id': 2, 'message': 'invalid arguments'})
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(5)
+
+    async def test_unknown_provider_falls_back_to_default(self):
+        communicator = await self.connect()
+        reply = await self.request(communicator, {'id': 3, 'feature': 'find_research_query', 'provider': ['cohere'],
+                                                  'args': {'user_text': 'متن'}})
+        self.assertEqual(reply['type'], 'result')
+        self.assertTrue(reply['result'].startswith('[mock-1]'))
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(5)
+
+    @override_settings(AI_WS_MAX_INFLIGHT=0)
+    async def test_inflight_limit(self):
+        communicator = await self.connect()
+        reply = await self.request(communicator, {'id': 4, 'feature': 'find_research_query',
+                                                  'args': {'user_text': 'متن'}})
+        self.assertEqual(reply, {'type': 'error', 'id': 4, 'message': 'too many requests'})
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(5)
+
+    @override_settings(AI_FEATURES_PROVIDER='cohere')
+    def test_mock_provider_is_not_client_selectable(self):
+        self.assertEqual(client_provider('mock'), 'cohere')
+        self.assertEqual(client_provider('deepseek'), 'deepseek')
+
+
+class AIJobQueueTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name='member', dev_name='member')
+        cls.user = CustomUser.objects.create(username='student', email='student@test.local', phone='phone-student',
+                                             full_name='student', role=role)
+
+    def test_submit_rejects_malformed_values(self):
+        for kwargs in ({'lane': ['bulk']}, {'lane': 'urgent'}, {'args': {'user_text': 5}}, {'args': ['متن']}):
+            kwargs = {'args': {'user_text': 'متن'}, **kwargs}
+            with self.subTest(**kwargs), self.assertRaises(JobError):
+                submit_job(self.user, 'find_research_query', **kwargs)
+        job, _ = submit_job(self.user, 'find_research_query', {'user_text': 'متن'}, provider=['mock'])
+        self.assertEqual(job.provider, settings.AI_FEATURES_PROVIDER)
+
+    def test_only_jobs_without_heartbeat_are_requeued(self):
+        live, _ = submit_job(self.user, 'find_research_query', {'user_text': 'live'})
+        dead, _ = submit_job(self.user, 'find_research_query', {'user_text': 'dead'})
+        claim_jobs('worker', 2)
+        long_ago = timezone.now() - timedelta(hours=1)
+        AIJob.objects.filter(id__in=[live.id, dead.id]).update(started_at=long_ago)
+        AIJob.objects.filter(id=dead.id).update(heartbeat_at=long_ago)
+
+        self.assertEqual(requeue_stale_jobs(), (1, 0))
+        self.assertEqual(AIJob.objects.get(id=live.id).status, AIJob.STATUS_RUNNING)
+        self.assertEqual(AIJob.objects.get(id=dead.id).status, AIJob.STATUS_QUEUED)
+
+
+    @override_settings(AI_JOB_MAX_ATTEMPTS=2)
+    def test_jobs_of_broken_pool_are_requeued_until_max_attempts(self):
+        fresh, _ = submit_job(self.user, 'find_research_query', {'user_text': 'fresh'})
+        retried, _ = submit_job(self.user, 'find_research_query', {'user_text': 'retried'})
+        other, _ = submit_job(self.user, 'find_research_query', {'user_text': 'other'})
+        AIJob.objects.filter(id=retried.id).update(attempts=1)
+        claim_jobs('worker', 2)
+        claim_jobs('another-worker', 1)
+
+        self.assertEqual(requeue_jobs('worker', [fresh.id, retried.id, other.id]), (1, 1))
+        self.assertEqual(AIJob.objects.get(id=fresh.id).status, AIJob.STATUS_QUEUED)
+        self.assertEqual(AIJob.objects.get(id=retried.id).status, AIJob.STATUS_FAILED)
+        self.assertEqual(AIJob.objects.get(id=other.id).status, AIJob.STATUS_RUNNING)
+
+
+class SingleFlightPruneTests(SimpleTestCase):
+
+    def test_prune_skips_held_locks(self):
+        with tempfile.TemporaryDirectory() as lock_dir:
+            flight = SingleFlight(cross_process=True, lock_dir=lock_dir)
+            for key in ('idle', 'held'):
+                for suffix in ('.lock', '.json'):
+                    path = os.path.join(lock_dir, key + suffix)
+                    open(path, 'w').close()
+            held = FileLock(os.path.join(lock_dir, 'held.lock'))
+            held.acquire()
+            try:
+                old = time.time() - 7200
+                for name in os.listdir(lock_dir):
+                    os.utime(os.path.join(lock_dir, name), (old, old))
+                self.assertEqual(flight.prune(max_age=3600), 2)
+            finally:
+                held.release()
+            self.assertEqual(sorted(os.listdir(lock_dir)), ['held.json', 'held.lock'])
+
+
+class MetricsViewTests(TestCase):
+
+    def test_requires_token_or_staff(self):
+        url = reverse('ai-metrics')
+        with override_settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get(url).status_code, 403)
+        with override_settings(METRICS_TOKEN='scrape-secret'):
+            self.assertEqual(self.client.get(url, HTTP_X_METRICS_TOKEN='wrong').status_code, 403)
+            self.assertEqual(self.client.get(url, HTTP_X_METRICS_TOKEN='scrape-secret').status_code, 200)
+
+        # کاربر ادمین جنگو (django.contrib.auth)، نه CustomUser
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        with override_settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get(url).status_code, 200)
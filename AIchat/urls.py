@@ -0,0 +1,9 @@
+from django.urls import path
+from AIchat import views
+
+urlpatterns = [
+    path('/jobs', views.AIJobAPIView.as_view(), name='ai-jobs'),
+    path('/jobs/<uuid:job_id>', views.AIJobAPIView.as_view(), name='ai-job'),
+    path('/jobs/<uuid:job_id>/stream', views.ai_job_stream, name='ai-job-stream'),
+    path('/metrics', views.metrics, name='ai-metrics'),
+]
@@ -0,0 +1,244 @@
+import asyncio
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+import httpx
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def error_class(error):
+    """کلاس خطا با cardinality کم برای برچسب متریک و ستون جدول"""
+    if error is None:
+        return ''
+    if isinstance(error, asyncio.CancelledError):
+        return 'cancelled'
+    status_code = getattr(error, 'status_code', None)
+    if status_code:
+        return f'http_{status_code}'
+    if isinstance(error, httpx.HTTPStatusError):
+        return f'http_{error.response.status_code}'
+    if isinstance(error, httpx.TimeoutException):
+        return 'timeout'
+    if isinstance(error, httpx.TransportError) or 'connection failed' in str(error):
+        return 'connection'
+    return type(error).__name__[:50]
+
+
+def estimate_cost(model, input_tokens, output_tokens):
+    """هزینه تخمینی به دلار از LLM_PRICING_PER_MILLION (قیمت ورودی، قیمت خروجی برای هر میلیون توکن)"""
+    input_price, output_price = getattr(settings, 'LLM_PRICING_PER_MILLION', {}).get(model, (0, 0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+class UsageRecorder:
+    """
+    ثبت مصرف هر فراخوانی مدل (provider، model، feature، توکن ورودی و خروجی، latency،
+    زمان اولین توکن، cache و کلاس خطا):
+    - شمارنده‌ها و هیستوگرام‌های تجمعی پروسس برای /metrics (فرمت Prometheus)
+    - جمع دقیقه‌ای در حافظه که هر LLM_USAGE_FLUSH_INTERVAL ثانیه توسط ترد پس‌زمینه در
+      AIUsageBucket نوشته می‌شود (یک UPDATE با F برای هر کلید، نه یک INSERT برای هر فراخوانی)
+    cache یکی از miss (فراخوانی واقعی)، hit (ResponseCache) و coalesced (SingleFlight) است.
+    """
+
+    def __init__(self, flush_interval=None):
+        self.flush_interval = flush_interval or getattr(settings, 'LLM_USAGE_FLUSH_INTERVAL', 30)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._calls = {}
+        self._tokens = {}
+        self._cost = {}
+        self._latency = {}
+        self._ttft = {}
+        self._flusher = None
+        self._stopped = threading.Event()
+
+    def record(self, provider, model, feature, input_tokens=0, output_tokens=0, latency=0.0, ttft=None,
+               cache='miss', error=None):
+        feature = feature or 'unknown'
+        error = error_class(error) if not isinstance(error, str) else error
+        cost = estimate_cost(model, input_tokens, output_tokens)
+        now = time.time()
+        bucket = int(now // 60) * 60
+        series = (provider, model, feature)
+        with self._lock:
+            self._calls[series + (cache, error)] = self._calls.get(series + (cache, error), 0) + 1
+            for direction, tokens in (('input', input_tokens), ('output', output_tokens)):
+                self._tokens[series + (direction,)] = self._tokens.get(series + (direction,), 0) + tokens
+            self._cost[series] = self._cost.get(series, 0.0) + cost
+            self._latency.setdefault(series, _Histogram()).observe(latency)
+            if ttft is not None:
+                self._ttft.setdefault(series, _Histogram()).observe(ttft)
+
+            key = (bucket,) + series + (cache, error)
+            row = self._pending.get(key)
+            if row is None:
+                row = self._pending[key] = {
+                    'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'latency_ms_total': 0,
+                    'latency_ms_max': 0, 'ttft_ms_total': 0, 'cost_usd': 0.0,
+                }
+            row['calls'] += 1
+            row['input_tokens'] += input_tokens
+            row['output_tokens'] += output_tokens
+            row['latency_ms_total'] += int(latency * 1000)
+            row['latency_ms_max'] = max(row['latency_ms_max'], int(latency * 1000))
+            row['ttft_ms_total'] += int((ttft if ttft is not None else latency) * 1000)
+            row['cost_usd'] += cost
+        self._ensure_flusher()
+
+    def flush(self):
+        """نوشتن جمع‌های دقیقه‌ای در AIUsageBucket؛ تعداد ردیف‌های نوشته شده را برمی‌گرداند"""
+        from AIchat.models import AIUsageBucket
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            with transaction.atomic():
+                for (bucket, provider, model, feature, cache, error), row in pending.items():
+                    lookup = {
+                        'bucket': datetime.fromtimestamp(bucket, tz=dt_timezone.utc), 'provider': provider,
+                        'model': model, 'feature': feature, 'cache': cache, 'error': error,
+                    }
+                    self._write_bucket(AIUsageBucket, lookup, row)
+        except Exception:
+            # برگرداندن به صف تا دور بعد دوباره نوشته شوند
+            with self._lock:
+                for key, row in pending.items():
+                    current = self._pending.get(key)
+                    if current is None:
+                        self._pending[key] = row
+                    else:
+                        for field, value in row.items():
+                            current[field] = max(current[field], value) if field == 'latency_ms_max' \
+                                else current[field] + value
+            raise
+        return len(pending)
+
+    @staticmethod
+    def _write_bucket(model_class, lookup, row):
+        increments = {field: F(field) + value for field, value in row.items() if field != 'latency_ms_max'}
+        increments['latency_ms_max'] = Greatest(F('latency_ms_max'), row['latency_ms_max'])
+        if model_class.objects.filter(**lookup).update(**increments):
+            return
+        try:
+            with transaction.atomic():
+                model_class.objects.create(**lookup, **row)
+        except IntegrityError:
+            # پروسس دیگری همزمان همین ردیف را ساخت
+            model_class.objects.filter(**lookup).update(**increments)
+
+    def render_prometheus(self):
+        """متریک‌های تجمعی این پروسس در فرمت متنی Prometheus"""
+        with self._lock:
+            calls = dict(self._calls)
+            tokens = dict(self._tokens)
+            cost = dict(self._cost)
+            histograms = {
+                name: {series: (list(h.counts), h.sum, h.count) for series, h in values.items()}
+                for name, values in (('latency', self._latency), ('ttft', self._ttft))
+            }
+
+        lines = [
+            '# HELP hooshaai_llm_calls_total LLM calls by provider, model, feature, cache result and error class.',
+            '# TYPE hooshaai_llm_calls_total counter',
+        ]
+        for (provider, model, feature, cache, error), value in sorted(calls.items()):
+            labels = _labels(provider=provider, model=model, feature=feature, cache=cache, error=error)
+            lines.append(f'hooshaai_llm_calls_total{labels} {value}')
+
+        lines += ['# HELP hooshaai_llm_tokens_total Tokens billed by the provider.',
+                  '# TYPE hooshaai_llm_tokens_total counter']
+        for (provider, model, feature, direction), value in sorted(tokens.items()):
+            labels = _labels(provider=provider, model=model, feature=feature, direction=direction)
+            lines.append(f'hooshaai_llm_tokens_total{labels} {value}')
+
+        lines += ['# HELP hooshaai_llm_cost_usd_total Estimated cost from LLM_PRICING_PER_MILLION.',
+                  '# TYPE hooshaai_llm_cost_usd_total counter']
+        for (provider, model, feature), value in sorted(cost.items()):
+            lines.append(f'hooshaai_llm_cost_usd_total{_labels(provider=provider, model=model, feature=feature)} {value:.6f}')
+
+        for name, help_text in (('latency', 'End-to-end call latency.'), ('ttft', 'Time to first token.')):
+            metric = f'hooshaai_llm_{name}_seconds'
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+            for (provider, model, feature), (counts, total, count) in sorted(histograms[name].items()):
+                series = {'provider': provider, 'model': model, 'feature': feature}
+                cumulative = 0
+                for bound, bucket_count in zip(LATENCY_BUCKETS + ('+Inf',), counts):
+                    cumulative += bucket_count
+                    lines.append(f'{metric}_bucket{_labels(**series, le=str(bound))} {cumulative}')
+                lines.append(f'{metric}_sum{_labels(**series)} {total:.6f}')
+                lines.append(f'{metric}_count{_labels(**series)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def _ensure_flusher(self):
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(target=self._run_flusher, name='llm-usage-flusher', daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                # صف دست نخورده می‌ماند و دور بعد دوباره تلاش می‌شود
+                logger.exception('LLM usage flush failed')
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+_usage_recorder = None
+_usage_recorder_lock = threading.Lock()
+
+
+def get_usage_recorder() -> UsageRecorder:
+    global _usage_recorder
+    if _usage_recorder is None:
+        with _usage_recorder_lock:
+            if _usage_recorder is None:
+                _usage_recorder = UsageRecorder()
+                atexit.register(_usage_recorder.stop)
+    return _usage_recorder
@@ -1,3 +1,205 @@
-from django.shortcuts import render
+import asyncio
+import hmac
+import json
+import time
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from AIchat.jobs import JobError, job_payload, submit_job
+from AIchat.models import AIJob
+from AIchat.usage import get_usage_recorder
+from authentication.auth import get_authenticated_user_from_request
+from HooshaAI.settings import CUSTOM_ACCESS_TOKEN_NAME
+
+INVALID_SESSION = {
+    'errors': {
+        'fa': ['نشست شما اعتبار ندارد مجددا وارد شوید!', ],
+        'en': ['Your session is invalid. Please log in again!', ]
+    }
+}
+JOB_NOT_FOUND = {
+    'errors': {
+        'fa': ['کار مورد نظر یافت نشد !', ],
+        'en': ['Job not found !', ]
+    }
+}
+
+
+class AIJobAPIView(APIView):
+
+    @swagger_auto_schema(
+        operation_description="ثبت یک کار AI در صف و برگشت فوری .\nfeature یکی از summarizing, find_research_query, researching, question_design, generate_teaching_plans\nlane یکی از interactive, default, bulk\nاگر کار یکسانی در صف یا در حال اجرا باشد همان برگردانده می‌شود (deduplicated) .",
+        manual_parameters=[
+            openapi.Parameter(
+                CUSTOM_ACCESS_TOKEN_NAME,
+                openapi.IN_HEADER,
+                description="توکن احراز هویت کاربر",
+                type=openapi.TYPE_STRING,
+                required=True
+            ),
+        ],
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=['feature', 'args'],
+            properties={
+                'feature': openapi.Schema(type=openapi.TYPE_STRING, example='summarizing'),
+                'args': openapi.Schema(type=openapi.TYPE_OBJECT,
+                                       example={'user_text': 'متن درس', 'num_summarizing': 50}),
+                'provider': openapi.Schema(type=openapi.TYPE_STRING, example='cohere'),
+                'lane': openapi.Schema(type=openapi.TYPE_STRING, example='interactive'),
+            },
+        ),
+        responses={
+            400: openapi.Response(
+                description="نشست نامعتبر یا درخواست نامعتبر",
+                examples={
+                    "application/json": {
+                        'errors': {
+                            'fa': ['درخواست نامعتبر است !'],
+                            'en': ['invalid arguments']
+                        }
+                    }
+                }
+            ),
+            202: openapi.Response(
+                description="کار ثبت شد؛ وضعیت با GET /api/ai/jobs/<job_id> یا استریم /stream گرفته می‌شود",
+                examples={
+                    "application/json": {
+                        'job_id': '0b6f6b57-79b0-4c43-9b43-2f3a6e0d35a1',
+                        'feature': 'summarizing',
+                        'lane': 'interactive',
+                        'status': 'queued',
+                        'created_at': '2025-06-14T18:04:59+00:00',
+                        'finished_at': None,
+                        'deduplicated': False
+                    }
+                }
+            )
+        },
+    )
+    def post(self, request):
+        user = request.user
+        if not user.is_authenticated:
+            return Response(INVALID_SESSION, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            if not isinstance(request.data, dict):
+                raise JobError('invalid request')
+            args = request.data.get('args') or {}
+            if not isinstance(args, dict):
+                raise JobError('invalid arguments')
+            job, created = submit_job(
+                user, request.data.get('feature'), args,
+                provider=request.data.get('provider'), lane=request.data.get('lane') or 'default',
+            )
+        except JobError as e:
+            data = {
+                'errors': {
+                    'fa': ['درخواست نامعتبر است !', ],
+                    'en': [str(e), ]
+                }
+            }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        data = job_payload(job)
+        data['deduplicated'] = not created
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+    @swagger_auto_schema(
+        operation_description="وضعیت و نتیجه یک کار AI .\nstatus یکی از queued, running, done, failed ؛ result فقط در done می‌آید .",
+        manual_parameters=[
+            openapi.Parameter(
+                CUSTOM_ACCESS_TOKEN_NAME,
+                openapi.IN_HEADER,
+                description="توکن احراز هویت کاربر",
+                type=openapi.TYPE_STRING,
+                required=True
+            ),
+        ],
+        responses={
+            404: openapi.Response(
+                description="کار یافت نشد",
+                examples={"application/json": JOB_NOT_FOUND}
+            ),
+            200: openapi.Response(
+                description="وضعیت کار",
+                examples={
+                    "application/json": {
+                        'job_id': '0b6f6b57-79b0-4c43-9b43-2f3a6e0d35a1',
+                        'feature': 'summarizing',
+                        'lane': 'interactive',
+                        'status': 'done',
+                        'created_at': '2025-06-14T18:04:59+00:00',
+                        'finished_at': '2025-06-14T18:05:07+00:00',
+                        'result': 'متن خلاصه شده'
+                    }
+                }
+            )
+        },
+    )
+    def get(self, request, job_id):
+        user = request.user
+        if not user.is_authenticated:
+            return Response(INVALID_SESSION, status=status.HTTP_400_BAD_REQUEST)
+        # job_id (UUID) خود مجوز دسترسی است؛ کار مشترک dedup شده بین چند کاربر
+        job = AIJob.objects.filter(job_id=job_id).first()
+        if job is None:
+            return Response(JOB_NOT_FOUND, status=status.HTTP_404_NOT_FOUND)
+        return Response(job_payload(job), status=status.HTTP_200_OK)
+
+
+async def ai_job_stream(request, job_id):
+    """
+    استریم SSE وضعیت کار تا پایان: رویداد status با هر تغییر وضعیت و در پایان رویداد result.
+    view async است تا انتظار چند ده ثانیه‌ای یک ورکر ASGI را اشغال نکند؛ وضعیت با فاصله
+    افزایشی (تا ۲ ثانیه) از دیتابیس خوانده می‌شود.
+    """
+    user = await sync_to_async(get_authenticated_user_from_request)(request)
+    if user is None:
+        return JsonResponse(INVALID_SESSION, status=400)
+    job = await AIJob.objects.filter(job_id=job_id).afirst()
+    if job is None:
+        return JsonResponse(JOB_NOT_FOUND, status=404)
+
+    async def events():
+        deadline = time.monotonic() + getattr(settings, 'AI_JOB_STREAM_TIMEOUT', 600)
+        last_status = None
+        delay = 0.25
+        current = job
+        while True:
+            if current.status != last_status:
+                last_status = current.status
+                yield f'event: status\ndata: {json.dumps({"status": current.status})}\n\n'
+            if current.status in (AIJob.STATUS_DONE, AIJob.STATUS_FAILED):
+                yield f'event: result\ndata: {json.dumps(job_payload(current), ensure_ascii=False)}\n\n'
+                return
+            if time.monotonic() >= deadline:
+                yield 'event: timeout\ndata: {}\n\n'
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 2.0)
+            current = await AIJob.objects.aget(id=current.id)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def metrics(request):
+    """
+    متریک‌های مصرف مدل این پروسس (توکن، هزینه، latency، زمان اولین توکن) در فرمت متنی Prometheus.
+    هر پروسس شمارنده‌های خودش را دارد؛ گزارش کل از جدول AIUsageBucket گرفته می‌شود.
+    دسترسی فقط با METRICS_TOKEN در هدر X-Metrics-Token (برای Prometheus) یا برای کاربر staff
+    وارد شده به ادمین؛ بدون METRICS_TOKEN فقط staff.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    token_valid = bool(token) and hmac.compare_digest(request.headers.get('X-Metrics-Token', ''), token)
+    if not token_valid and not request.user.is_staff:
+        return HttpResponse(status=403)
+    return HttpResponse(get_usage_recorder().render_prometheus(), content_type='text/plain; version=0.0.4')
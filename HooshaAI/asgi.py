@@ -1,16 +1,26 @@
 import os
+
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-import AIchat.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'HooshaAI.settings')
 
+# اپلیکیشن HTTP باید قبل از ایمپورت routing ها (که مدل‌ها را ایمپورت می‌کنند) ساخته شود
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+
+from authentication.backends import JWTAuthMiddlewareStack  # noqa: E402
+import AIchat.routing  # noqa: E402
+import chat.routing  # noqa: E402
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
-        URLRouter(
-            AIchat.routing.websocket_urlpatterns
+    "http": django_asgi_app,
+    "websocket": AllowedHostsOriginValidator(
+        JWTAuthMiddlewareStack(
+            URLRouter(
+                chat.routing.websocket_urlpatterns + AIchat.routing.websocket_urlpatterns
+            )
         )
     ),
-})
\ No newline at end of file
+})
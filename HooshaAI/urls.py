@@ -38,6 +38,7 @@ urlpatterns = [
                   path('admin/', admin.site.urls),
                   path('api/user-auth', include('authentication.urls')),
                   path('api/chat', include('chat.urls')),
+                  path('api/ai', include('AIchat.urls')),
 
 
                   path('swagger<format>', schema_view.without_ui(cache_timeout=0), name='schema-json'),
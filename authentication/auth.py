@@ -1,34 +1,32 @@
 from rest_framework.request import Request
 from authentication.jwt import decode_and_validate_token
+from authentication.login import get_login_pipeline
 from user.models import CustomUser
-from django.db.models import Q
 from HooshaAI.settings import CUSTOM_ACCESS_TOKEN_NAME
 
 def get_authenticated_user_from_request(request: Request):
+    """
+    کاربر صاحب اکسس توکن یا None؛ نتیجه روی HttpRequest اصلی ذخیره می‌شود
+    تا JWTAuthentication و هر کد دیگری در همان درخواست دوباره توکن را بررسی نکنند.
+    """
+    holder = getattr(request, '_request', request)
+    if hasattr(holder, '_jwt_user'):
+        return holder._jwt_user
+
+    user = None
     auth_header = request.headers.get(CUSTOM_ACCESS_TOKEN_NAME)
-    if not auth_header:
-        return None
+    if auth_header:
+        user, status = decode_and_validate_token(auth_header, expected_type='at')
+        if status == 'valid':
+            user.update_last_seen()  # heartbeat حضور، بدون کوئری SQL
+        else:
+            user = None
 
-    user, status = decode_and_validate_token(auth_header, expected_type='at')
-    if status == 'valid':
-        return user
-    else:
-        return None
+    holder._jwt_user = user
+    return user
 
 
-def authenticate_user(data):
-    identifier = data.get('username') or data.get('email')
-    password = data.get('password')
-
-    if not identifier or not password:
-        return None
-
-    try:
-        user = CustomUser.objects.get(Q(username=identifier) | Q(email=identifier))
-    except CustomUser.DoesNotExist:
-        return None
-
-    if user.check_password(password) and user.is_active:
-        return user
-
-    return None
+def authenticate_user(data, ip=None):
+    """ورود از مسیر LoginPipeline؛ برای جزئیات خطا (429/503) از get_login_pipeline استفاده کنید"""
+    login_status, user = get_login_pipeline().authenticate(data, ip)
+    return user
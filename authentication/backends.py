@@ -0,0 +1,64 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.authentication import BaseAuthentication
+
+from authentication.auth import get_authenticated_user_from_request
+from authentication.jwt import decode_and_validate_token
+
+
+class JWTAuthentication(BaseAuthentication):
+    """
+    احراز هویت DRF با اکسس توکن هدر CUSTOM_ACCESS_TOKEN_NAME.
+    کاربر یک بار برای هر درخواست پیدا و روی درخواست ذخیره می‌شود، پس request.user
+    و get_authenticated_user_from_request در کدهای تو در تو کوئری تکراری ندارند.
+    توکن نامعتبر خطا نمی‌دهد و کاربر AnonymousUser می‌شود تا هر view پیام خطای خودش را برگرداند.
+    """
+
+    def authenticate(self, request):
+        user = get_authenticated_user_from_request(request)
+        if user is None:
+            return None
+        return user, None
+
+    def authenticate_header(self, request):
+        return 'Bearer'
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    احراز هویت وب‌سوکت با همان اکسس توکن؛ توکن از هدر authorization یا
+    پارامتر token در query string خوانده می‌شود و scope['user'] پر می‌شود.
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        scope['user'] = await self.get_user(self.get_token(scope))
+        return await super().__call__(scope, receive, send)
+
+    @staticmethod
+    def get_token(scope):
+        for name, value in scope.get('headers', []):
+            if name == b'authorization':
+                return value.decode('latin1')
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+        if token:
+            token = token[0]
+            return token if token.lower().startswith('bearer ') else f'Bearer {token}'
+        return None
+
+    @database_sync_to_async
+    def get_user(self, token):
+        if not token:
+            return AnonymousUser()
+        user, status = decode_and_validate_token(token, expected_type='at')
+        if status != 'valid':
+            return AnonymousUser()
+        user.update_last_seen()
+        return user
+
+
+def JWTAuthMiddlewareStack(inner):
+    return JWTAuthMiddleware(inner)
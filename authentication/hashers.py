@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    همان pbkdf2_sha256 جنگو با تعداد تکرار قابل تنظیم از PASSWORD_PBKDF2_ITERATIONS.
+    هش‌های قبلی همچنان بررسی می‌شوند و با تغییر عدد، در اولین ورود موفق دوباره هش می‌شوند.
+    برای انتخاب عدد از دستور bench_password_hasher استفاده کنید.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
@@ -2,13 +2,15 @@ import datetime
 import uuid
 import jwt
 from django.utils import timezone
-from authentication.models import AccessToken, RefreshToken
+from authentication.models import AccessToken, RefreshToken, SessionRegistry
+from authentication.token_cache import get_token_cache
 from django.conf import settings
+from django.db import transaction
 from jwt import ExpiredSignatureError, InvalidTokenError
 
-def create_access_token(user):
-    token_id = str(uuid.uuid4())
-    now = timezone.now()
+def create_access_token(user, session_id=None, token_id=None, now=None):
+    token_id = token_id or str(uuid.uuid4())
+    now = now or timezone.now()
     exp = now + settings.SIMPLE_JWT['ACCESS_TOKEN_LIFETIME']
 
     payload = {
@@ -18,11 +20,12 @@ def create_access_token(user):
         "exp": int(exp.timestamp()),
         "sub": str(user.id)
     }
+    if session_id:
+        payload["sid"] = session_id
 
     token = jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
 
     AccessToken.objects.create(
-        token=token,
         user=user,
         token_id=token_id,
         created_at=now,
@@ -32,10 +35,9 @@ def create_access_token(user):
     return token
 
 
-
-def create_refresh_token(user):
-    token_id = str(uuid.uuid4())
-    now = timezone.now()
+def create_refresh_token(user, session_id=None, token_id=None, now=None):
+    token_id = token_id or str(uuid.uuid4())
+    now = now or timezone.now()
     exp = now + settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME']
 
     payload = {
@@ -45,11 +47,12 @@ def create_refresh_token(user):
         "exp": int(exp.timestamp()),
         "sub": str(user.id)
     }
+    if session_id:
+        payload["sid"] = session_id
 
     token = jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
 
     RefreshToken.objects.create(
-        token=token,
         user=user,
         token_id=token_id,
         created_at=now,
@@ -77,10 +80,13 @@ def decode_and_validate_token(token: str, expected_type: str):
         return None, "wrong_type"
 
     token_id = payload.get("jti")
-    if expected_type == "at":
-        token_obj = AccessToken.objects.filter(token=token, token_id=token_id).first()
-    else:
-        token_obj = RefreshToken.objects.filter(token=token, token_id=token_id).first()
+    token_cache = get_token_cache()
+    user = token_cache.get(expected_type, token_id)
+    if user is not None:
+        return user, "valid"
+
+    token_model = AccessToken if expected_type == "at" else RefreshToken
+    token_obj = token_model.objects.select_related('user').filter(token_id=token_id).first()
 
     if not token_obj or not token_obj.user.is_active:
         return None, "not_found"
@@ -88,4 +94,73 @@ def decode_and_validate_token(token: str, expected_type: str):
     if token_obj.is_expired():
         return None, "expired"
 
+    token_cache.set(expected_type, token_id, token_obj.user, payload["exp"])
     return token_obj.user, "valid"
+
+
+def get_token_payload(token: str):
+    """payload یک توکن با امضای معتبر (حتی منقضی شده) یا None"""
+    parts = token.split(' ')
+    if len(parts) == 2 and parts[0].lower() == "bearer":
+        token = parts[1]
+    try:
+        return jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM],
+                          options={"verify_exp": False})
+    except InvalidTokenError:
+        return None
+
+
+def get_token_id(token: str):
+    """jti یک توکن با امضای معتبر (حتی منقضی شده) یا None"""
+    payload = get_token_payload(token)
+    return payload.get("jti") if payload else None
+
+
+def create_session(user):
+    """
+    ساخت یک نشست (اکسس و رفرش توکن با sid مشترک) اگر سقف Role.count_access_token پر نشده باشد.
+    خروجی (access, refresh, session_id) یا None وقتی سقف نشست‌ها پر است.
+    """
+    session_id = str(uuid.uuid4())
+    access_id, refresh_id = str(uuid.uuid4()), str(uuid.uuid4())
+    now = timezone.now()
+    # نشست تا وقتی هر کدام از دو توکن زنده است در رجیستری می‌ماند تا لیست نشست‌ها و ابطال آن کار کند
+    expires_at = now + max(settings.SIMPLE_JWT['ACCESS_TOKEN_LIFETIME'], settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME'])
+    with transaction.atomic():
+        opened = SessionRegistry.open_session(
+            user, user.role.count_access_token, session_id, access_id, refresh_id, now, expires_at
+        )
+        if not opened:
+            return None
+        access = create_access_token(user, session_id=session_id, token_id=access_id, now=now)
+        refresh = create_refresh_token(user, session_id=session_id, token_id=refresh_id, now=now)
+    return access, refresh, session_id
+
+
+def revoke_session(user, session_id):
+    """ابطال هر دو توکن یک نشست و حذف آن از رجیستری؛ False اگر نشست وجود نداشت"""
+    item = SessionRegistry.close_session(user, session_id)
+    if item is None:
+        return False
+    if item.get('access'):
+        revoke_token(user, item['access'], 'at')
+    if item.get('refresh'):
+        revoke_token(user, item['refresh'], 'rt')
+    return True
+
+
+def revoke_token(user, token_id, token_type="at"):
+    """ابطال یک توکن کاربر (logout)"""
+    token_model = AccessToken if token_type == "at" else RefreshToken
+    deleted, _ = token_model.objects.filter(user=user, token_id=token_id).delete()
+    get_token_cache().invalidate(token_type, token_id, user.id)
+    return deleted
+
+
+def revoke_user_tokens(user):
+    """ابطال همه توکن‌های کاربر (خروج از همه نشست‌ها، غیرفعال شدن کاربر یا تغییر رمز)"""
+    deleted = AccessToken.objects.filter(user=user).delete()[0]
+    deleted += RefreshToken.objects.filter(user=user).delete()[0]
+    SessionRegistry.clear(user)
+    get_token_cache().invalidate_user(user.id)
+    return deleted
@@ -0,0 +1,165 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from rest_framework import status
+
+from user.models import CustomUser
+
+
+class LoginOverloaded(Exception):
+    """صف هش رمز عبور پر است یا پاسخ در زمان مجاز آماده نشد"""
+
+
+class PasswordHashPool:
+    """
+    اجرای check_password در یک استخر ترد محدود با کنترل پذیرش.
+    PBKDF2 در hashlib قفل GIL را آزاد می‌کند، پس تعداد ترد همان سقف مصرف CPU برای هش است.
+    اگر بیشتر از workers + queue درخواست در جریان باشد، درخواست جدید فوراً رد می‌شود
+    به جای اینکه ورکرهای gunicorn پشت هش‌ها صف بکشند.
+    """
+
+    def __init__(self, workers=None, queue=None, timeout=None):
+        self.workers = workers or getattr(settings, 'LOGIN_HASH_WORKERS', 2)
+        self.queue = queue if queue is not None else getattr(settings, 'LOGIN_HASH_QUEUE', 8)
+        self.timeout = timeout or getattr(settings, 'LOGIN_HASH_TIMEOUT', 5)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue)
+
+    def run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise LoginOverloaded()
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise LoginOverloaded()
+
+
+class LoginRateLimiter:
+    """
+    محدودیت پنجره ثابت روی کش جنگو (LocMem محلی یا Redis با REDIS_URL):
+    - هر IP: حداکثر LOGIN_IP_MAX_ATTEMPTS تلاش در LOGIN_IP_WINDOW ثانیه
+    - هر شناسه (نام کاربری/ایمیل): حداکثر LOGIN_IDENTIFIER_MAX_FAILURES تلاش ناموفق در LOGIN_IDENTIFIER_WINDOW ثانیه
+    """
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+        self.ip_max = getattr(settings, 'LOGIN_IP_MAX_ATTEMPTS', 30)
+        self.ip_window = getattr(settings, 'LOGIN_IP_WINDOW', 60)
+        self.identifier_max = getattr(settings, 'LOGIN_IDENTIFIER_MAX_FAILURES', 5)
+        self.identifier_window = getattr(settings, 'LOGIN_IDENTIFIER_WINDOW', 900)
+
+    @staticmethod
+    def _identifier_key(identifier):
+        return f'login:fail:{identifier.strip().lower()}'
+
+    def _hit(self, key, window):
+        if self.cache.add(key, 1, timeout=window):
+            return 1
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # کلید بین add و incr منقضی شد
+            self.cache.add(key, 1, timeout=window)
+            return 1
+
+    def allow_ip(self, ip):
+        """ثبت یک تلاش برای IP و بررسی سقف"""
+        if not ip:
+            return True
+        return self._hit(f'login:ip:{ip}', self.ip_window) <= self.ip_max
+
+    def identifier_blocked(self, identifier):
+        return self.cache.get(self._identifier_key(identifier), 0) >= self.identifier_max
+
+    def record_failure(self, identifier):
+        self._hit(self._identifier_key(identifier), self.identifier_window)
+
+    def reset(self, identifier):
+        self.cache.delete(self._identifier_key(identifier))
+
+
+class LoginPipeline:
+    """
+    ترتیب مراحل ورود از ارزان به گران:
+    محدودیت IP -> محدودیت شناسه -> جستجوی کاربر با ایندکس یکتا -> هش رمز در استخر محدود
+    خروجی (status, user) است و user فقط در حالت 200 مقدار دارد.
+    """
+
+    def __init__(self, pool=None, limiter=None):
+        self.pool = pool or PasswordHashPool()
+        self.limiter = limiter or LoginRateLimiter()
+
+    def authenticate(self, data, ip=None):
+        if not hasattr(data, 'get'):
+            return status.HTTP_400_BAD_REQUEST, None
+        identifier = data.get('username') or data.get('email')
+        password = data.get('password')
+
+        if not isinstance(identifier, str) or not isinstance(password, str) or not identifier or not password:
+            return status.HTTP_400_BAD_REQUEST, None
+
+        if not self.limiter.allow_ip(ip) or self.limiter.identifier_blocked(identifier):
+            return status.HTTP_429_TOO_MANY_REQUESTS, None
+
+        user = self.get_user(identifier)
+        try:
+            if user is None:
+                # هزینه زمانی یکسان برای کاربر ناموجود تا وجود نام کاربری لو نرود
+                self.pool.run(self._check_dummy, password)
+                valid = False
+            else:
+                valid = self.pool.run(user.check_password, password)
+        except LoginOverloaded:
+            return status.HTTP_503_SERVICE_UNAVAILABLE, None
+
+        if not valid or not user.is_active:
+            self.limiter.record_failure(identifier)
+            return status.HTTP_400_BAD_REQUEST, None
+
+        self.limiter.reset(identifier)
+        return status.HTTP_200_OK, user
+
+    @staticmethod
+    def get_user(identifier):
+        """نام کاربری @ ندارد (validate_username)، پس هر شناسه فقط یک ایندکس یکتا را می‌زند"""
+        lookup = {'email': identifier} if '@' in identifier else {'username': identifier}
+        return CustomUser.objects.select_related('role').filter(**lookup).first()
+
+    @staticmethod
+    def _check_dummy(password):
+        make_password(password)
+        return False
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_login_pipeline() -> LoginPipeline:
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = LoginPipeline()
+    return _pipeline
+
+
+def get_client_ip(request):
+    """
+    آخرین آدرس X-Forwarded-For (همان که روتر Heroku اضافه می‌کند) یا REMOTE_ADDR.
+    هدر فقط پشت پراکسی مطمئن (LOGIN_TRUST_X_FORWARDED_FOR) قبول می‌شود، وگرنه کلاینت می‌تواند IP را جعل کند.
+    """
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded and getattr(settings, 'LOGIN_TRUST_X_FORWARDED_FOR', False):
+        return forwarded.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR')
@@ -0,0 +1,53 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from authentication.hashers import TunablePBKDF2PasswordHasher
+
+
+class Command(BaseCommand):
+    help = 'اندازه‌گیری تعداد بررسی رمز در ثانیه برای مقادیر مختلف PASSWORD_PBKDF2_ITERATIONS و تعداد ترد'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', default='',
+                            help='تعداد تکرارها جدا شده با کاما؛ پیش‌فرض مقدار فعلی تنظیمات')
+        parser.add_argument('--threads', default='1,2,4', help='تعداد ترد همزمان (مثل LOGIN_HASH_WORKERS)')
+        parser.add_argument('--seconds', type=float, default=3, help='مدت هر دور')
+
+    def handle(self, *args, **options):
+        iterations_list = [int(x) for x in options['iterations'].split(',') if x] or [
+            settings.PASSWORD_PBKDF2_ITERATIONS
+        ]
+        threads_list = [int(x) for x in options['threads'].split(',')]
+
+        self.stdout.write(f'{"iterations":>12}{"threads":>9}{"checks/s":>11}{"ms/check":>11}')
+        for iterations in iterations_list:
+            with override_settings(PASSWORD_PBKDF2_ITERATIONS=iterations):
+                hasher = TunablePBKDF2PasswordHasher()
+                encoded = hasher.encode('bench-password', hasher.salt())
+                for threads in threads_list:
+                    checks, elapsed = self.run_round(hasher, encoded, threads, options['seconds'])
+                    self.stdout.write(
+                        f'{iterations:>12}{threads:>9}{checks / elapsed:>11.1f}{elapsed * 1000 * threads / checks:>11.1f}'
+                    )
+
+    @staticmethod
+    def run_round(hasher, encoded, threads, seconds):
+        counts = [0] * threads
+        deadline = time.perf_counter() + seconds
+
+        def worker(index):
+            while time.perf_counter() < deadline:
+                hasher.verify('bench-password', encoded)
+                counts[index] += 1
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return sum(counts), time.perf_counter() - start
@@ -0,0 +1,47 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from authentication.models import AccessToken, RefreshToken, SessionRegistry, TokenRevocation
+
+
+class Command(BaseCommand):
+    help = 'حذف توکن‌های منقضی شده در دسته‌های محدود (با --loop به صورت دوره‌ای)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='تعداد ردیف حذف شده در هر دستور DELETE')
+        parser.add_argument('--pause', type=float, default=0.05, help='مکث بین دسته‌ها (ثانیه) برای آزاد شدن قفل‌ها')
+        parser.add_argument('--loop', type=int, default=0, help='اجرای دوره‌ای با این فاصله (ثانیه)؛ صفر یعنی یک بار')
+
+    def handle(self, *args, **options):
+        while True:
+            for model in (AccessToken, RefreshToken):
+                deleted = self.purge(model, options['batch_size'], options['pause'])
+                self.stdout.write(f'{model.__name__}: {deleted} expired tokens deleted')
+            deleted = SessionRegistry.prune_expired(options['batch_size'])
+            self.stdout.write(f'SessionRegistry: {deleted} expired sessions deleted')
+            # ابطال‌ها فقط تا وقتی لازم‌اند که ورودی کش قبل از آن‌ها هنوز می‌تواند زنده باشد
+            keep = timedelta(seconds=2 * getattr(settings, 'JWT_VALIDATION_CACHE_TTL', 300))
+            deleted = self.purge(TokenRevocation, options['batch_size'], options['pause'],
+                                 created_at__lte=timezone.now() - keep)
+            self.stdout.write(f'TokenRevocation: {deleted} old revocations deleted')
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
+
+    @staticmethod
+    def purge(model, batch_size, pause, **expired):
+        """حذف با کلید اصلی در دسته‌های batch_size روی ایندکس expires_at (یا فیلتر expired)"""
+        total = 0
+        expired = expired or {'expires_at__lte': timezone.now()}
+        while True:
+            ids = list(model.objects.filter(**expired).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return total
+            total += model.objects.filter(id__in=ids).delete()[0]
+            if len(ids) < batch_size:
+                return total
+            time.sleep(pause)
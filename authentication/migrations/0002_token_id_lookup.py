@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:45
+
+from django.db import migrations, models
+from django.db.models import Max
+from django.utils import timezone
+
+
+def purge_and_dedupe_tokens(apps, schema_editor):
+    """حذف توکن‌های منقضی و تکراری‌های token_id قبل از یکتا شدن ستون"""
+    for model_name in ('AccessToken', 'RefreshToken'):
+        model = apps.get_model('authentication', model_name)
+        model.objects.filter(expires_at__lte=timezone.now()).delete()
+        duplicates = model.objects.values('token_id').annotate(keep_id=Max('id')).filter(
+            token_id__in=model.objects.values('token_id').annotate(
+                n=models.Count('id')).filter(n__gt=1).values('token_id')
+        )
+        for row in duplicates:
+            model.objects.filter(token_id=row['token_id']).exclude(id=row['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(purge_and_dedupe_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='accesstoken',
+            name='token',
+        ),
+        migrations.RemoveField(
+            model_name='refreshtoken',
+            name='token',
+        ),
+        migrations.AlterField(
+            model_name='accesstoken',
+            name='token_id',
+            field=models.CharField(max_length=36, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='refreshtoken',
+            name='token_id',
+            field=models.CharField(max_length=36, unique=True),
+        ),
+    ]
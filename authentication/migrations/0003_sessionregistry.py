@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:46
+
+import django.db.models.deletion
+from django.utils import timezone
+from django.db import migrations, models
+
+
+def backfill_session_registry(apps, schema_editor):
+    """هر رفرش توکن زنده قبلی یک نشست حساب می‌شد (active_sessions_count)"""
+    RefreshToken = apps.get_model('authentication', 'RefreshToken')
+    SessionRegistry = apps.get_model('authentication', 'SessionRegistry')
+    registries = {}
+    live = RefreshToken.objects.filter(expires_at__gt=timezone.now()).order_by('user_id', 'id')
+    for token in live.iterator():
+        sessions = registries.setdefault(token.user_id, {})
+        sessions[token.token_id] = {
+            'access': None,
+            'refresh': token.token_id,
+            'created_at': token.created_at.timestamp(),
+            'expires_at': token.expires_at.timestamp(),
+        }
+    SessionRegistry.objects.bulk_create(
+        [SessionRegistry(user_id=user_id, sessions=sessions, count=len(sessions))
+         for user_id, sessions in registries.items()],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0002_token_id_lookup'),
+        ('user', '0007_customuser_can_message_me'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionRegistry',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='session_registry', serialize=False, to='user.customuser')),
+                ('sessions', models.JSONField(default=dict)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Session Registry',
+                'verbose_name_plural': 'Session Registries',
+            },
+        ),
+        migrations.RunPython(backfill_session_registry, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0003_sessionregistry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenRevocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.PositiveBigIntegerField()),
+                ('token_type', models.CharField(blank=True, max_length=2)),
+                ('token_id', models.CharField(blank=True, max_length=36)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Token Revocation',
+                'verbose_name_plural': 'Token Revocations',
+            },
+        ),
+    ]
@@ -1,15 +1,16 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from user.models import CustomUser
 from django.utils import timezone
 
 
 class AccessToken(models.Model):
-    token = models.CharField(max_length=512, unique=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField(db_index=True)
     token_type = models.CharField(max_length=2, default='at', editable=False)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='access_tokens', db_index=True)
-    token_id = models.CharField(max_length=128, db_index=True)
+    token_id = models.CharField(max_length=36, unique=True)  # jti توکن؛ خود JWT ذخیره نمی‌شود
 
     def __str__(self):
         return f'{self.user.username} - Access Token (expires {self.expires_at})'
@@ -23,12 +24,11 @@ class AccessToken(models.Model):
 
 
 class RefreshToken(models.Model):
-    token = models.CharField(max_length=512, unique=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField(db_index=True)
     token_type = models.CharField(max_length=2, default='rt', editable=False)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='refresh_tokens', db_index=True)
-    token_id = models.CharField(max_length=128, db_index=True)
+    token_id = models.CharField(max_length=36, unique=True)  # jti توکن؛ خود JWT ذخیره نمی‌شود
 
     def __str__(self):
         return f'{self.user.username} - Refresh Token (expires {self.expires_at})'
@@ -39,3 +39,122 @@ class RefreshToken(models.Model):
     class Meta:
         verbose_name = 'Refresh Token'
         verbose_name_plural = 'Refresh Tokens'
+
+
+class SessionRegistry(models.Model):
+    """
+    رجیستری فشرده نشست‌های فعال هر کاربر: یک ردیف برای هر کاربر با شمارنده و
+    نشست‌ها به شکل {session_id: {'access': jti, 'refresh': jti, 'created_at': epoch, 'expires_at': epoch}}.
+    بررسی سقف نشست در ورود با قفل همین یک ردیف انجام می‌شود، بدون COUNT روی جدول توکن‌ها.
+    """
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True,
+                                related_name='session_registry')
+    sessions = models.JSONField(default=dict)
+    count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.user_id} - {self.count} sessions'
+
+    class Meta:
+        verbose_name = 'Session Registry'
+        verbose_name_plural = 'Session Registries'
+
+    def prune(self, now=None):
+        """حذف نشست‌های منقضی از رجیستری؛ True اگر چیزی حذف شد"""
+        now = (now or timezone.now()).timestamp()
+        live = {sid: item for sid, item in self.sessions.items() if item['expires_at'] > now}
+        changed = len(live) != len(self.sessions)
+        self.sessions = live
+        self.count = len(live)
+        return changed
+
+    def live_sessions(self):
+        now = timezone.now().timestamp()
+        return {sid: item for sid, item in self.sessions.items() if item['expires_at'] > now}
+
+    @classmethod
+    def locked_for(cls, user):
+        """ردیف رجیستری کاربر با قفل؛ باید داخل transaction.atomic صدا زده شود"""
+        cls.objects.get_or_create(user=user)
+        return cls.objects.select_for_update().get(user=user)
+
+    @classmethod
+    def open_session(cls, user, limit, session_id, access_id, refresh_id, created_at, expires_at):
+        """ثبت نشست جدید اگر تعداد نشست‌های زنده کمتر از limit باشد"""
+        with transaction.atomic():
+            registry = cls.locked_for(user)
+            registry.prune()
+            if registry.count >= limit:
+                registry.save(update_fields=['sessions', 'count', 'updated_at'])
+                return False
+            registry.sessions[session_id] = {
+                'access': access_id,
+                'refresh': refresh_id,
+                'created_at': created_at.timestamp(),
+                'expires_at': expires_at.timestamp(),
+            }
+            registry.count = len(registry.sessions)
+            registry.save(update_fields=['sessions', 'count', 'updated_at'])
+            return True
+
+    @classmethod
+    def close_session(cls, user, session_id):
+        """حذف نشست از رجیستری و برگرداندن اطلاعات آن (یا None)"""
+        with transaction.atomic():
+            registry = cls.locked_for(user)
+            item = registry.sessions.pop(session_id, None)
+            registry.prune()
+            registry.save(update_fields=['sessions', 'count', 'updated_at'])
+        return item
+
+    @classmethod
+    def prune_expired(cls, batch_size=1000):
+        """حذف نشست‌های منقضی از رجیستری همه کاربران؛ تعداد نشست‌های حذف شده"""
+        total = 0
+        user_ids = list(cls.objects.exclude(count=0).values_list('user_id', flat=True))
+        for start in range(0, len(user_ids), batch_size):
+            with transaction.atomic():
+                for registry in cls.objects.select_for_update().filter(user_id__in=user_ids[start:start + batch_size]):
+                    before = registry.count
+                    if registry.prune():
+                        registry.save(update_fields=['sessions', 'count', 'updated_at'])
+                        total += before - registry.count
+        return total
+
+    @classmethod
+    def clear(cls, user):
+        cls.objects.filter(user=user).update(sessions={}, count=0, updated_at=timezone.now())
+
+
+class TokenRevocation(models.Model):
+    """
+    ابطال‌های اخیر توکن برای همگام کردن کش اعتبارسنجی پروسس‌ها (authentication/token_cache.py).
+    token_id خالی یعنی همه توکن‌های کاربر. بعد از JWT_VALIDATION_CACHE_TTL بی‌اثر است و
+    purge_expired_tokens حذفش می‌کند. user_id کلید خارجی نیست تا ابطال کاربر حذف شده هم بماند.
+    """
+    user_id = models.PositiveBigIntegerField()
+    token_type = models.CharField(max_length=2, blank=True)
+    token_id = models.CharField(max_length=36, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.user_id} - {self.token_type or "all"} {self.token_id}'
+
+    class Meta:
+        verbose_name = 'Token Revocation'
+        verbose_name_plural = 'Token Revocations'
+
+
+@receiver(post_save, sender=CustomUser)
+def revoke_inactive_user_tokens(sender, instance, **kwargs):
+    """کاربر غیرفعال شده تا پایان TTL از کش اعتبارسنجی پروسس‌ها پذیرفته نشود"""
+    if not instance.is_active and not kwargs.get('created'):
+        from authentication.token_cache import get_token_cache
+        get_token_cache().invalidate_user(instance.id)
+
+
+@receiver(post_delete, sender=CustomUser)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    from authentication.token_cache import get_token_cache
+    get_token_cache().invalidate_user(instance.id)
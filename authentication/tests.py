@@ -1,3 +1,30 @@
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from authentication import jwt
+from authentication.models import SessionRegistry
+from setting.models import Role
+from user.models import CustomUser
+
+
+class LogoutTests(TestCase):
+    """خروج همیشه توکن ارائه شده را باطل می‌کند، حتی اگر نشست آن در رجیستری نباشد"""
+
+    def setUp(self):
+        role = Role.objects.create(name='member', dev_name='member', count_access_token=5)
+        self.user = CustomUser.objects.create(username='user', email='user@test.local', phone='phone-user',
+                                              full_name='user', role=role)
+        self.access, self.refresh, self.session_id = jwt.create_session(self.user)
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {self.access}'}
+
+    def test_session_outlives_refresh_token(self):
+        registry = SessionRegistry.objects.get(user=self.user)
+        access_exp = jwt.get_token_payload(self.access)['exp']
+        self.assertGreaterEqual(registry.sessions[self.session_id]['expires_at'], access_exp - 1)
+
+    def test_logout_without_registry_entry_revokes_tokens(self):
+        self.assertEqual(self.client.get(reverse('sessions'), **self.headers).status_code, 200)
+        SessionRegistry.clear(self.user)
+        response = self.client.post(reverse('logout'), {'refresh': self.refresh}, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('sessions'), **self.headers).status_code, 400)
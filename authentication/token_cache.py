@@ -0,0 +1,118 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+
+class ValidatedTokenCache:
+    """
+    کش داخل پروسس توکن‌های اعتبارسنجی شده با کلید (نوع توکن، jti).
+    عمر هر ورودی حداکثر تا exp توکن و JWT_VALIDATION_CACHE_TTL ثانیه است.
+
+    ابطال: هر logout / revoke / غیرفعال یا حذف شدن کاربر یک ردیف TokenRevocation در دیتابیس
+    می‌نویسد. هر پروسس حداکثر هر JWT_REVOCATION_SYNC_INTERVAL ثانیه ردیف‌های جدید را
+    (با یک کوئری روی ایندکس created_at) می‌خواند و فقط همان jti یا توکن‌های همان کاربر را
+    از کش خودش حذف می‌کند؛ پس بدون REDIS_URL هم بین پروسس‌ها درست کار می‌کند.
+    با JWT_REVOCATION_SYNC_INTERVAL = 0 این بررسی در هر درخواست انجام می‌شود.
+    """
+
+    # ردیف‌هایی که دیرتر از زمان created_at خود commit شده‌اند هم دیده شوند
+    sync_overlap = 5
+
+    def __init__(self, max_size=None, ttl=None, sync_interval=None):
+        self.max_size = max_size or getattr(settings, 'JWT_VALIDATION_CACHE_SIZE', 10000)
+        self.ttl = ttl or getattr(settings, 'JWT_VALIDATION_CACHE_TTL', 300)
+        self.sync_interval = sync_interval if sync_interval is not None else getattr(
+            settings, 'JWT_REVOCATION_SYNC_INTERVAL', 1
+        )
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self._next_sync = 0
+
+    def get(self, token_type, token_id):
+        """برگرداندن یک کپی از کاربر ذخیره شده یا None"""
+        self._sync_revocations()
+        key = (token_type, token_id)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # هر درخواست کپی خودش را می‌گیرد تا تغییرات یک view به بقیه نشت نکند
+        return copy.copy(user)
+
+    def set(self, token_type, token_id, user, exp):
+        expires_at = min(exp, time.time() + self.ttl)
+        with self._lock:
+            self._entries[(token_type, token_id)] = (copy.copy(user), expires_at)
+            self._entries.move_to_end((token_type, token_id))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token_type, token_id, user_id):
+        from authentication.models import TokenRevocation
+
+        self._evict_token(token_type, token_id)
+        TokenRevocation.objects.create(user_id=user_id, token_type=token_type, token_id=token_id)
+
+    def invalidate_user(self, user_id):
+        from authentication.models import TokenRevocation
+
+        self._evict_user(user_id)
+        TokenRevocation.objects.create(user_id=user_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict_token(self, token_type, token_id):
+        with self._lock:
+            self._entries.pop((token_type, token_id), None)
+
+    def _evict_user(self, user_id):
+        with self._lock:
+            for key in [key for key, (user, _) in self._entries.items() if user.id == user_id]:
+                del self._entries[key]
+
+    def _sync_revocations(self):
+        from authentication.models import TokenRevocation
+
+        now = time.monotonic()
+        if now < self._next_sync:
+            return
+        self._next_sync = now + self.sync_interval
+        started = timezone.now()
+        if self._synced_at is not None:
+            revocations = TokenRevocation.objects.filter(
+                created_at__gte=self._synced_at - timedelta(seconds=self.sync_overlap)
+            ).values_list('user_id', 'token_type', 'token_id')
+            for user_id, token_type, token_id in revocations:
+                if token_id:
+                    self._evict_token(token_type, token_id)
+                else:
+                    self._evict_user(user_id)
+        # بار اول کش خالی است و چیزی برای حذف نیست
+        self._synced_at = started
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache() -> ValidatedTokenCache:
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                _token_cache = ValidatedTokenCache()
+    return _token_cache
@@ -4,6 +4,9 @@ from authentication import views
 urlpatterns = [
     path('', views.UserAPIView.as_view(), name='user'),
     path('/login', views.LoginAPIView.as_view(), name='login'),
+    path('/logout', views.LogoutAPIView.as_view(), name='logout'),
+    path('/sessions', views.SessionAPIView.as_view(), name='sessions'),
+    path('/sessions/<str:session_id>', views.SessionAPIView.as_view(), name='session-revoke'),
     # path('/token', views.RefreshTokenAPIView.as_view(), name='refresh_token'),
     path('/register', views.RegisterAPIView.as_view(), name='register'),
     # path('/verify', views.VerifyPhoneNumberAPIView.as_view(), name='verify'),
@@ -1,13 +1,17 @@
+from datetime import datetime, timezone as dt_timezone
+
 from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django.http import HttpRequest
-from authentication import auth
 from HooshaAI.settings import CUSTOM_ACCESS_TOKEN_NAME
 from rest_framework.response import Response
 from authentication.serializers import UserViewSerializer, CustomUserCreateSerializer
 from rest_framework import status
 from authentication import jwt
+from authentication.models import SessionRegistry
+from authentication.login import get_login_pipeline, get_client_ip
+from user.presence import get_presence
 
 
 class UserAPIView(APIView):
@@ -60,8 +64,8 @@ class UserAPIView(APIView):
         },
     )
     def get(self, request: HttpRequest):
-        user = auth.get_authenticated_user_from_request(request)
-        if user:
+        user = request.user
+        if user.is_authenticated:
             try:
                 serializer = UserViewSerializer(user)
                 return Response(data={'user': serializer.data}, status=status.HTTP_200_OK)
@@ -112,6 +116,28 @@ class LoginAPIView(APIView):
                     "application/json": "Login Failed"
                 }
             ),
+            429: openapi.Response(
+                description="تعداد تلاش ورود از این IP یا برای این نام کاربری بیش از حد مجاز است",
+                examples={
+                    "application/json": {
+                        'errors': {
+                            'fa': ['تعداد تلاش‌های ورود بیش از حد مجاز است! لطفا چند دقیقه دیگر دوباره تلاش کنید!'],
+                            'en': ['Too many login attempts! Please try again in a few minutes!']
+                        }
+                    }
+                }
+            ),
+            503: openapi.Response(
+                description="صف بررسی رمز عبور پر است؛ کمی بعد دوباره تلاش کنید",
+                examples={
+                    "application/json": {
+                        'errors': {
+                            'fa': ['سرور در حال حاضر مشغول است! لطفا چند ثانیه دیگر دوباره تلاش کنید!'],
+                            'en': ['The server is busy right now! Please try again in a few seconds!']
+                        }
+                    }
+                }
+            ),
             200: openapi.Response(
                 description="اکسس توکن و رفرش توکن . ",
                 examples={
@@ -143,7 +169,23 @@ class LoginAPIView(APIView):
         },
     )
     def post(self, request):
-        user = auth.authenticate_user(request.data)
+        login_status, user = get_login_pipeline().authenticate(request.data, get_client_ip(request))
+        if login_status == status.HTTP_429_TOO_MANY_REQUESTS:
+            data = {
+                'errors': {
+                    'fa': ['تعداد تلاش‌های ورود بیش از حد مجاز است! لطفا چند دقیقه دیگر دوباره تلاش کنید!', ],
+                    'en': ['Too many login attempts! Please try again in a few minutes!', ]
+                }
+            }
+            return Response(data, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        if login_status == status.HTTP_503_SERVICE_UNAVAILABLE:
+            data = {
+                'errors': {
+                    'fa': ['سرور در حال حاضر مشغول است! لطفا چند ثانیه دیگر دوباره تلاش کنید!', ],
+                    'en': ['The server is busy right now! Please try again in a few seconds!', ]
+                }
+            }
+            return Response(data, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         if not user:
             data = {
                 'errors': {
@@ -152,7 +194,8 @@ class LoginAPIView(APIView):
                 }
             }
             return Response(data, status=status.HTTP_400_BAD_REQUEST)
-        if user.active_sessions_count() >= user.role.count_access_token:
+        session = jwt.create_session(user)
+        if session is None:
             data = {
                 'errors': {
                         'fa': ['ورود ناموفق! تعداد نشست های ممکن شما تکمیل شده است! لطفا ابتدا یکی را غیرفعال کنید تا امکان ورود جدید اضافه شود!', ],
@@ -160,9 +203,238 @@ class LoginAPIView(APIView):
                 }
             }
             return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        access, refresh, session_id = session
+        data = {
+            'access': access,
+            'refresh': refresh,
+            'session_id': session_id,
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class LogoutAPIView(APIView):
+
+    @swagger_auto_schema(
+        operation_description="خروج از نشست فعلی و ابطال اکسس توکن (و رفرش توکن در صورت ارسال) .\nبا all=true همه نشست‌های کاربر باطل می‌شوند",
+        manual_parameters=[
+            openapi.Parameter(
+                CUSTOM_ACCESS_TOKEN_NAME,
+                openapi.IN_HEADER,
+                description="توکن احراز هویت کاربر",
+                type=openapi.TYPE_STRING,
+                required=True
+            ),
+        ],
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'refresh': openapi.Schema(type=openapi.TYPE_STRING, description='رفرش توکن همین نشست'),
+                'all': openapi.Schema(type=openapi.TYPE_BOOLEAN, description='خروج از همه نشست‌ها',
+                                      default=False),
+            },
+        ),
+        responses={
+            400: openapi.Response(
+                description="نشست نامعتبر",
+                examples={
+                    "application/json": {
+                        'errors': {
+                            'fa': ['نشست شما اعتبار ندارد مجددا وارد شوید!'],
+                            'en': ['Your session is invalid. Please log in again!']
+                        }
+                    }
+                }
+            ),
+            200: openapi.Response(
+                description="خروج موفق",
+                examples={
+                    "application/json": {
+                        'message': {
+                            'fa': 'با موفقیت خارج شدید.',
+                            'en': 'You have been logged out successfully.'
+                        }
+                    }
+                }
+            )
+        },
+    )
+    def post(self, request):
+        user = request.user
+        if not user.is_authenticated:
+            data = {
+                'errors': {
+                    'fa': ['نشست شما اعتبار ندارد مجددا وارد شوید!', ],
+                    'en': ['Your session is invalid. Please log in again!', ]
+                }
+            }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+
+        payload = jwt.get_token_payload(request.headers.get(CUSTOM_ACCESS_TOKEN_NAME))
+        if str(request.data.get('all', '')).lower() in ('true', '1'):
+            jwt.revoke_user_tokens(user)
+        elif not (payload.get('sid') and jwt.revoke_session(user, payload['sid'])):
+            # توکن‌های قدیمی بدون sid یا نشستی که در رجیستری نیست؛ خود توکن‌های ارائه شده باطل می‌شوند
+            jwt.revoke_token(user, payload.get('jti'), 'at')
+            refresh = request.data.get('refresh')
+            refresh_id = jwt.get_token_id(refresh) if refresh else None
+            if refresh_id:
+                jwt.revoke_token(user, refresh_id, 'rt')
+        get_presence().set_offline_if_idle(user.id)
+
+        data = {
+            'message': {
+                'fa': 'با موفقیت خارج شدید.',
+                'en': 'You have been logged out successfully.'
+            }
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class SessionAPIView(APIView):
+
+    @swagger_auto_schema(
+        operation_description="لیست نشست‌های فعال کاربر .",
+        manual_parameters=[
+            openapi.Parameter(
+                CUSTOM_ACCESS_TOKEN_NAME,
+                openapi.IN_HEADER,
+                description="توکن احراز هویت کاربر",
+                type=openapi.TYPE_STRING,
+                required=True
+            ),
+        ],
+        responses={
+            400: openapi.Response(
+                description="نشست نامعتبر",
+                examples={
+                    "application/json": {
+                        'errors': {
+                            'fa': ['نشست شما اعتبار ندارد مجددا وارد شوید!'],
+                            'en': ['Your session is invalid. Please log in again!']
+                        }
+                    }
+                }
+            ),
+            200: openapi.Response(
+                description="نشست‌های فعال؛ current نشست همین درخواست است",
+                examples={
+                    "application/json": {
+                        'count': 1,
+                        'limit': 2,
+                        'sessions': [
+                            {
+                                'session_id': '2059c0c8-9fac-43bc-9da3-8365742c77d1',
+                                'created_at': '2025-06-14T18:04:59+00:00',
+                                'expires_at': '2025-07-14T18:04:59+00:00',
+                                'current': True
+                            }
+                        ]
+                    }
+                }
+            )
+        },
+    )
+    def get(self, request):
+        user = request.user
+        if not user.is_authenticated:
+            data = {
+                'errors': {
+                    'fa': ['نشست شما اعتبار ندارد مجددا وارد شوید!', ],
+                    'en': ['Your session is invalid. Please log in again!', ]
+                }
+            }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+
+        payload = jwt.get_token_payload(request.headers.get(CUSTOM_ACCESS_TOKEN_NAME)) or {}
+        registry = SessionRegistry.objects.filter(user=user).first()
+        sessions = registry.live_sessions() if registry else {}
         data = {
-            'access': jwt.create_access_token(user),
-            'refresh': jwt.create_refresh_token(user),
+            'count': len(sessions),
+            'limit': user.role.count_access_token,
+            'sessions': [
+                {
+                    'session_id': session_id,
+                    'created_at': datetime.fromtimestamp(item['created_at'], tz=dt_timezone.utc).isoformat(),
+                    'expires_at': datetime.fromtimestamp(item['expires_at'], tz=dt_timezone.utc).isoformat(),
+                    'current': session_id == payload.get('sid'),
+                }
+                for session_id, item in sorted(sessions.items(), key=lambda x: x[1]['created_at'], reverse=True)
+            ]
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_description="ابطال یکی از نشست‌های کاربر با session_id .",
+        manual_parameters=[
+            openapi.Parameter(
+                CUSTOM_ACCESS_TOKEN_NAME,
+                openapi.IN_HEADER,
+                description="توکن احراز هویت کاربر",
+                type=openapi.TYPE_STRING,
+                required=True
+            ),
+        ],
+        responses={
+            400: openapi.Response(
+                description="نشست نامعتبر",
+                examples={
+                    "application/json": {
+                        'errors': {
+                            'fa': ['نشست شما اعتبار ندارد مجددا وارد شوید!'],
+                            'en': ['Your session is invalid. Please log in again!']
+                        }
+                    }
+                }
+            ),
+            404: openapi.Response(
+                description="نشستی با این شناسه پیدا نشد",
+                examples={
+                    "application/json": {
+                        'errors': {
+                            'fa': ['نشست مورد نظر پیدا نشد!'],
+                            'en': ['Session not found!']
+                        }
+                    }
+                }
+            ),
+            200: openapi.Response(
+                description="نشست باطل شد",
+                examples={
+                    "application/json": {
+                        'message': {
+                            'fa': 'نشست با موفقیت باطل شد.',
+                            'en': 'The session has been revoked successfully.'
+                        }
+                    }
+                }
+            )
+        },
+    )
+    def delete(self, request, session_id):
+        user = request.user
+        if not user.is_authenticated:
+            data = {
+                'errors': {
+                    'fa': ['نشست شما اعتبار ندارد مجددا وارد شوید!', ],
+                    'en': ['Your session is invalid. Please log in again!', ]
+                }
+            }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+
+        if not jwt.revoke_session(user, session_id):
+            data = {
+                'errors': {
+                    'fa': ['نشست مورد نظر پیدا نشد!', ],
+                    'en': ['Session not found!', ]
+                }
+            }
+            return Response(data, status=status.HTTP_404_NOT_FOUND)
+
+        data = {
+            'message': {
+                'fa': 'نشست با موفقیت باطل شد.',
+                'en': 'The session has been revoked successfully.'
+            }
         }
         return Response(data, status=status.HTTP_200_OK)
 
@@ -0,0 +1,161 @@
+import json
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from rest_framework.utils.encoders import JSONEncoder
+
+from django.db.models import F
+
+from chat.delivery import fanout_chat_types, is_fanout_chat
+from chat.models import ChatRoom, Participant
+from chat.realtime import room_group, user_group
+from user.presence import get_presence
+
+
+class ChatRoomConsumer(AsyncJsonWebsocketConsumer):
+    """
+    دروازه لحظه‌ای چت: هر اتصال عضو گروه همه چت‌های کاربر (یا فقط chat_id آدرس) می‌شود
+    و پیام‌های جدید بعد از commit از chat.realtime به آن فرستاده می‌شوند.
+    کانال‌ها (CH/BC) در اتصال همه چت‌ها گروه ندارند؛ اعلان فشرده آن‌ها از chat.delivery
+    به گروه شخصی کاربر می‌آید و تعداد خوانده نشده آن‌ها هنگام اتصال یک‌جا فرستاده می‌شود.
+    پیام‌های کلاینت:
+        {"action": "ping"}  heartbeat حضور
+        {"action": "subscribe", "chat_id": 1} / {"action": "unsubscribe", "chat_id": 1}
+    """
+
+    async def connect(self):
+        self.user = self.scope.get('user')
+        if self.user is None or not self.user.is_authenticated:
+            await self.close(code=4001)
+            return
+
+        chat_id = self.scope['url_route']['kwargs'].get('chat_id')
+        self.chat_id = chat_id
+        chat_ids = await self.get_chat_ids(chat_id, include_fanout=chat_id is not None)
+        if chat_id is not None and not chat_ids:
+            await self.close(code=4003)
+            return
+
+        self.groups_joined = set()
+        # فقط اتصال‌های همه چت‌ها باید عضویت‌های جدید و اعلان کانال‌ها را بگیرند
+        if chat_id is None:
+            await self.join_group(user_group(self.user.id))
+        for joined_chat_id in chat_ids:
+            await self.join_group(room_group(joined_chat_id))
+        await self.accept()
+        self.presence_opened = True
+        await database_sync_to_async(get_presence().connection_opened)(self.user.id)
+        if chat_id is None:
+            unread = await self.get_fanout_unread()
+            if unread:
+                await self.send_json({'type': 'unread', 'chats': unread})
+
+    async def disconnect(self, close_code):
+        for group in getattr(self, 'groups_joined', ()):
+            await self.channel_layer.group_discard(group, self.channel_name)
+        if getattr(self, 'presence_opened', False):
+            await database_sync_to_async(get_presence().connection_closed)(self.user.id)
+
+    async def receive_json(self, content, **kwargs):
+        if not isinstance(content, dict):
+            await self.send_json({'type': 'error', 'errors': {
+                'fa': ['پیام نامعتبر است!'],
+                'en': ['Invalid message!'],
+            }})
+            return
+        action = content.get('action')
+        if action == 'ping':
+            await database_sync_to_async(get_presence().heartbeat)(self.user.id)
+            await self.send_json({'type': 'pong'})
+        elif action == 'subscribe':
+            chat_ids = await self.get_chat_ids(content.get('chat_id'))
+            if not chat_ids:
+                await self.send_json({'type': 'error', 'errors': {
+                    'fa': ['شما عضو این چت نیستید!'],
+                    'en': ['You are not a member of this chat!'],
+                }})
+                return
+            await self.join_group(room_group(chat_ids[0]))
+            await self.send_json({'type': 'subscribed', 'chat_id': chat_ids[0]})
+        elif action == 'unsubscribe':
+            group = room_group(content.get('chat_id'))
+            if group in self.groups_joined:
+                await self.channel_layer.group_discard(group, self.channel_name)
+                self.groups_joined.discard(group)
+            await self.send_json({'type': 'unsubscribed', 'chat_id': content.get('chat_id')})
+
+    async def join_group(self, group):
+        await self.channel_layer.group_add(group, self.channel_name)
+        self.groups_joined.add(group)
+
+    @database_sync_to_async
+    def get_chat_ids(self, chat_id=None, include_fanout=True):
+        queryset = Participant.objects.filter(user_id=self.user.id).exclude(role='BA')
+        if not include_fanout:
+            queryset = queryset.exclude(chat__type__in=fanout_chat_types())
+        if chat_id is not None:
+            try:
+                queryset = queryset.filter(chat_id=int(chat_id))
+            except (TypeError, ValueError):
+                return []
+        return list(queryset.values_list('chat_id', flat=True))
+
+    @database_sync_to_async
+    def get_fanout_unread(self):
+        """یک به‌روزرسانی «N پیام جدید» برای همه کانال‌هایی که کاربر در نبودش پست داشته‌اند"""
+        # last_sequence فقط پیش‌فیلتر ارزان است؛ شمارش از پیام‌های حذف نشده ثبت شده
+        rows = Participant.objects.filter(
+            user_id=self.user.id, chat__type__in=fanout_chat_types(),
+            chat__last_sequence__gt=F('last_read_sequence')
+        ).exclude(role='BA').annotate(
+            unread=Participant.unread_count_expression(), committed=ChatRoom.committed_sequence()
+        ).filter(unread__gt=0).values_list('chat_id', 'unread', 'committed')[:500]
+        return [
+            {'chat_id': chat_id, 'unread_count': unread, 'last_sequence': last_sequence}
+            for chat_id, unread, last_sequence in rows
+        ]
+
+    # رویدادهای channel layer
+
+    async def chat_message(self, event):
+        await self.send_json({
+            'type': 'message',
+            'chat_id': event['chat_id'],
+            'messages': event['messages'],
+        })
+
+    async def chat_joined(self, event):
+        if not is_fanout_chat(event.get('chat_type')):
+            await self.join_group(room_group(event['chat_id']))
+        await self.send_json({'type': 'joined', 'chat_id': event['chat_id']})
+
+    async def chat_removed(self, event):
+        """کاربر از چت حذف یا بن شد؛ دیگر پیام‌های آن نباید به این اتصال برسد"""
+        if event['user_id'] != self.user.id:
+            return
+        group = room_group(event['chat_id'])
+        if group in self.groups_joined:
+            await self.channel_layer.group_discard(group, self.channel_name)
+            self.groups_joined.discard(group)
+        await self.send_json({'type': 'removed', 'chat_id': event['chat_id']})
+        if self.chat_id is not None:
+            # اتصال مخصوص همین چت بود
+            await self.close(code=4003)
+
+    async def chat_update(self, event):
+        """اعلان فشرده پست(های) جدید کانال"""
+        await self.send_json({
+            'type': 'channel_update',
+            'chat_id': event['chat_id'],
+            'count': event['count'],
+            'message_id': event['message_id'],
+            'sequence_number': event['sequence_number'],
+            'message_type': event['message_type'],
+            'preview': event['preview'],
+            'date': event['date'],
+        })
+
+    @classmethod
+    async def encode_json(cls, content):
+        # تاریخ و UUID سریالایزرهای DRF
+        return json.dumps(content, cls=JSONEncoder, ensure_ascii=False)
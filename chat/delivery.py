@@ -0,0 +1,247 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from chat.realtime import group_send, user_group
+from user.presence import get_presence
+
+logger = logging.getLogger(__name__)
+
+
+def fanout_chat_types():
+    return getattr(settings, 'CHAT_FANOUT_TYPES', ('CH', 'BC'))
+
+
+def is_fanout_chat(chat_type):
+    """کانال‌ها و برادکست‌ها با موتور تحویل ارسال می‌شوند، نه با UPDATE همه اعضا در هر پیام"""
+    return chat_type in fanout_chat_types()
+
+
+class ChannelDeliveryEngine:
+    """
+    تحویل پست‌های کانال (CH/BC) بعد از commit در یک ترد پس‌زمینه:
+    - پست‌های پشت سر هم هر چت در حافظه با هم ادغام می‌شوند (حافظه: یک ورودی برای هر چت فعال)
+    - اعضا با keyset روی id در دسته‌های CHAT_DELIVERY_BATCH_SIZE خوانده می‌شوند و فقط (id, user_id) لود می‌شود
+    - اعضای آنلاین (presence) یک نوتیفیکیشن فشرده در گروه شخصی خود می‌گیرند
+    - برای اعضای آفلاین فقط inbox_date نوشته می‌شود؛ «N پیام جدید» از اشاره‌گر last_read_sequence
+      به دست می‌آید و هنگام اتصال وب‌سوکت یک‌جا فرستاده می‌شود
+    - inbox_date اعضا در همان پیمایش دسته‌ای (کانال) یا بلافاصله بعد از commit پیام گروه، با یک UPDATE
+      برای هر دسته جلو می‌رود. پیمایش دوره‌ای چت‌هایی که last_message_date آن‌ها از inbox_synced_date
+      جلوتر است (هر CHAT_DELIVERY_INBOX_INTERVAL ثانیه) فقط پشتیبان است تا از دست رفتن صف حافظه
+      (خروج یا کرش پروسس) inbox را کهنه نگذارد
+    """
+
+    def __init__(self, batch_size=None, inbox_interval=None, inbox_window=None):
+        self.batch_size = batch_size or getattr(settings, 'CHAT_DELIVERY_BATCH_SIZE', 2000)
+        self.inbox_interval = inbox_interval or getattr(settings, 'CHAT_DELIVERY_INBOX_INTERVAL', 30)
+        self.inbox_window = inbox_window or getattr(settings, 'CHAT_DELIVERY_INBOX_WINDOW', 3600)
+        self._pending = {}  # chat_id -> آخرین وضعیت ادغام شده پست‌ها
+        self._inbox_pending = {}  # chat_id -> تاریخ آخرین پیام گروه
+        self._inbox_swept_at = None  # زمان آخرین پیمایش inbox_date
+        self._full_sweep = True  # اولین پیمایش پروسس (و بعد از خطا) همه چت‌ها را بررسی می‌کند
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+
+    def enqueue(self, chat_id, last_message, count=1):
+        """ثبت پست(های) جدید یک کانال؛ بعد از commit تراکنش وارد صف می‌شود"""
+        update = {
+            'chat_id': chat_id,
+            'count': count,
+            'message_id': last_message.pk,
+            'sequence_number': last_message.sequence_number,
+            'sender_id': last_message.sender_id,
+            'date': last_message.date,
+            'message_type': last_message.message_type,
+            'preview': (last_message.text or last_message.caption or '')[:100],
+        }
+        transaction.on_commit(lambda: self._merge(update))
+
+    def schedule_inbox(self, chat_id, last_message):
+        """پیام گروه: بعد از commit، inbox_date اعضا در ترد پس‌زمینه تا تاریخ پیام جلو می‌رود"""
+        date = last_message.date
+        transaction.on_commit(lambda: self._merge_inbox(chat_id, date))
+
+    def _merge_inbox(self, chat_id, date):
+        with self._lock:
+            current = self._inbox_pending.get(chat_id)
+            if current is None or current < date:
+                self._inbox_pending[chat_id] = date
+        self._ensure_worker()
+        self._wakeup.set()
+
+    def _merge(self, update):
+        with self._lock:
+            current = self._pending.get(update['chat_id'])
+            if current is not None:
+                update['count'] += current['count']
+                if current['sequence_number'] > update['sequence_number']:
+                    update = {**current, 'count': update['count']}
+            self._pending[update['chat_id']] = update
+        self._ensure_worker()
+        self._wakeup.set()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name='channel-delivery', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(timeout=self.inbox_interval)
+            self._wakeup.clear()
+            try:
+                self.drain()
+            except Exception:
+                # شمارش خوانده نشده از اشاره‌گر و inbox_date از وضعیت چت در پیمایش بعدی درست می‌شود
+                logger.exception('channel delivery drain failed')
+            finally:
+                close_old_connections()
+
+    def drain(self, force_inbox=False):
+        """پردازش همه پست‌های در صف و پیمایش inbox_date؛ برای تست همزمان هم قابل صدا زدن است"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            inbox_pending, self._inbox_pending = self._inbox_pending, {}
+        for update in pending.values():
+            try:
+                self.push_online(update)
+            except Exception:
+                logger.exception('channel delivery push failed for chat %s', update['chat_id'])
+        for chat_id, date in inbox_pending.items():
+            try:
+                self.sync_inbox(chat_id, date)
+            except Exception:
+                logger.exception('inbox sync failed for chat %s', chat_id)
+        self.flush_inbox(force=force_inbox)
+
+    def shutdown(self):
+        """خروج پروسس: پست‌های در صف فرستاده و inbox_date ها قبل از بسته شدن نوشته می‌شوند"""
+        if self._worker is None:
+            return
+        try:
+            self.drain(force_inbox=True)
+        except Exception:
+            logger.exception('channel delivery drain on shutdown failed')
+        finally:
+            close_old_connections()
+
+    def iter_member_batches(self, chat_id):
+        """(id, user_id) اعضای غیر مسدود در دسته‌های batch_size با keyset روی id"""
+        from chat.models import Participant
+
+        last_id = 0
+        while True:
+            batch = list(
+                Participant.objects.filter(chat_id=chat_id, id__gt=last_id).exclude(role='BA')
+                .order_by('id').values_list('id', 'user_id')[:self.batch_size]
+            )
+            if not batch:
+                return
+            yield batch
+            if len(batch) < self.batch_size:
+                return
+            last_id = batch[-1][0]
+
+    @staticmethod
+    def advance_inbox(chat_id, batch, date):
+        """جلو بردن inbox_date یک دسته از اعضا (بازه id همان دسته) تا تاریخ پیام با یک UPDATE"""
+        from chat.models import Participant
+
+        Participant.objects.filter(
+            chat_id=chat_id, id__gte=batch[0][0], id__lte=batch[-1][0], inbox_date__lt=date
+        ).update(inbox_date=Greatest(F('inbox_date'), Value(date)))
+
+    @staticmethod
+    def mark_inbox_synced(chat_id, date):
+        from chat.models import ChatRoom
+
+        ChatRoom.objects.filter(pk=chat_id).filter(
+            Q(inbox_synced_date__isnull=True) | Q(inbox_synced_date__lt=date)
+        ).update(inbox_synced_date=date)
+
+    def sync_inbox(self, chat_id, date):
+        for batch in self.iter_member_batches(chat_id):
+            self.advance_inbox(chat_id, batch, date)
+        self.mark_inbox_synced(chat_id, date)
+
+    def push_online(self, update):
+        """نوتیفیکیشن اعضای آنلاین و جلو بردن inbox_date همه اعضا در همان پیمایش دسته‌ای"""
+        event = {
+            'type': 'chat.update',
+            'chat_id': update['chat_id'],
+            'count': update['count'],
+            'message_id': update['message_id'],
+            'sequence_number': update['sequence_number'],
+            'message_type': update['message_type'],
+            'preview': update['preview'],
+            'date': update['date'].isoformat(),
+        }
+        presence = get_presence()
+        pushed = 0
+        for batch in self.iter_member_batches(update['chat_id']):
+            self.advance_inbox(update['chat_id'], batch, update['date'])
+            online = presence.bulk_is_online(user_id for _, user_id in batch)
+            for user_id, is_online in online.items():
+                if is_online and user_id != update['sender_id']:
+                    group_send(user_group(user_id), event)
+                    pushed += 1
+        self.mark_inbox_synced(update['chat_id'], update['date'])
+        return pushed
+
+    def flush_inbox(self, force=False):
+        """
+        جلو بردن inbox_date اعضای چت‌هایی که last_message_date آن‌ها از inbox_synced_date جلوتر است،
+        با UPDATE های دسته‌ای روی بازه id. جز پیمایش کامل، فقط چت‌هایی که در CHAT_DELIVERY_INBOX_WINDOW
+        ثانیه اخیر پیام داشته‌اند (روی ایندکس last_message_date) بررسی می‌شوند. خروجی تعداد چت‌هاست.
+        """
+        from chat.models import ChatRoom
+
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._inbox_swept_at is not None and now - self._inbox_swept_at < self.inbox_interval:
+                return 0
+            self._inbox_swept_at = now
+            full, self._full_sweep = self._full_sweep, False
+
+        try:
+            stale = ChatRoom.objects.exclude(type='PV').filter(
+                Q(inbox_synced_date__isnull=True) | Q(last_message_date__gt=F('inbox_synced_date')),
+                last_message_date__isnull=False,
+            )
+            if not full:
+                stale = stale.filter(last_message_date__gte=timezone.now() - timedelta(seconds=self.inbox_window))
+            chats = list(stale.values_list('id', 'last_message_date'))
+            for chat_id, date in chats:
+                self.sync_inbox(chat_id, date)
+        except Exception:
+            with self._lock:
+                self._full_sweep = True
+            raise
+        return len(chats)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_delivery_engine() -> ChannelDeliveryEngine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = ChannelDeliveryEngine()
+                atexit.register(_engine.shutdown)
+    return _engine
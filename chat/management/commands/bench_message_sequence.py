@@ -0,0 +1,85 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction, OperationalError
+
+from chat.models import ChatRoom, Message
+from setting.models import Role
+from user.models import CustomUser
+from utils import sequence_allocator
+
+
+class Command(BaseCommand):
+    help = 'بنچمارک تعداد پیام در ثانیه در یک چت روم با افزایش تعداد فرستنده‌های همزمان'
+
+    ALLOCATORS = {
+        'legacy': sequence_allocator.SelectForUpdateSequenceAllocator,
+        'atomic': sequence_allocator.AtomicUpdateSequenceAllocator,
+        'block': sequence_allocator.BlockSequenceAllocator,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--senders', default='1,2,4,8,16',
+                            help='تعداد فرستنده‌های همزمان، جدا شده با کاما')
+        parser.add_argument('--messages', type=int, default=200, help='تعداد پیام هر فرستنده')
+        parser.add_argument('--allocators', default='legacy,atomic,block')
+
+    def handle(self, *args, **options):
+        senders_list = [int(x) for x in options['senders'].split(',')]
+        per_sender = options['messages']
+        allocator_names = options['allocators'].split(',')
+
+        suffix = uuid.uuid4().hex[:8]
+        role = Role.objects.create(name=f'bench-{suffix}', dev_name=f'bench-{suffix}')
+        users = [
+            CustomUser.objects.create(username=f'bench_{suffix}_{i}', email=f'bench_{suffix}_{i}@bench.local',
+                                      phone=f'bench-{suffix}-{i}', full_name='bench', role=role)
+            for i in range(max(senders_list))
+        ]
+        previous = sequence_allocator.get_sequence_allocator()
+        try:
+            self.stdout.write(f'{"allocator":<10}{"senders":>8}{"messages":>10}{"seconds":>10}{"msg/s":>10}{"errors":>8}')
+            for name in allocator_names:
+                for senders in senders_list:
+                    chat = ChatRoom.objects.create(name=f'bench-{suffix}', type='GP')
+                    sequence_allocator.set_sequence_allocator(self.ALLOCATORS[name]())
+                    elapsed, errors = self.run_round(name, chat.id, users[:senders], per_sender)
+                    sent = Message.objects.filter(chat_id=chat.id).count()
+                    self.stdout.write(
+                        f'{name:<10}{senders:>8}{sent:>10}{elapsed:>10.2f}{sent / elapsed:>10.1f}{errors:>8}'
+                    )
+                    chat.delete()
+        finally:
+            sequence_allocator.set_sequence_allocator(previous)
+            CustomUser.objects.filter(id__in=[u.id for u in users]).delete()
+            role.delete()
+
+    def run_round(self, name, chat_id, users, per_sender):
+        barrier = threading.Barrier(len(users))
+        errors = []
+
+        def sender(user):
+            barrier.wait()
+            try:
+                for i in range(per_sender):
+                    try:
+                        if name == 'legacy':
+                            # رفتار قبلی: قفل ردیف چت تا پایان درج پیام نگه داشته می‌شد
+                            with transaction.atomic():
+                                Message.objects.create(chat_id=chat_id, sender=user, text=f'bench {i}')
+                        else:
+                            Message.objects.create(chat_id=chat_id, sender=user, text=f'bench {i}')
+                    except OperationalError:
+                        errors.append(1)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=sender, args=(user,)) for user in users]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start, len(errors)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from chat.models import MessageReaction, MessageReactionCount
+
+
+class Command(BaseCommand):
+    help = 'ترمیم شمارنده‌های واکنش (MessageReactionCount) با شمارش دوباره از ردیف‌های MessageReaction'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--message', type=int, action='append', dest='messages',
+                            help='فقط همین پیام(ها)؛ بدون آن همه پیام‌ها')
+
+    def handle(self, *args, **options):
+        reactions = MessageReaction.objects.all()
+        counters = MessageReactionCount.objects.all()
+        if options['messages']:
+            reactions = reactions.filter(message_id__in=options['messages'])
+            counters = counters.filter(message_id__in=options['messages'])
+
+        # کلیدهای موجود در هر دو جدول؛ شمارنده‌ای که ردیفی ندارد در recompute حذف می‌شود
+        keys = set(reactions.values_list('message_id', 'emoji', 'sticker_id', 'reaction_type').distinct())
+        keys.update(counters.values_list('message_id', 'emoji', 'sticker_id', 'reaction_type'))
+
+        for message_id, emoji, sticker_id, reaction_type in keys:
+            MessageReactionCount.recompute(message_id, emoji, sticker_id, reaction_type)
+        self.stdout.write(f'{len(keys)} reaction counters rebuilt')
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:37
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_last_read_sequence(apps, schema_editor):
+    Participant = apps.get_model('chat', 'Participant')
+    Message = apps.get_model('chat', 'Message')
+    last_read = Message.objects.filter(
+        chat=OuterRef('chat_id')
+    ).filter(
+        Q(sender=OuterRef('user_id')) | Q(message_views__user=OuterRef('user_id'))
+    ).order_by('-sequence_number').values('sequence_number')[:1]
+    Participant.objects.update(last_read_sequence=Coalesce(Subquery(last_read), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_chatroom_last_message_chatroom_last_message_date_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='participant',
+            name='last_read_sequence',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_last_read_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:38
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_inbox_date(apps, schema_editor):
+    Participant = apps.get_model('chat', 'Participant')
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    order_date = ChatRoom.objects.filter(pk=OuterRef('chat_id')).annotate(
+        order_date=Coalesce('last_message_date', 'updated_at')
+    ).values('order_date')[:1]
+    Participant.objects.update(inbox_date=Subquery(order_date))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_participant_last_read_sequence'),
+        ('user', '0007_customuser_can_message_me'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='participant',
+            name='inbox_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(backfill_inbox_date, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='participant',
+            index=models.Index(fields=['user', '-inbox_date', '-chat'], name='chat_partic_inbox_idx'),
+        ),
+    ]
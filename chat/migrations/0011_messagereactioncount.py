@@ -0,0 +1,75 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_reaction_counts(apps, schema_editor):
+    MessageReaction = apps.get_model('chat', 'MessageReaction')
+    MessageReactionCount = apps.get_model('chat', 'MessageReactionCount')
+    groups = MessageReaction.objects.values(
+        'message_id', 'reaction_type', 'emoji', 'sticker_id'
+    ).annotate(count=Count('id')).order_by()
+    counters = []
+    for group in groups.iterator():
+        recent = MessageReaction.objects.filter(
+            message_id=group['message_id'], emoji=group['emoji'], sticker_id=group['sticker_id']
+        ).select_related('user').order_by('-id')[:3]
+        counters.append(MessageReactionCount(
+            message_id=group['message_id'],
+            key=f"s:{group['sticker_id']}" if group['sticker_id'] else f"e:{group['emoji']}",
+            reaction_type=group['reaction_type'],
+            emoji=group['emoji'],
+            sticker_id=group['sticker_id'],
+            count=group['count'],
+            recent_reactors=[{'id': r.user_id, 'username': r.user.username} for r in recent],
+        ))
+        if len(counters) >= 500:
+            MessageReactionCount.objects.bulk_create(counters)
+            counters = []
+    MessageReactionCount.objects.bulk_create(counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_participant_inbox_date'),
+        ('user', '0007_customuser_can_message_me'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageReactionCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=32)),
+                ('reaction_type', models.CharField(choices=[('emoji', 'Emoji'), ('sticker', 'Custom Emoji (Sticker)')], max_length=10)),
+                ('emoji', models.CharField(blank=True, max_length=10, null=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('recent_reactors', models.JSONField(default=list)),
+            ],
+            options={
+                'ordering': ['-count', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='messagereaction',
+            index=models.Index(fields=['message', '-id'], name='chat_messag_message_cba940_idx'),
+        ),
+        migrations.AddField(
+            model_name='messagereactioncount',
+            name='message',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reaction_counts', to='chat.message'),
+        ),
+        migrations.AddField(
+            model_name='messagereactioncount',
+            name='sticker',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='chat.sticker'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='messagereactioncount',
+            unique_together={('message', 'key')},
+        ),
+        migrations.RunPython(backfill_reaction_counts, migrations.RunPython.noop),
+    ]
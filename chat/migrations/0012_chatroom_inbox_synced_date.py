@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:24
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_inbox_synced_date(apps, schema_editor):
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    ChatRoom.objects.exclude(type='PV').update(inbox_synced_date=F('last_message_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_messagereactioncount'),
+        ('user', '0008_remove_customuser_is_online'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='inbox_synced_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_inbox_synced_date, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='chatroom',
+            index=models.Index(fields=['last_message_date'], name='chat_chatro_last_me_acba3b_idx'),
+        ),
+    ]
@@ -1,11 +1,17 @@
 from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxLengthValidator
 from django.utils import timezone
 import uuid
 from user.models import CustomUser
 import os
-from django.db.models import F
+from django.conf import settings
+from django.db.models import F, Q, Case, When, Value, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from utils.sequence_allocator import get_sequence_allocator
+from chat.realtime import publish_messages, publish_room_joined, publish_room_left
 User = CustomUser
 
 
@@ -244,18 +250,45 @@ class ChatRoom(models.Model):
                                      related_name='last_in_chats')
     last_message_date = models.DateTimeField(null=True, blank=True)
     last_sequence = models.BigIntegerField(default=0)
+    # inbox_date اعضا (به جز PV) تا این تاریخ جلو برده شده است (chat.delivery)
+    inbox_synced_date = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         indexes = [
             models.Index(fields=['type']),
             models.Index(fields=['username']),
             models.Index(fields=['invite_link']),
+            models.Index(fields=['last_message_date']),
         ]
         ordering = ['-updated_at']
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def record_new_messages(cls, chat_id, last_message, count=1):
+        """به‌روزرسانی last_message و message_count با یک دستور UPDATE"""
+        # اگر پیام جدیدتری زودتر ثبت شده باشد last_message عقب برده نمی‌شود
+        is_latest = Q(last_message_date__isnull=True) | Q(last_message_date__lte=last_message.date)
+        cls.objects.filter(pk=chat_id).update(
+            last_message_id=Case(When(is_latest, then=Value(last_message.pk)), default=F('last_message_id'),
+                                 output_field=models.BigIntegerField()),
+            last_message_date=Case(When(is_latest, then=Value(last_message.date)), default=F('last_message_date'),
+                                   output_field=models.DateTimeField()),
+            message_count=F('message_count') + count
+        )
+
+    @staticmethod
+    def committed_sequence(chat_ref='chat_id'):
+        """
+        بزرگترین sequence_number پیام ثبت شده چت (یک lookup روی ایندکس یکتای (chat, sequence_number)).
+        last_sequence با BlockSequenceAllocator فقط سقف رزرو است و پیام‌های رزرو نشده را هم می‌شمارد.
+        """
+        return Coalesce(Subquery(
+            Message.objects.filter(chat_id=OuterRef(chat_ref)).order_by('-sequence_number')
+            .values('sequence_number')[:1]
+        ), Value(0))
+
     def update_last_message(self):
         last_msg = self.messages.filter(is_deleted=False).order_by('-sequence_number').first()
         self.last_message = last_msg
@@ -263,6 +296,16 @@ class ChatRoom(models.Model):
         self.save(update_fields=['last_message', 'last_message_date'])
 
 
+def unread_count_limit():
+    return getattr(settings, 'CHAT_UNREAD_COUNT_LIMIT', 1000)
+
+
+class UnreadCount(Subquery):
+    """COUNT روی زیرکوئری محدود شده؛ Count معمولی LIMIT زیرکوئری را نادیده می‌گیرد"""
+    template = '(SELECT COUNT(*) FROM (%(subquery)s) unread_messages)'
+    output_field = models.IntegerField()
+
+
 class BlockChat(models.Model):
     chatroom = models.ForeignKey(ChatRoom, related_name='blocked_users', on_delete=models.CASCADE)
     user = models.ForeignKey(CustomUser, related_name='blocked_of_chats', on_delete=models.CASCADE)
@@ -296,19 +339,93 @@ class Participant(models.Model):
     can_send_stickers = models.BooleanField(default=True)
     can_send_gifs = models.BooleanField(default=True)
     custom_title = models.CharField(max_length=16, blank=True, null=True)
+    # آخرین sequence_number خوانده شده؛ خوانده نشده = پیام‌های حذف نشده با sequence_number بزرگتر
+    last_read_sequence = models.BigIntegerField(default=0)
+    # ترتیب چت در صندوق ورودی کاربر (تاریخ آخرین پیام یا تاریخ عضویت)
+    inbox_date = models.DateTimeField(default=timezone.now)
 
     class Meta:
         unique_together = ('user', 'chat')
         indexes = [
             models.Index(fields=['user', 'chat']),
             models.Index(fields=['chat', 'role']),
+            models.Index(fields=['user', '-inbox_date', '-chat'], name='chat_partic_inbox_idx'),
         ]
 
+    @property
+    def unread_count(self):
+        """
+        تعداد پیام‌های حذف نشده بعد از اشاره‌گر خوانده شده، حداکثر CHAT_UNREAD_COUNT_LIMIT
+        (مقدار annotate شده با unread_count_expression اگر باشد)
+        """
+        if hasattr(self, 'unread'):
+            return self.unread
+        return Message.objects.filter(
+            chat_id=self.chat_id, sequence_number__gt=self.last_read_sequence, is_deleted=False
+        )[:unread_count_limit()].count()
+
+    @staticmethod
+    def unread_count_expression():
+        """
+        همان unread_count برای annotate روی کوئری Participant (annotate(unread=...))؛
+        اسکن ایندکس (chat, sequence_number) به CHAT_UNREAD_COUNT_LIMIT ردیف محدود است
+        """
+        return UnreadCount(
+            Message.objects.filter(
+                chat_id=OuterRef('chat_id'), sequence_number__gt=OuterRef('last_read_sequence'), is_deleted=False
+            ).order_by().values('id')[:unread_count_limit()]
+        )
+
+    @classmethod
+    def record_new_messages(cls, chat_id, last_message, sender_only=False):
+        """
+        جلو بردن inbox_date همه اعضا و اشاره‌گر خوانده شده فرستنده با یک دستور UPDATE
+        (هیچ کدام عقب نمی‌روند)
+        sender_only: فقط ردیف فرستنده؛ inbox_date بقیه را chat.delivery دسته‌ای جلو می‌برد
+        """
+        sender_read = Case(
+            When(user_id=last_message.sender_id, last_read_sequence__lt=last_message.sequence_number,
+                 then=Value(last_message.sequence_number)),
+            default=F('last_read_sequence'),
+            output_field=models.BigIntegerField()
+        )
+        queryset = cls.objects.filter(chat_id=chat_id)
+        if sender_only:
+            queryset = queryset.filter(user_id=last_message.sender_id)
+        return queryset.update(
+            inbox_date=Greatest(F('inbox_date'), Value(last_message.date)),
+            last_read_sequence=sender_read
+        )
+
+    @classmethod
+    def record_chat_messages(cls, chat_room, last_message, count=1):
+        """
+        ثبت پیام(های) جدید برای اعضا بسته به نوع چت. فقط چت خصوصی (دو ردیف) همه اعضا را در همان
+        تراکنش به‌روز می‌کند؛ در گروه و کانال فقط ردیف فرستنده نوشته می‌شود تا هزینه هر پیام به
+        تعداد اعضا بستگی نداشته باشد و inbox_date بقیه را chat.delivery دسته‌ای جلو می‌برد.
+        """
+        from chat.delivery import is_fanout_chat, get_delivery_engine
+
+        if chat_room.type == 'PV':
+            cls.record_new_messages(chat_room.id, last_message)
+            return
+        cls.record_new_messages(chat_room.id, last_message, sender_only=True)
+        if is_fanout_chat(chat_room.type):
+            get_delivery_engine().enqueue(chat_room.id, last_message, count)
+        else:
+            # پیام‌های گروه از گروه channel layer چت می‌رسند؛ فقط inbox_date اعضا مانده است
+            get_delivery_engine().schedule_inbox(chat_room.id, last_message)
+
     def save(self, *args, **kwargs):
         is_new = self._state.adding
+        if is_new and not self.last_read_sequence:
+            # عضو جدید تاریخچه قبلی چت را خوانده نشده نمی‌بیند
+            self.last_read_sequence = Message.objects.filter(chat_id=self.chat_id).order_by(
+                '-sequence_number').values_list('sequence_number', flat=True).first() or 0
         super().save(*args, **kwargs)
         if is_new:
             ChatRoom.objects.filter(pk=self.chat_id).update(member_count=F('member_count') + 1)
+            publish_room_joined(self.user_id, self.chat_id, self.chat.type)
 
     def delete(self, *args, **kwargs):
         chat_id = self.chat_id
@@ -316,6 +433,17 @@ class Participant(models.Model):
         ChatRoom.objects.filter(pk=chat_id).update(member_count=F('member_count') - 1)
 
 
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+def publish_participant_removed(sender, instance, **kwargs):
+    """حذف عضو (حتی cascade) یا بن شدن او اتصال‌های بازش را از گروه چت خارج می‌کند"""
+    if kwargs['signal'] is post_save and instance.role != 'BA':
+        return
+    from chat.delivery import is_fanout_chat
+    chat_type = ChatRoom.objects.filter(pk=instance.chat_id).values_list('type', flat=True).first()
+    publish_room_left(instance.user_id, instance.chat_id, fanout=is_fanout_chat(chat_type))
+
+
 class Message(models.Model):
     TYPE_CHOICES = (
         ('text', 'Text'),
@@ -382,24 +510,29 @@ class Message(models.Model):
             models.Index(fields=['gif']),
         ]
 
+    def apply_media_type(self):
+        """تعیین نوع پیام بر اساس استیکر یا گیف"""
+        if self.sticker_id:
+            self.message_type = 'sticker'
+        elif self.gif_id:
+            self.message_type = 'gif'
+
     def save(self, *args, **kwargs):
         is_new = self._state.adding
 
-        if self.sticker:
-            self.message_type = 'sticker'
-        elif self.gif:
-            self.message_type = 'gif'
+        self.apply_media_type()
 
         if is_new:
+            # شماره ترتیب با یک دستور کوتاه رزرو می‌شود و قفل ردیف چت در طول درج پیام نگه داشته نمی‌شود
+            if not self.sequence_number:
+                self.sequence_number = get_sequence_allocator().allocate(self.chat_id).start
+            # درج پیام و شمارنده‌های چت و اعضا با هم commit یا rollback می‌شوند؛
+            # به‌روزرسانی ردیف چت آخر است تا قفل آن کوتاه‌ترین زمان نگه داشته شود
             with transaction.atomic():
-                chat = ChatRoom.objects.select_for_update().get(pk=self.chat_id)
-                chat.last_sequence += 1
-                self.sequence_number = chat.last_sequence
                 super().save(*args, **kwargs)
-                chat.last_message = self
-                chat.last_message_date = self.date
-                chat.message_count = F('message_count') + 1
-                chat.save(update_fields=['last_sequence', 'last_message', 'last_message_date', 'message_count'])
+                Participant.record_chat_messages(self.chat, self)
+                ChatRoom.record_new_messages(self.chat_id, self)
+                publish_messages(self.chat_id, [self.pk])
         else:
             super().save(*args, **kwargs)
 
@@ -423,11 +556,140 @@ class MessageReaction(models.Model):
         unique_together = ('message', 'user', 'emoji', 'sticker')
         indexes = [
             models.Index(fields=['message', 'user']),
+            models.Index(fields=['message', '-id']),
         ]
 
     def __str__(self):
         return f"Reaction by {self.user} on {self.message.id}"
 
+    def save(self, *args, **kwargs):
+        # شمارنده در سیگنال post_save در همین تراکنش به‌روز می‌شود
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class MessageReactionCount(models.Model):
+    """
+    شمارنده تجمیعی واکنش‌های هر پیام به ازای هر ایموجی یا استیکر
+    با هر واکنش به‌روز می‌شود تا خلاصه واکنش‌ها بدون اسکن جدول MessageReaction ساخته شود.
+    """
+
+    RECENT_REACTORS_LIMIT = 3
+
+    message = models.ForeignKey(Message, related_name='reaction_counts', on_delete=models.CASCADE)
+    key = models.CharField(max_length=32)  # e:<emoji> یا s:<sticker_id>
+    reaction_type = models.CharField(max_length=10, choices=MessageReaction.REACTION_TYPES)
+    emoji = models.CharField(max_length=10, blank=True, null=True)
+    sticker = models.ForeignKey(Sticker, null=True, blank=True, on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
+    recent_reactors = models.JSONField(default=list)  # [{'id': ..., 'username': ...}] جدیدترین اول
+
+    class Meta:
+        unique_together = ('message', 'key')
+        ordering = ['-count', 'id']
+
+    def __str__(self):
+        return f"{self.key} x{self.count} on {self.message_id}"
+
+    @staticmethod
+    def make_key(emoji, sticker_id):
+        return f's:{sticker_id}' if sticker_id else f'e:{emoji}'
+
+    @classmethod
+    def increment(cls, reaction):
+        """اضافه کردن یک واکنش تازه به شمارنده و ابتدای recent_reactors"""
+        key = cls.make_key(reaction.emoji, reaction.sticker_id)
+        with transaction.atomic():
+            # قفل فقط روی ردیف همین شمارنده است؛ واکنش‌های همزمان همان کلید پشت سر هم اعمال می‌شوند
+            counter, created = cls.objects.select_for_update().get_or_create(
+                message_id=reaction.message_id,
+                key=key,
+                defaults={
+                    'reaction_type': reaction.reaction_type,
+                    'emoji': reaction.emoji,
+                    'sticker_id': reaction.sticker_id,
+                }
+            )
+            recent = [r for r in counter.recent_reactors if r['id'] != reaction.user_id]
+            recent.insert(0, {'id': reaction.user_id, 'username': reaction.user.username})
+            cls.objects.filter(pk=counter.pk).update(
+                count=F('count') + 1, recent_reactors=recent[:cls.RECENT_REACTORS_LIMIT]
+            )
+
+    @classmethod
+    def decrement(cls, reaction):
+        """
+        کم کردن یک واکنش حذف شده از شمارنده؛ شمارنده صفر حذف می‌شود.
+        recent_reactors از ردیف‌های قدیمی‌تر دوباره پر نمی‌شود (بهترین تلاش).
+        """
+        key = cls.make_key(reaction.emoji, reaction.sticker_id)
+        with transaction.atomic():
+            counter = cls.objects.select_for_update().filter(message_id=reaction.message_id, key=key).first()
+            if counter is None:
+                return
+            if counter.count <= 1:
+                counter.delete()
+                return
+            recent = [r for r in counter.recent_reactors if r['id'] != reaction.user_id]
+            cls.objects.filter(pk=counter.pk).update(count=F('count') - 1, recent_reactors=recent)
+
+    @classmethod
+    def recompute(cls, message_id, emoji, sticker_id, reaction_type):
+        """
+        محاسبه دوباره شمارنده یک ایموجی یا استیکر از خود ردیف‌های MessageReaction.
+        در مسیر عادی صدا زده نمی‌شود؛ فقط دستور rebuild_reaction_counts برای ترمیم
+        شمارنده‌هایی که با حذف‌های خارج از ORM (مثلاً SQL خام) از ردیف‌ها جدا شده‌اند.
+        """
+        reactions = MessageReaction.objects.filter(message_id=message_id)
+        if sticker_id:
+            reactions = reactions.filter(sticker_id=sticker_id)
+        else:
+            reactions = reactions.filter(emoji=emoji, sticker__isnull=True)
+        key = cls.make_key(emoji, sticker_id)
+        with transaction.atomic():
+            # قفل ردیف شمارنده تا شمارش‌های همزمان همان کلید پشت سر هم انجام شوند
+            counter = cls.objects.select_for_update().filter(message_id=message_id, key=key).first()
+            count = reactions.count()
+            if count == 0:
+                if counter is not None:
+                    counter.delete()
+                return None
+            recent = [
+                {'id': user_id, 'username': username}
+                for user_id, username in reactions.order_by('-id').values_list(
+                    'user_id', 'user__username')[:cls.RECENT_REACTORS_LIMIT]
+            ]
+            if counter is None:
+                counter, created = cls.objects.get_or_create(
+                    message_id=message_id,
+                    key=key,
+                    defaults={
+                        'reaction_type': reaction_type,
+                        'emoji': emoji,
+                        'sticker_id': sticker_id,
+                        'count': count,
+                        'recent_reactors': recent,
+                    }
+                )
+                if created:
+                    return counter
+            counter.count = count
+            counter.recent_reactors = recent
+            counter.save(update_fields=['count', 'recent_reactors'])
+        return counter
+
+
+@receiver(post_save, sender=MessageReaction)
+def increment_reaction_count(sender, instance, created, **kwargs):
+    if created:
+        MessageReactionCount.increment(instance)
+
+
+@receiver(post_delete, sender=MessageReaction)
+def decrement_reaction_count(sender, instance, **kwargs):
+    # برای QuerySet.delete و حذف آبشاری کاربر یا پیام هم به ازای هر ردیف اجرا می‌شود
+    MessageReactionCount.decrement(instance)
+
 
 class MessageView(models.Model):
     """مشاهده پیام‌ها"""
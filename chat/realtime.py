@@ -0,0 +1,79 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+PUBLISH_CHUNK_SIZE = 100
+
+
+def room_group(chat_id):
+    """گروه channel layer هر چت روم؛ همه اتصال‌های اعضای آنلاین عضو آن هستند"""
+    return f'chat.room.{chat_id}'
+
+
+def user_group(user_id):
+    """گروه شخصی هر کاربر برای رویدادهایی مثل عضویت در چت جدید"""
+    return f'chat.user.{user_id}'
+
+
+def group_send(group, event):
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    async_to_sync(layer.group_send)(group, event)
+
+
+def publish_messages(chat_id, message_ids):
+    """
+    ارسال پیام‌های جدید به اتصال‌های وب‌سوکت چت بعد از commit تراکنش؛
+    اگر تراکنش rollback شود چیزی ارسال نمی‌شود.
+    """
+    message_ids = list(message_ids)
+    if not message_ids:
+        return
+    transaction.on_commit(lambda: _send_messages(chat_id, message_ids))
+
+
+def _send_messages(chat_id, message_ids):
+    from chat.models import Message
+    from chat.serializers import MessageSerializer
+
+    if get_channel_layer() is None:
+        return
+    for start in range(0, len(message_ids), PUBLISH_CHUNK_SIZE):
+        queryset = MessageSerializer.setup_eager_loading(
+            Message.objects.filter(id__in=message_ids[start:start + PUBLISH_CHUNK_SIZE])
+        ).order_by('sequence_number')
+        group_send(room_group(chat_id), {
+            'type': 'chat.message',
+            'chat_id': chat_id,
+            'messages': MessageSerializer(queryset, many=True).data,
+        })
+
+
+def publish_room_joined(user_id, chat_id, chat_type=None):
+    """اتصال‌های باز کاربر را بعد از commit عضو گروه چت جدید می‌کند"""
+    transaction.on_commit(lambda: group_send(user_group(user_id), {
+        'type': 'chat.joined',
+        'chat_id': chat_id,
+        'chat_type': chat_type,
+    }))
+
+
+def publish_room_left(user_id, chat_id, fanout=False):
+    """
+    بعد از commit اتصال‌های کاربر را از گروه چتی که از آن حذف یا بن شده خارج می‌کند.
+    اتصال‌های عضو گروه چت (شامل اتصال مخصوص یک کانال) از همان گروه و اتصال همه چت‌ها برای
+    کانال‌ها (که گروه چت ندارد) از گروه شخصی کاربر خبردار می‌شوند؛ مصرف‌کننده روی user_id فیلتر می‌کند.
+    """
+    groups = [room_group(chat_id), user_group(user_id)] if fanout else [room_group(chat_id)]
+    event = {
+        'type': 'chat.removed',
+        'chat_id': chat_id,
+        'user_id': user_id,
+    }
+
+    def send():
+        for group in groups:
+            group_send(group, event)
+
+    transaction.on_commit(send)
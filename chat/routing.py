@@ -0,0 +1,8 @@
+from django.urls import path
+
+from chat import consumers
+
+websocket_urlpatterns = [
+    path('ws/chat/', consumers.ChatRoomConsumer.as_asgi(), name='ws-chat'),
+    path('ws/chat/<int:chat_id>/', consumers.ChatRoomConsumer.as_asgi(), name='ws-chat-room'),
+]
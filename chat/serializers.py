@@ -2,12 +2,14 @@ from pyexpat.errors import messages
 from rest_framework import serializers
 from .models import (
     User, ChatRoom, Participant, Message,
-    StickerPack, Sticker, GIF, MessageReaction,
+    StickerPack, Sticker, GIF, MessageReaction, MessageReactionCount,
     MessageView, StickerUsage, GIFUsage,
     UserStickerCollection, AdminLog
 )
 from user.models import CustomUser
+from user.presence import get_presence
 from authentication.serializers import UserViewSerializer
+from django.db.models import Prefetch
 from django.utils import timezone
 from datetime import timedelta
 
@@ -69,10 +71,10 @@ class ChatRoomSerializer(serializers.ModelSerializer):
 
     def get_unread_count(self, obj):
         user = self.context['request'].user
-        last_seen = user.chat_seen_dates.filter(chat=obj).first()
-        if last_seen:
-            return obj.messages.filter(date__gt=last_seen.last_seen).count()
-        return obj.messages.count()
+        participant = obj.participants.filter(user=user).only('chat_id', 'last_read_sequence').first()
+        if participant:
+            return participant.unread_count
+        return 0
 
     def get_last_message(self, obj):
         last_msg = obj.messages.filter(is_deleted=False).last()
@@ -105,14 +107,37 @@ class MessageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Message
-        fields = ['id', 'chat', 'sender', 'message_type', 'text', 'caption',
+        fields = ['id', 'chat', 'sequence_number', 'sender', 'message_type', 'text', 'caption',
                   'media_file', 'media_thumbnail', 'sticker', 'gif', 'parent',
                   'is_pinned', 'is_edited', 'edit_date', 'views', 'forwards',
                   'date', 'has_spoiler', 'reactions']
 
+    @staticmethod
+    def setup_eager_loading(queryset, prefix='', user=None):
+        """
+        select_related / prefetch_related لازم برای سریالایز یک صفحه پیام با تعداد کوئری ثابت
+        prefix برای وقتی است که پیام از طریق رابطه دیگری لود می‌شود (مثل chat__last_message__)
+        user اگر داده شود واکنش‌های خود کاربر هم برای فیلد reacted لود می‌شود.
+        """
+        queryset = queryset.select_related(
+            f'{prefix}sender', f'{prefix}sticker', f'{prefix}gif'
+        ).prefetch_related(f'{prefix}reaction_counts')
+        if user is not None:
+            queryset = queryset.prefetch_related(
+                Prefetch(f'{prefix}reactions',
+                         queryset=MessageReaction.objects.filter(user=user).only('id', 'message_id', 'emoji', 'sticker_id'),
+                         to_attr='user_reactions')
+            )
+        return queryset
+
     def get_reactions(self, obj):
-        return MessageReactionSerializer(
-            obj.reactions.all(), many=True
+        # خلاصه واکنش‌ها از شمارنده‌ها و کش prefetch (setup_eager_loading)؛ لیست کامل در endpoint جدا
+        reacted_keys = {
+            MessageReactionCount.make_key(reaction.emoji, reaction.sticker_id)
+            for reaction in getattr(obj, 'user_reactions', [])
+        }
+        return MessageReactionCountSerializer(
+            obj.reaction_counts.all(), many=True, context={'reacted_keys': reacted_keys}
         ).data
 
     # def get_is_viewed(self, obj):
@@ -120,6 +145,23 @@ class MessageSerializer(serializers.ModelSerializer):
     #     return obj.views.filter(user=user).exists()
 
 
+class ChatMessageRelatedField(serializers.PrimaryKeyRelatedField):
+    """پیام مرجع (پاسخ) فقط از همان چتی که پیام در آن ارسال می‌شود؛ چت از context['chat']"""
+
+    def get_queryset(self):
+        return Message.objects.filter(chat=self.context['chat'], is_deleted=False)
+
+
+class MessageBulkCreateSerializer(serializers.ModelSerializer):
+    """یک آیتم از ارسال دسته‌ای پیام‌ها"""
+    parent = ChatMessageRelatedField(allow_null=True, required=False)
+
+    class Meta:
+        model = Message
+        fields = ['message_type', 'text', 'caption', 'entities', 'sticker', 'gif', 'parent',
+                  'has_spoiler', 'is_silent']
+
+
 class MessageReactionSerializer(serializers.ModelSerializer):
     user = UserViewSerializer(read_only=True)
 
@@ -128,6 +170,18 @@ class MessageReactionSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'reaction_type', 'emoji', 'sticker', 'date']
 
 
+class MessageReactionCountSerializer(serializers.ModelSerializer):
+    reacted = serializers.SerializerMethodField()
+
+    class Meta:
+        model = MessageReactionCount
+        fields = ['reaction_type', 'emoji', 'sticker', 'count', 'reacted', 'recent_reactors']
+
+    def get_reacted(self, obj):
+        """آیا کاربر فعلی همین واکنش را گذاشته است؟"""
+        return obj.key in self.context.get('reacted_keys', ())
+
+
 class AdminLogSerializer(serializers.ModelSerializer):
     actor = UserViewSerializer(read_only=True)
     target_user = UserViewSerializer(read_only=True)
@@ -208,16 +262,114 @@ class LastMessageSerializer(serializers.Serializer):
         return data
 
 
-class ChatRoomListSerializer(serializers.ModelSerializer):
+class ChatCounterpartResolver:
+    """
+    بارگذاری دسته‌ای کاربر مقابل چت‌های خصوصی برای یک صفحه از چت‌ها
+    به جای یک کوئری Participant و یک کوئری CustomUser به ازای هر چت، یک کوئری برای کل صفحه.
+    وضعیت آنلاین هم برای کل صفحه با یک درخواست از سرویس presence خوانده می‌شود.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._counterparts = {}
+        self._loaded = set()
+        self._online = {}
+
+    def load(self, chat_rooms):
+        chat_rooms = list(chat_rooms)
+        pv_ids = [chat_room.id for chat_room in chat_rooms
+                  if chat_room.type == 'PV' and chat_room.id not in self._loaded]
+        if pv_ids and self.user is not None:
+            participants = Participant.objects.filter(
+                chat_id__in=pv_ids
+            ).exclude(user=self.user).select_related('user')
+            for participant in participants:
+                self._counterparts.setdefault(participant.chat_id, participant.user)
+            self._loaded.update(pv_ids)
+        self._load_presence(self._presence_target(chat_room) for chat_room in chat_rooms)
+
+    def _load_presence(self, targets):
+        user_ids = {target.id for target in targets
+                    if target is not None and target.id not in self._online}
+        if user_ids:
+            self._online.update(get_presence().bulk_is_online(user_ids))
+
+    def _presence_target(self, chat_room):
+        """چت خصوصی: کاربر مقابل، بقیه: فرستنده آخرین پیام (از select_related صندوق ورودی)"""
+        if chat_room.type == 'PV':
+            return self.other_user(chat_room)
+        last_message = chat_room.last_message if chat_room.last_message_id else None
+        return last_message.sender if last_message and last_message.sender_id else None
+
+    def other_user(self, chat_room):
+        if chat_room.type != 'PV':
+            return None
+        if chat_room.id not in self._loaded:
+            self.load([chat_room])
+        return self._counterparts.get(chat_room.id)
+
+    def is_online(self, chat_room):
+        target = self._presence_target(chat_room)
+        if target is None or not target.is_active:
+            return False
+        self._load_presence([target])
+        return self._online.get(target.id, False)
+
+
+class ChatRoomCounterpartListSerializer(serializers.ListSerializer):
+    """قبل از سریالایز صفحه، کاربران مقابل همه چت‌ها را یک‌جا لود می‌کند"""
+
+    def to_representation(self, data):
+        chat_rooms = list(data.all() if hasattr(data, 'all') else data)
+        self.child.get_counterpart_resolver().load(chat_rooms)
+        return super().to_representation(chat_rooms)
+
+
+class ChatRoomCounterpartMixin:
+    """فیلدهای is_online / is_group / other_user مشترک بین سریالایزرهای چت روم"""
+
+    def get_counterpart_resolver(self):
+        resolver = self.context.get('counterpart_resolver')
+        if resolver is None:
+            request = self.context.get('request')
+            resolver = ChatCounterpartResolver(getattr(request, 'user', None))
+            self.context['counterpart_resolver'] = resolver
+        return resolver
+
+    def get_is_online(self, obj):
+        """بررسی آنلاین بودن کاربر مقابل (چت خصوصی) یا آخرین فرستنده"""
+        return self.get_counterpart_resolver().is_online(obj)
+
+    def get_is_group(self, obj):
+        """آیا چت روم یک گروه است؟"""
+        return obj.type in ['GP', 'CH', 'BC']
+
+    def get_other_user(self, obj):
+        """اطلاعات کاربر مقابل در چت خصوصی"""
+        other_user = self.get_counterpart_resolver().other_user(obj)
+        if not other_user:
+            return None
+
+        return {
+            'id': other_user.id,
+            'username': other_user.username,
+            'full_name': other_user.full_name,
+            'avatar': other_user.avatar_url.url if other_user.avatar_url else None
+        }
+
+
+class ChatRoomListSerializer(ChatRoomCounterpartMixin, serializers.ModelSerializer):
     member_count = serializers.IntegerField()
     unread_count = serializers.IntegerField(read_only=True)
     last_message = MessageSerializer( read_only=True)
     is_online = serializers.SerializerMethodField()
     is_group = serializers.SerializerMethodField()
     other_user = serializers.SerializerMethodField()  # فقط برای چت‌های خصوصی
+    cursor = serializers.CharField(source='inbox_cursor', read_only=True)  # برای درخواست صفحه بعد
 
     class Meta:
         model = ChatRoom
+        list_serializer_class = ChatRoomCounterpartListSerializer
         fields = [
             'id',
             'name',
@@ -229,44 +381,12 @@ class ChatRoomListSerializer(serializers.ModelSerializer):
             'is_online',
             'is_group',
             'other_user',  # اطلاعات کاربر مقابل در چت خصوصی
-            'updated_at'
+            'updated_at',
+            'cursor'
         ]
 
-    def get_is_online(self, obj):
-        """بررسی آنلاین بودن آخرین فرستنده"""
-        if not hasattr(obj, 'last_message_sender') or not obj.last_message_sender:
-            return False
-        user = CustomUser.objects.filter(username=obj.last_message_sender, is_active=True).first()
-        if not user:
-            return False
-        return user.is_online
-
-    def get_is_group(self, obj):
-        """آیا چت روم یک گروه است؟"""
-        return obj.type in ['GP', 'CH', 'BC']
-
-    def get_other_user(self, obj):
-        """اطلاعات کاربر مقابل در چت خصوصی"""
-        if obj.type != 'PV':
-            return None
-
-        request = self.context.get('request')
-        if not request or not request.user:
-            return None
-
-        # پیدا کردن کاربر مقابل در چت خصوصی
-        other_user = obj.participants.exclude(user=request.user).first()
-        if not other_user:
-            return None
-
-        return {
-            'id': other_user.user.id,
-            'username': other_user.user.username,
-            'full_name': other_user.user.full_name,
-            'avatar': other_user.user.avatar_url.url if other_user.user.avatar_url else None
-        }
 
-class ChatRoomCreateSerializer(serializers.ModelSerializer):
+class ChatRoomCreateSerializer(ChatRoomCounterpartMixin, serializers.ModelSerializer):
     member_count = serializers.IntegerField()
     is_online = serializers.SerializerMethodField()
     is_group = serializers.SerializerMethodField()
@@ -274,6 +394,7 @@ class ChatRoomCreateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ChatRoom
+        list_serializer_class = ChatRoomCounterpartListSerializer
         fields = [
             'id',
             'name',
@@ -286,39 +407,6 @@ class ChatRoomCreateSerializer(serializers.ModelSerializer):
             'updated_at'
         ]
 
-    def get_is_online(self, obj):
-        """بررسی آنلاین بودن آخرین فرستنده"""
-        if not hasattr(obj, 'last_message_sender') or not obj.last_message_sender:
-            return False
-        user = CustomUser.objects.filter(username=obj.last_message_sender, is_active=True).first()
-        if not user:
-            return False
-        return user.is_online
-
-    def get_is_group(self, obj):
-        """آیا چت روم یک گروه است؟"""
-        return obj.type in ['GP', 'CH', 'BC']
-
-    def get_other_user(self, obj):
-        """اطلاعات کاربر مقابل در چت خصوصی"""
-        if obj.type != 'PV':
-            return None
-
-        request = self.context.get('request')
-        if not request or not request.user:
-            return None
-
-        # پیدا کردن کاربر مقابل در چت خصوصی
-        other_user = obj.participants.exclude(user=request.user).first()
-        if not other_user:
-            return None
-
-        return {
-            'id': other_user.user.id,
-            'username': other_user.user.username,
-            'full_name': other_user.user.full_name,
-            'avatar': other_user.user.avatar_url.url if other_user.user.avatar_url else None
-        }
 
 class ParticipantPVSerializer(serializers.ModelSerializer):
     class Meta:
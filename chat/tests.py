@@ -1,3 +1,208 @@
-from django.test import TestCase
+import json
+import time
+from io import StringIO
 
-# Create your tests here.
+from asgiref.testing import ApplicationCommunicator
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from chat.consumers import ChatRoomConsumer
+from chat.delivery import ChannelDeliveryEngine
+from chat.models import ChatRoom, Participant, Message, MessageReaction, MessageReactionCount
+from setting.models import Role
+from user.models import CustomUser, BlockUser
+from utils.chat_management import ChatManagementByDB
+
+
+def create_user(role, name):
+    return CustomUser.objects.create(username=name, email=f'{name}@test.local', phone=f'phone-{name}',
+                                     full_name=name, role=role)
+
+
+class MessagePageQueryCountTests(TestCase):
+    """تعداد کوئری یک صفحه پیام (MessageSerializer.setup_eager_loading) به اندازه صفحه بستگی ندارد"""
+
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name='member', dev_name='member')
+        cls.users = [create_user(role, f'user{i}') for i in range(3)]
+        cls.chat = ChatRoom.objects.create(name='group', type='GP')
+        for user in cls.users:
+            Participant.objects.create(chat=cls.chat, user=user)
+
+        parent = None
+        for i in range(30):
+            message = Message.objects.create(chat=cls.chat, sender=cls.users[i % 3], text=f'message {i}',
+                                             parent=parent)
+            for user in cls.users[:2]:
+                MessageReaction.objects.create(message=message, user=user, reaction_type='emoji',
+                                               emoji='👍' if i % 2 else '❤')
+            parent = message
+
+    def count_page_queries(self, page_size):
+        manager = ChatManagementByDB(self.users[0])
+        with CaptureQueriesContext(connection) as queries:
+            status_code, data = manager.messages(self.chat.id, page_size)
+        self.assertEqual(status_code, 200)
+        self.assertEqual(len(data), page_size)
+        # سریالایز واقعی هم شمرده شود (reactions و sender هر پیام)
+        self.assertTrue(all(item['sender'] and item['reactions'] for item in data))
+        return len(queries)
+
+    def test_query_count_is_constant_across_page_sizes(self):
+        self.assertEqual(self.count_page_queries(5), self.count_page_queries(25))
+
+
+class ReactionCountTests(TestCase):
+    """شمارنده واکنش‌ها با هر ذخیره و حذف یکی کم و زیاد می‌شود و دستور ترمیم آن را از ردیف‌ها می‌سازد"""
+
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name='member', dev_name='member')
+        cls.users = [create_user(role, f'user{i}') for i in range(4)]
+        chat = ChatRoom.objects.create(name='group', type='GP')
+        cls.message = Message.objects.create(chat=chat, sender=cls.users[0], text='hi')
+
+    def react(self, user):
+        return MessageReaction.objects.create(message=self.message, user=user, reaction_type='emoji', emoji='👍')
+
+    def counter(self):
+        return MessageReactionCount.objects.filter(message=self.message).first()
+
+    def test_incremental_updates(self):
+        reactions = [self.react(user) for user in self.users]
+        counter = self.counter()
+        self.assertEqual(counter.count, 4)
+        self.assertEqual([r['id'] for r in counter.recent_reactors], [u.id for u in self.users[:0:-1]])
+
+        reactions[-1].delete()
+        counter = self.counter()
+        self.assertEqual(counter.count, 3)
+        self.assertNotIn(self.users[-1].id, [r['id'] for r in counter.recent_reactors])
+
+        MessageReaction.objects.filter(message=self.message).delete()
+        self.assertIsNone(self.counter())
+
+    def test_rebuild_command_repairs_drift(self):
+        for user in self.users[:2]:
+            self.react(user)
+        MessageReactionCount.objects.filter(message=self.message).update(count=7, recent_reactors=[])
+        call_command('rebuild_reaction_counts', stdout=StringIO())
+        counter = self.counter()
+        self.assertEqual(counter.count, 2)
+        self.assertEqual([r['id'] for r in counter.recent_reactors], [self.users[1].id, self.users[0].id])
+
+
+class InboxDeliveryTests(TestCase):
+    """inbox_date بقیه اعضا با تحویل همان پیام جلو می‌رود، نه با پیمایش دوره‌ای"""
+
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name='member', dev_name='member')
+        cls.users = [create_user(role, f'user{i}') for i in range(3)]
+
+    def setUp(self):
+        self.engine = ChannelDeliveryEngine(batch_size=2)
+        self.engine._ensure_worker = lambda: None
+        # پیمایش دوره‌ای همین الان انجام شده و تا CHAT_DELIVERY_INBOX_INTERVAL اجرا نمی‌شود
+        self.engine._inbox_swept_at = time.monotonic()
+        self.engine._full_sweep = False
+
+    def send(self, chat_type):
+        chat = ChatRoom.objects.create(name=chat_type, type=chat_type)
+        for user in self.users:
+            Participant.objects.create(chat=chat, user=user)
+        message = Message.objects.create(chat=chat, sender=self.users[0], text='hi')
+        with self.captureOnCommitCallbacks(execute=True):
+            if chat_type == 'GP':
+                self.engine.schedule_inbox(chat.id, message)
+            else:
+                self.engine.enqueue(chat.id, message)
+        self.engine.drain()
+        return chat, message
+
+    def assert_inbox_synced(self, chat, message):
+        dates = Participant.objects.filter(chat=chat).values_list('inbox_date', flat=True)
+        self.assertTrue(all(date >= message.date for date in dates))
+        chat.refresh_from_db()
+        self.assertEqual(chat.inbox_synced_date, message.date)
+
+    def test_group_message(self):
+        self.assert_inbox_synced(*self.send('GP'))
+
+    def test_channel_post(self):
+        self.assert_inbox_synced(*self.send('CH'))
+
+
+class BulkSendPermissionTests(TestCase):
+    """ارسال دسته‌ای همان محدودیت‌های ارسال تک پیام را دارد"""
+
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name='member', dev_name='member')
+        cls.sender, cls.receiver = create_user(role, 'sender'), create_user(role, 'receiver')
+
+    def create_chat(self, chat_type, **sender_permissions):
+        chat = ChatRoom.objects.create(name=chat_type, type=chat_type)
+        Participant.objects.create(chat=chat, user=self.sender, role='OW', **sender_permissions)
+        Participant.objects.create(chat=chat, user=self.receiver)
+        return chat
+
+    def send(self, chat, items):
+        return ChatManagementByDB(self.sender).send_messages_bulk(chat.id, items)
+
+    def test_gif_rejected_without_permission(self):
+        chat = self.create_chat('GP', can_send_gifs=False)
+        status_code, _ = self.send(chat, [{'text': 'hi'}, {'message_type': 'gif'}])
+        self.assertEqual(status_code, 400)
+        self.assertFalse(Message.objects.filter(chat=chat).exists())
+        self.assertEqual(self.send(chat, [{'text': 'hi'}])[0], 201)
+
+    def test_blocked_pv_rejected(self):
+        chat = self.create_chat('PV')
+        BlockUser.objects.create(user=self.receiver, blocked_user=self.sender)
+        self.assertEqual(self.send(chat, [{'text': 'hi'}])[0], 400)
+        self.assertFalse(Message.objects.filter(chat=chat).exists())
+
+
+class ChatRoomConsumerTests(TransactionTestCase):
+    """اتصال مخصوص یک کانال با بن شدن کاربر بسته می‌شود و فریم نامعتبر پاسخ خطا می‌گیرد"""
+
+    def setUp(self):
+        role = Role.objects.create(name='member', dev_name='member')
+        self.owner, self.member = create_user(role, 'owner'), create_user(role, 'member')
+        self.chat = ChatRoom.objects.create(name='channel', type='CH')
+        Participant.objects.create(chat=self.chat, user=self.owner, role='OW')
+        self.participant = Participant.objects.create(chat=self.chat, user=self.member)
+
+    async def connect(self, chat_id=None):
+        communicator = ApplicationCommunicator(ChatRoomConsumer.as_asgi(), {
+            'type': 'websocket', 'path': '/ws/chat/', 'query_string': b'', 'headers': [],
+            'subprotocols': [], 'user': self.member,
+            'url_route': {'args': (), 'kwargs': {'chat_id': chat_id} if chat_id else {}},
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await communicator.receive_output(5))['type'], 'websocket.accept')
+        return communicator
+
+    @staticmethod
+    async def receive_frame(communicator):
+        return json.loads((await communicator.receive_output(5))['text'])
+
+    async def test_non_object_frame_gets_error(self):
+        communicator = await self.connect()
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps([1, 2])})
+        self.assertEqual((await self.receive_frame(communicator))['type'], 'error')
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps({'action': 'ping'})})
+        self.assertEqual(await self.receive_frame(communicator), {'type': 'pong'})
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(5)
+
+    async def test_banned_member_channel_connection_is_closed(self):
+        communicator = await self.connect(self.chat.id)
+        self.participant.role = 'BA'
+        await self.participant.asave()
+        self.assertEqual(await self.receive_frame(communicator), {'type': 'removed', 'chat_id': self.chat.id})
+        self.assertEqual(await communicator.receive_output(5), {'type': 'websocket.close', 'code': 4003})
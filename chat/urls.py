@@ -6,10 +6,24 @@ urlpatterns = [
 
     path('/<int:chat_id>/messages/<int:page_size>/<int:from_sequence>/<int:to_sequence>', views.MessageAPIView.as_view(),
          name='chat-messages-paginated-with-sequence-zone'),
+    path('/<int:chat_id>/messages/<int:page_size>/before/<int:before_sequence>', views.MessageAPIView.as_view(),
+         name='chat-messages-paginated-before-sequence'),
+    path('/<int:chat_id>/messages/<int:page_size>/after/<int:after_sequence>', views.MessageAPIView.as_view(),
+         name='chat-messages-paginated-after-sequence'),
+    path('/<int:chat_id>/messages/<int:message_id>/reactions/<int:page_size>', views.MessageReactionAPIView.as_view(),
+         name='chat-message-reactions'),
+    path('/<int:chat_id>/messages/<int:message_id>/reactions/<int:page_size>/<int:last_reaction_id>',
+         views.MessageReactionAPIView.as_view(), name='chat-message-reactions-paginated-with-last-reaction-id'),
+    path('/<int:chat_id>/messages/bulk', views.MessageBulkAPIView.as_view(), name='chat-messages-bulk'),
+    path('/<int:chat_id>/read', views.MessageReadAPIView.as_view(), name='chat-messages-read'),
+    path('/<int:chat_id>/read/<int:sequence_number>', views.MessageReadAPIView.as_view(),
+         name='chat-messages-read-until-sequence'),
     path('/chatrooms/<int:page_size>', views.ChatRoomAPIView.as_view(),
          name='chat-rooms'),
     path('/chatrooms/<int:page_size>/<int:last_chat_room_id>', views.ChatRoomAPIView.as_view(),
          name='chat-rooms-paginated-with-last-chat-room-id'),
+    path('/chatrooms/<int:page_size>/cursor/<str:cursor>', views.ChatRoomAPIView.as_view(),
+         name='chat-rooms-paginated-with-cursor'),
     path('/chatrooms/join/<int:id>', views.ChatRoomAPIView.as_view(),
          name='chat-rooms-public-join-with-chat-room-id'),
     path('/chatrooms/join/<int:id>/<str:join_hash>', views.ChatRoomAPIView.as_view(),
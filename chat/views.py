@@ -2,17 +2,16 @@ from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django.http import HttpRequest
-from authentication import auth
 from HooshaAI.settings import CUSTOM_ACCESS_TOKEN_NAME
 from rest_framework.response import Response
 from rest_framework import status
-from utils.chat_management import ChatManagementByDB
+from utils.chat_management import ChatManagementByDB, decode_inbox_cursor
 
 
 class MessageAPIView(APIView):
 
     @swagger_auto_schema(
-        operation_description="برگرداندن پیام های چت روم کاربر .",
+        operation_description="برگرداندن پیام های چت روم کاربر بر اساس sequence_number .\nبدون پارامتر: آخرین پیام‌ها\nbefore: پیام‌های قدیمی‌تر از sequence\nafter: پیام‌های جدیدتر از sequence\nfrom/to: پنجره بسته\nخروجی همیشه از جدید به قدیم است .",
         manual_parameters=[
             openapi.Parameter(
                 CUSTOM_ACCESS_TOKEN_NAME,
@@ -58,9 +57,10 @@ class MessageAPIView(APIView):
                 )
         },
     )
-    def get(self, request: HttpRequest, chat_id, page_size, from_sequence=None, to_sequence=None):
-        user = auth.get_authenticated_user_from_request(request)
-        if not user:
+    def get(self, request: HttpRequest, chat_id, page_size, from_sequence=None, to_sequence=None,
+            before_sequence=None, after_sequence=None):
+        user = request.user
+        if not user.is_authenticated:
             data = {
                 'errors': {
                     'fa': [
@@ -125,40 +125,39 @@ class MessageAPIView(APIView):
                 }
             }
             return Response(data, status=status.HTTP_400_BAD_REQUEST)
-        if from_sequence:
-            try:
-                if from_sequence <= 0:
-                    data = {
-                        'errors': {
-                            'fa': [
-                                'اعداد بازه مورد درخواست باید مثبت باشد !',
-                            ],
-                            'en': [
-                                'last_ms_id must be greater than 0 !',
-                            ]
-                        }
-                    }
-                    return Response(data, status=status.HTTP_400_BAD_REQUEST)
-            except ValueError:
+        for sequence in (from_sequence, to_sequence, before_sequence, after_sequence):
+            if sequence is not None and sequence <= 0:
                 data = {
                     'errors': {
                         'fa': [
-                            'آیدی آخرین پیام مورد درخواست باید عدد صحیح باشد !',
+                            'شماره ترتیب پیام مورد درخواست باید مثبت باشد !',
                         ],
                         'en': [
-                            'page_size must be an integer !',
+                            'sequence numbers must be greater than 0 !',
                         ]
                     }
                 }
                 return Response(data, status=status.HTTP_400_BAD_REQUEST)
-        messages = chat.messages(chat_id, page_size, last_ms_id)
+        if from_sequence is not None and to_sequence is not None and from_sequence > to_sequence:
+            data = {
+                'errors': {
+                    'fa': [
+                        'ابتدای بازه نباید از انتهای آن بزرگتر باشد !',
+                    ],
+                    'en': [
+                        'from_sequence must not be greater than to_sequence !',
+                    ]
+                }
+            }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        messages = chat.messages(chat_id, page_size, before_sequence, after_sequence, from_sequence, to_sequence)
         return Response(messages[1], status=messages[0])
 
 
 class ChatRoomAPIView(APIView):
 
     @swagger_auto_schema(
-        operation_description="برگرداندن چت روم های کاربر .",
+        operation_description="برگرداندن چت روم های کاربر .\nunread_count پیام‌های حذف شده را نمی‌شمارد و حداکثر CHAT_UNREAD_COUNT_LIMIT (۱۰۰۰) است .",
         manual_parameters=[
             openapi.Parameter(
                 CUSTOM_ACCESS_TOKEN_NAME,
@@ -204,9 +203,9 @@ class ChatRoomAPIView(APIView):
                 )
         },
     )
-    def get(self, request: HttpRequest, page_size, last_chat_room_id=None):
-        user = auth.get_authenticated_user_from_request(request)
-        if not user:
+    def get(self, request: HttpRequest, page_size, last_chat_room_id=None, cursor=None):
+        user = request.user
+        if not user.is_authenticated:
             data = {
                 'errors': {
                     'fa': [
@@ -272,7 +271,22 @@ class ChatRoomAPIView(APIView):
                     }
                 }
                 return Response(data, status=status.HTTP_400_BAD_REQUEST)
-        chat_rooms = chat.get_chat_rooms(page_size, last_chat_room_id, request)
+        if cursor is not None:
+            try:
+                decode_inbox_cursor(cursor)
+            except ValueError:
+                data = {
+                    'errors': {
+                        'fa': [
+                            'کرسر صفحه‌بندی چت‌ها نامعتبر است !',
+                        ],
+                        'en': [
+                            'cursor is invalid !',
+                        ]
+                    }
+                }
+                return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        chat_rooms = chat.get_chat_rooms(page_size, last_chat_room_id, request, cursor=cursor)
         return Response(chat_rooms[1], status=chat_rooms[0])
 
     @swagger_auto_schema(
@@ -323,8 +337,8 @@ class ChatRoomAPIView(APIView):
         },
     )
     def put(self, request: HttpRequest, id, join_hash=None):
-        user = auth.get_authenticated_user_from_request(request)
-        if not user:
+        user = request.user
+        if not user.is_authenticated:
             data = {
                 'errors': {
                     'fa': [
@@ -388,8 +402,8 @@ class ChatRoomAPIView(APIView):
         },
     )
     def post(self, request: HttpRequest, username):
-        user = auth.get_authenticated_user_from_request(request)
-        if not user:
+        user = request.user
+        if not user.is_authenticated:
             data = {
                 'errors': {
                     'fa': [
@@ -405,3 +419,204 @@ class ChatRoomAPIView(APIView):
         result = chat.create_pv_chat_room(username, request)
         return Response(data=result[1], status=result[0])
 
+
+
+class MessageBulkAPIView(APIView):
+
+    @swagger_auto_schema(
+        operation_description="ارسال دسته‌ای پیام‌ها به یک چت روم (ایمپورت، ربات‌ها و برادکست) .",
+        manual_parameters=[
+            openapi.Parameter(
+                CUSTOM_ACCESS_TOKEN_NAME,
+                openapi.IN_HEADER,
+                description="توکن احراز هویت کاربر",
+                type=openapi.TYPE_STRING,
+                required=True
+            ),
+        ],
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'messages': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(
+                        type=openapi.TYPE_OBJECT,
+                        properties={
+                            'text': openapi.Schema(type=openapi.TYPE_STRING, description='متن پیام'),
+                            'message_type': openapi.Schema(type=openapi.TYPE_STRING, default='text'),
+                            'parent': openapi.Schema(type=openapi.TYPE_INTEGER, description='آیدی پیام ریپلای شده از همین چت'),
+                        }
+                    )
+                ),
+            },
+            required=['messages']
+        ),
+        responses={
+            400: openapi.Response(
+                description="مشکلی در احراز هویت یا داده‌های ارسالی",
+                examples={
+                    "application/json": "Access Token Required"
+                }
+            ),
+            201: openapi.Response(
+                description="پیام‌های ثبت شده به ترتیب شماره ترتیب . ",
+                examples={
+                    "application/json": [
+                        {
+                            "id": 120,
+                            "uuid": "6f1c1d0e-5c0a-4a57-9d0e-3c7b8f0c1a11",
+                            "sequence_number": 41,
+                            "date": "2025-09-04T17:00:00Z"
+                        }
+                    ]
+                }
+            )
+        },
+    )
+    def post(self, request, chat_id):
+        user = request.user
+        if not user.is_authenticated:
+            data = {
+                'errors': {
+                    'fa': [
+                        'نشست شما اعتبار ندارد مجددا وارد شوید!',
+                    ],
+                    'en': [
+                        'Your session is invalid. Please log in again!',
+                    ]
+                }
+            }
+            return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
+        chat = ChatManagementByDB(user)
+        messages = request.data.get('messages') if isinstance(request.data, dict) else request.data
+        result = chat.send_messages_bulk(chat_id, messages)
+        return Response(data=result[1], status=result[0])
+
+
+class MessageReadAPIView(APIView):
+
+    @swagger_auto_schema(
+        operation_description="علامت زدن پیام‌های چت روم به عنوان خوانده شده تا sequence مشخص یا تا آخرین پیام .",
+        manual_parameters=[
+            openapi.Parameter(
+                CUSTOM_ACCESS_TOKEN_NAME,
+                openapi.IN_HEADER,
+                description="توکن احراز هویت کاربر",
+                type=openapi.TYPE_STRING,
+                required=True
+            ),
+        ],
+        responses={
+            400: openapi.Response(
+                description="مشکلی در احراز هویت و اکسس توکن کاربر\nاگه Access Token Required اومد اطلاعات درست ارسال نشده\nاگه Invalid token اومد توکن اشتباهه\nاگه Token expired اومد توکن منقضی شده",
+                examples={
+                    "application/json": "Access Token Required"
+                }
+            ),
+            200: openapi.Response(
+                description="اشاره‌گر خوانده شده و تعداد پیام‌های خوانده نشده باقی مانده .\nunread_count پیام‌های حذف شده را نمی‌شمارد و حداکثر CHAT_UNREAD_COUNT_LIMIT (۱۰۰۰) است . ",
+                examples={
+                    "application/json": {
+                        "last_read_sequence": 41,
+                        "unread_count": 0
+                    }
+                }
+            )
+        },
+    )
+    def put(self, request: HttpRequest, chat_id, sequence_number=None):
+        user = request.user
+        if not user.is_authenticated:
+            data = {
+                'errors': {
+                    'fa': [
+                        'نشست شما اعتبار ندارد مجددا وارد شوید!',
+                    ],
+                    'en': [
+                        'Your session is invalid. Please log in again!',
+                    ]
+                }
+            }
+            return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
+        chat = ChatManagementByDB(user)
+        result = chat.mark_read(chat_id, sequence_number)
+        return Response(data=result[1], status=result[0])
+
+
+class MessageReactionAPIView(APIView):
+
+    @swagger_auto_schema(
+        operation_description="لیست کامل واکنش‌دهندگان یک پیام با صفحه‌بندی (جدیدترین اول) .\nبا پارامتر emoji فقط واکنش‌های همان ایموجی برگردانده می‌شود .",
+        manual_parameters=[
+            openapi.Parameter(
+                CUSTOM_ACCESS_TOKEN_NAME,
+                openapi.IN_HEADER,
+                description="توکن احراز هویت کاربر",
+                type=openapi.TYPE_STRING,
+                required=True
+            ),
+            openapi.Parameter(
+                'emoji',
+                openapi.IN_QUERY,
+                description="فیلتر بر اساس ایموجی",
+                type=openapi.TYPE_STRING,
+                required=False
+            ),
+        ],
+        responses={
+            400: openapi.Response(
+                description="مشکلی در احراز هویت و اکسس توکن کاربر\nاگه Access Token Required اومد اطلاعات درست ارسال نشده\nاگه Invalid token اومد توکن اشتباهه\nاگه Token expired اومد توکن منقضی شده",
+                examples={
+                    "application/json": "Access Token Required"
+                }
+            ),
+            200: openapi.Response(
+                description="واکنش‌ها به همراه اطلاعات کاربر . ",
+                examples={
+                    "application/json": [
+                        {
+                            "id": 12,
+                            "user": {
+                                "username": "mahdi_abbasi_from_api",
+                                "full_name": "مهدی عباسی",
+                            },
+                            "reaction_type": "emoji",
+                            "emoji": "👍",
+                            "sticker": None,
+                            "date": "2025-09-04T17:00:00Z"
+                        }
+                    ]
+                }
+            )
+        },
+    )
+    def get(self, request: HttpRequest, chat_id, message_id, page_size, last_reaction_id=None):
+        user = request.user
+        if not user.is_authenticated:
+            data = {
+                'errors': {
+                    'fa': [
+                        'نشست شما اعتبار ندارد مجددا وارد شوید!',
+                    ],
+                    'en': [
+                        'Your session is invalid. Please log in again!',
+                    ]
+                }
+            }
+            return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
+        if page_size <= 0:
+            data = {
+                'errors': {
+                    'fa': [
+                        'تعداد واکنش مورد درخواست باید مثبت باشد !',
+                    ],
+                    'en': [
+                        'page_size must be greater than 0 !',
+                    ]
+                }
+            }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        chat = ChatManagementByDB(user)
+        result = chat.message_reactions(chat_id, message_id, page_size, last_reaction_id,
+                                        request.GET.get('emoji'))
+        return Response(data=result[1], status=result[0])
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0007_customuser_can_message_me'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='customuser',
+            name='is_online',
+        ),
+    ]
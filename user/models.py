@@ -16,7 +16,6 @@ class CustomUser(models.Model):
     avatar_url = models.ImageField(upload_to='avatars', null=True, blank=True)
     role = models.ForeignKey(Role, on_delete=models.PROTECT, related_name='users', verbose_name='user role')
     is_active = models.BooleanField(default=True)
-    is_online = models.BooleanField(default=False)
     can_message_me = models.BooleanField(default=True)
     last_seen = models.DateTimeField(default=timezone.now)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -29,21 +28,41 @@ class CustomUser(models.Model):
         verbose_name = 'CustomUser'
         verbose_name_plural = 'CustomUsers'
 
+    # برای DRF و channels که request.user / scope['user'] را مثل کاربر جنگو بررسی می‌کنند
+    is_authenticated = True
+    is_anonymous = False
+
     def set_password(self, raw_password):
         self.password = make_password(raw_password)
         self.save()
 
     def check_password(self, raw_password):
-        return check_password(raw_password, self.password)
+        def setter(raw):
+            # هش دوباره با تنظیمات فعلی هشر (مثلا تغییر PASSWORD_PBKDF2_ITERATIONS)
+            self.password = make_password(raw)
+            CustomUser.objects.filter(pk=self.pk).update(password=self.password)
+
+        return check_password(raw_password, self.password, setter)
 
     def active_sessions_count(self):
-        from authentication.models import RefreshToken
-        now = timezone.now()
-        return RefreshToken.objects.filter(user=self, expires_at__gt=now).count()
+        from authentication.models import SessionRegistry
+        registry = SessionRegistry.objects.filter(user=self).first()
+        return len(registry.live_sessions()) if registry else 0
+
+    @property
+    def is_online(self):
+        """وضعیت آنلاین از presence store (user/presence.py)، نه ستون دیتابیس"""
+        from user.presence import get_presence
+        return get_presence().is_online(self.id)
 
     def update_last_seen(self):
+        """
+        heartbeat حضور کاربر؛ فقط در presence store نوشته می‌شود و last_seen
+        به صورت دسته‌ای و دوره‌ای در دیتابیس ذخیره می‌شود (user/presence.py)
+        """
+        from user.presence import get_presence
         self.last_seen = timezone.now()
-        self.save()
+        get_presence().heartbeat(self.id)
 
     def to_dict(self):
         data = {
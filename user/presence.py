@@ -0,0 +1,276 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class BasePresenceStore:
+    """
+    نگهداری وضعیت آنلاین کاربران با TTL؛ مقدار هر کلید زمان آخرین heartbeat (epoch) است.
+    کاربری که تا ttl ثانیه heartbeat نفرستد خودکار آفلاین حساب می‌شود.
+    تعداد اتصال‌های باز هر کاربر (در همه پروسس‌ها) هم با همین TTL کنار آن نگه داشته
+    و با هر heartbeat تمدید می‌شود؛ شمارنده پروسسی که بدون بستن اتصال‌ها مرده با انقضا پاک می‌شود.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl or getattr(settings, 'PRESENCE_TTL', 60)
+
+    def touch(self, user_id, seen_at):
+        raise NotImplementedError
+
+    def remove(self, user_id):
+        raise NotImplementedError
+
+    def add_connection(self, user_id) -> int:
+        """افزایش تعداد اتصال‌های باز کاربر؛ تعداد جدید را برمی‌گرداند"""
+        raise NotImplementedError
+
+    def remove_connection(self, user_id) -> int:
+        """کاهش تعداد اتصال‌های باز کاربر؛ تعداد باقی مانده (حداقل صفر) را برمی‌گرداند"""
+        raise NotImplementedError
+
+    def connection_count(self, user_id) -> int:
+        raise NotImplementedError
+
+    def get_many(self, user_ids) -> dict:
+        """user_id -> زمان آخرین heartbeat فقط برای کاربران آنلاین"""
+        raise NotImplementedError
+
+
+class InProcessPresenceStore(BasePresenceStore):
+    """دیکشنری داخل پروسس؛ برای اجرای تک پروسسی و تست"""
+
+    def __init__(self, ttl=None):
+        super().__init__(ttl)
+        self._data = {}
+        self._connections = {}  # user_id -> (تعداد, زمان انقضا)
+        self._lock = threading.Lock()
+
+    def touch(self, user_id, seen_at):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[user_id] = (seen_at, expires)
+            if user_id in self._connections:
+                self._connections[user_id] = (self._connections[user_id][0], expires)
+
+    def remove(self, user_id):
+        with self._lock:
+            self._data.pop(user_id, None)
+
+    def _live_connections(self, user_id):
+        item = self._connections.get(user_id)
+        return item[0] if item is not None and item[1] > time.monotonic() else 0
+
+    def add_connection(self, user_id) -> int:
+        with self._lock:
+            count = self._live_connections(user_id) + 1
+            self._connections[user_id] = (count, time.monotonic() + self.ttl)
+        return count
+
+    def remove_connection(self, user_id) -> int:
+        with self._lock:
+            count = self._live_connections(user_id) - 1
+            if count > 0:
+                self._connections[user_id] = (count, self._connections[user_id][1])
+            else:
+                self._connections.pop(user_id, None)
+        return max(count, 0)
+
+    def connection_count(self, user_id) -> int:
+        with self._lock:
+            return self._live_connections(user_id)
+
+    def get_many(self, user_ids) -> dict:
+        now = time.monotonic()
+        result = {}
+        with self._lock:
+            for user_id in user_ids:
+                item = self._data.get(user_id)
+                if item is None:
+                    continue
+                if item[1] <= now:
+                    del self._data[user_id]
+                    continue
+                result[user_id] = item[0]
+        return result
+
+
+class CachePresenceStore(BasePresenceStore):
+    """
+    روی کش جنگو (CACHES[PRESENCE_CACHE_ALIAS]) ساخته شده است.
+    با LocMemCache داخل پروسس و با RedisCache بین همه پروسس‌ها مشترک است
+    (هر سرور سازگار با Redis مثل redis-server یا keydb محلی کافی است).
+    """
+
+    key_prefix = 'presence:'
+    connections_prefix = 'presence:conn:'
+
+    def __init__(self, ttl=None, alias=None):
+        super().__init__(ttl)
+        self.cache = caches[alias or getattr(settings, 'PRESENCE_CACHE_ALIAS', 'default')]
+
+    def touch(self, user_id, seen_at):
+        self.cache.set(f'{self.key_prefix}{user_id}', seen_at, timeout=self.ttl)
+        self.cache.touch(f'{self.connections_prefix}{user_id}', timeout=self.ttl)
+
+    def remove(self, user_id):
+        self.cache.delete(f'{self.key_prefix}{user_id}')
+
+    def add_connection(self, user_id) -> int:
+        key = f'{self.connections_prefix}{user_id}'
+        # add فقط اگر کلید نباشد می‌نویسد و incr اتمیک است (INCR در Redis)
+        self.cache.add(key, 0, timeout=self.ttl)
+        try:
+            count = self.cache.incr(key)
+        except ValueError:
+            # کلید بین add و incr منقضی شد
+            self.cache.add(key, 1, timeout=self.ttl)
+            return 1
+        self.cache.touch(key, timeout=self.ttl)
+        return count
+
+    def remove_connection(self, user_id) -> int:
+        key = f'{self.connections_prefix}{user_id}'
+        try:
+            count = self.cache.decr(key)
+        except ValueError:
+            # شمارنده منقضی شده؛ اتصال زنده‌ای heartbeat نفرستاده است
+            return 0
+        if count <= 0:
+            self.cache.delete(key)
+        return max(count, 0)
+
+    def connection_count(self, user_id) -> int:
+        return max(self.cache.get(f'{self.connections_prefix}{user_id}', 0), 0)
+
+    def get_many(self, user_ids) -> dict:
+        keys = {f'{self.key_prefix}{user_id}': user_id for user_id in user_ids}
+        return {keys[key]: value for key, value in self.cache.get_many(list(keys)).items()}
+
+
+class PresenceService:
+    """
+    heartbeat فقط در store نوشته می‌شود و هیچ کوئری SQL ندارد.
+    last_seen کاربران در حافظه جمع می‌شود و هر PRESENCE_FLUSH_INTERVAL ثانیه
+    توسط یک ترد پس‌زمینه با bulk_update در دیتابیس نوشته می‌شود.
+    """
+
+    def __init__(self, store: BasePresenceStore, flush_interval=None, batch_size=500):
+        self.store = store
+        self.flush_interval = flush_interval or getattr(settings, 'PRESENCE_FLUSH_INTERVAL', 30)
+        self.batch_size = batch_size
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._flusher = None
+        self._stopped = threading.Event()
+
+    def heartbeat(self, user_id):
+        now = time.time()
+        self.store.touch(user_id, now)
+        with self._pending_lock:
+            self._pending[user_id] = now
+        self._ensure_flusher()
+
+    def set_offline(self, user_id):
+        self.store.remove(user_id)
+        with self._pending_lock:
+            self._pending[user_id] = time.time()
+        self._ensure_flusher()
+
+    def set_offline_if_idle(self, user_id):
+        """آفلاین کردن فقط وقتی که کاربر در هیچ پروسسی اتصال بازی ندارد (مثلاً هنگام خروج یک دستگاه)"""
+        if self.store.connection_count(user_id) <= 0:
+            self.set_offline(user_id)
+
+    def connection_opened(self, user_id):
+        self.store.add_connection(user_id)
+        self.heartbeat(user_id)
+
+    def connection_closed(self, user_id):
+        """
+        شمارنده اتصال‌ها در store مشترک است؛ کاربر فقط با بسته شدن آخرین اتصالش
+        در همه پروسس‌ها آفلاین می‌شود
+        """
+        if self.store.remove_connection(user_id) <= 0:
+            self.set_offline(user_id)
+
+    def is_online(self, user_id) -> bool:
+        return user_id in self.store.get_many([user_id])
+
+    def bulk_is_online(self, user_ids) -> dict:
+        """user_id -> bool برای یک صفحه از کاربران با یک رفت و برگشت به store"""
+        user_ids = list(set(user_ids))
+        online = self.store.get_many(user_ids) if user_ids else {}
+        return {user_id: user_id in online for user_id in user_ids}
+
+    def flush(self):
+        """نوشتن last_seen های جمع شده در دیتابیس؛ تعداد ردیف‌های نوشته شده را برمی‌گرداند"""
+        from user.models import CustomUser
+
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        users = [
+            CustomUser(id=user_id, last_seen=datetime.fromtimestamp(seen_at, tz=dt_timezone.utc))
+            for user_id, seen_at in pending.items()
+        ]
+        try:
+            CustomUser.objects.bulk_update(users, ['last_seen'], batch_size=self.batch_size)
+        except Exception:
+            # برگرداندن به صف تا در دور بعد دوباره نوشته شوند (مقدار جدیدتر برنده است)
+            with self._pending_lock:
+                for user_id, seen_at in pending.items():
+                    if self._pending.get(user_id, 0) < seen_at:
+                        self._pending[user_id] = seen_at
+            raise
+        return len(users)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._pending_lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(target=self._run_flusher, name='presence-flusher', daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self):
+        from django.db import close_old_connections
+
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                # صف دست نخورده می‌ماند و دور بعد دوباره تلاش می‌شود
+                logger.exception('presence last_seen flush failed')
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+
+
+_presence = None
+_presence_lock = threading.Lock()
+
+
+def get_presence() -> PresenceService:
+    global _presence
+    if _presence is None:
+        with _presence_lock:
+            if _presence is None:
+                store_class = import_string(
+                    getattr(settings, 'PRESENCE_STORE', 'user.presence.CachePresenceStore')
+                )
+                _presence = PresenceService(store_class())
+                atexit.register(_presence.stop)
+    return _presence
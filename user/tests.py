@@ -1,3 +1,40 @@
+from django.core.cache import caches
 from django.test import TestCase
 
-# Create your tests here.
+from user.presence import CachePresenceStore, InProcessPresenceStore, PresenceService
+
+
+class PresenceConnectionCountTests(TestCase):
+    """تعداد اتصال‌ها در store مشترک است؛ بستن اتصال در یک پروسس کاربرِ وصل در پروسس دیگر را آفلاین نمی‌کند"""
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def check_store(self, store):
+        # دو سرویس روی یک store مثل دو پروسس ASGI
+        first, second = PresenceService(store), PresenceService(store)
+        first.connection_opened(7)
+        second.connection_opened(7)
+
+        first.connection_closed(7)
+        self.assertTrue(second.is_online(7))
+        first.set_offline_if_idle(7)
+        self.assertTrue(second.is_online(7))
+
+        second.connection_closed(7)
+        self.assertFalse(first.is_online(7))
+        self.assertEqual(store.connection_count(7), 0)
+
+    def test_cache_store(self):
+        self.check_store(CachePresenceStore())
+
+    def test_in_process_store(self):
+        self.check_store(InProcessPresenceStore())
+
+    def test_unmatched_close_does_not_go_negative(self):
+        store = CachePresenceStore()
+        service = PresenceService(store)
+        service.connection_closed(7)
+        service.connection_opened(7)
+        self.assertEqual(store.connection_count(7), 1)
+        self.assertTrue(service.is_online(7))
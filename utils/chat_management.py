@@ -1,70 +1,99 @@
 from django.db.models.expressions import result
 
-from user.models import CustomUser
-from chat.models import ChatRoom, Participant, Message
-from django.db.models import Q, Count, OuterRef, Subquery
-from django.db.models.functions import Coalesce
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+
+from user.models import CustomUser, BlockUser
+from chat.models import ChatRoom, Participant, Message, MessageReaction
+from django.db.models import Q, F, Value
+from django.db.models.functions import Greatest, Least
 
 
 from chat.serializers import ChatRoomSerializer, MessageSerializer, ChatRoomListSerializer, ParticipantPVSerializer, \
-    ChatRoomCreateSerializer
+    ChatRoomCreateSerializer, MessageBulkCreateSerializer, MessageReactionSerializer
 from rest_framework import status
+from utils.sequence_allocator import get_sequence_allocator
+from chat.realtime import publish_messages
+
+
+INBOX_CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_inbox_cursor(inbox_date, chat_id):
+    """کرسر صندوق ورودی: میکروثانیه از epoch و آیدی چت"""
+    return f'{(inbox_date - INBOX_CURSOR_EPOCH) // timedelta(microseconds=1)}_{chat_id}'
+
+
+def decode_inbox_cursor(cursor):
+    """برگرداندن (inbox_date, chat_id) یا ValueError برای کرسر نامعتبر"""
+    microseconds, chat_id = cursor.split('_', 1)
+    try:
+        return INBOX_CURSOR_EPOCH + timedelta(microseconds=int(microseconds)), int(chat_id)
+    except OverflowError:
+        # تاریخ خارج از بازه datetime
+        raise ValueError('inbox cursor out of range')
 
 
 class ChatManagementByDB:
     def __init__(self, user: CustomUser):
         self.user = user
 
-    def get_count_unread_ms(self, chatroom: ChatRoom) -> int:  # باید تست بشه
-        unread_count = Message.objects.filter(
-            chat=chatroom
-        ).exclude(
-            Q(sender=self.user) |
-            Q(message_views__user=self.user)
-        ).count()
-
-        return unread_count
+    def get_count_unread_ms(self, chatroom: ChatRoom) -> int:
+        participant = Participant.objects.filter(chat=chatroom, user=self.user).only(
+            'chat_id', 'last_read_sequence').first()
+        if not participant:
+            return 0
+        return participant.unread_count
 
-    def get_chat_rooms(self, page_size, last_chat_room_id=None, request=None):
-        queryset = ChatRoom.objects.filter(
-            participants__user=self.user
-        ).distinct().annotate(
-            unread_count=Count(
-                'messages',
-                distinct=True,
-                filter=Q(~Q(messages__sender=self.user) & ~Q(messages__message_views__user=self.user))
-            ),
-            effective_order_date=Coalesce('last_message_date', 'updated_at')
-        ).select_related('last_message', 'last_message__sender')
-
-        if last_chat_room_id:
-            # گرفتن آخرین چت با annotate
-            try:
-                last_chat_room = ChatRoom.objects.filter(pk=last_chat_room_id).annotate(
-                    effective_order_date=Coalesce('last_message_date', 'updated_at')
-                ).get()
-                queryset = queryset.filter(
-                    Q(effective_order_date__gt=last_chat_room.effective_order_date) |
-                    Q(effective_order_date=last_chat_room.effective_order_date, id__gt=last_chat_room.id)
-                )
-            except ChatRoom.DoesNotExist:
-                # اگر آخرین چت پیدا نشد، ادامه از ابتدا
-                pass
+    def get_chat_rooms(self, page_size, last_chat_room_id=None, request=None, cursor=None):
+        """
+        صندوق ورودی کاربر با صفحه‌بندی keyset روی (inbox_date, chat_id)
+        از ایندکس chat_partic_inbox_idx استفاده می‌کند پس هزینه صفحه N با صفحه اول برابر است.
+        """
+        queryset = Participant.objects.filter(user=self.user)
 
-        queryset = queryset.order_by('-effective_order_date', '-id')
+        anchor = None
+        if cursor:
+            anchor = decode_inbox_cursor(cursor)
+        elif last_chat_room_id:
+            # سازگاری با آدرس قدیمی: پیدا کردن جایگاه چت با ایندکس یکتای (user, chat)
+            anchor = queryset.filter(chat_id=last_chat_room_id).values_list('inbox_date', 'chat_id').first()
+        if anchor:
+            anchor_date, anchor_chat_id = anchor
+            queryset = queryset.filter(
+                Q(inbox_date__lt=anchor_date) |
+                Q(inbox_date=anchor_date, chat_id__lt=anchor_chat_id)
+            )
 
-        chat_rooms = list(queryset[:page_size])
+        queryset = queryset.order_by('-inbox_date', '-chat_id')
+        participants = list(self._inbox_queryset(queryset)[:page_size])
 
-        if not chat_rooms:
+        if not participants:
             return status.HTTP_404_NOT_FOUND, None
 
-        request.user = self.user
+        return status.HTTP_200_OK, self._serialize_inbox(participants, request)
+
+    def _inbox_queryset(self, queryset):
+        return MessageSerializer.setup_eager_loading(
+            queryset.select_related('chat', 'chat__last_message'), prefix='chat__last_message__', user=self.user
+        ).annotate(unread=Participant.unread_count_expression())
+
+    def _serialize_inbox(self, participants, request):
+        chat_rooms = []
+        for participant in participants:
+            chat_room = participant.chat
+            chat_room.unread_count = participant.unread_count
+            chat_room.inbox_cursor = encode_inbox_cursor(participant.inbox_date, participant.chat_id)
+            chat_rooms.append(chat_room)
+
         serializer = ChatRoomListSerializer(
             chat_rooms,
             many=True,
             context={'request': request}
         )
-        return status.HTTP_200_OK, serializer.data
+        return serializer.data
 
     def create_gpy_chat_room(self, serializer: ChatRoomSerializer):
         chat = serializer.save(creator=self.user)
@@ -99,8 +128,8 @@ class ChatManagementByDB:
                 defaults={'role': 'ME'}
             )
             if created:
-                chat_room.member_count += 1
-                chat_room.save()
+                # member_count در Participant.save با F() افزایش پیدا می‌کند؛ ذخیره کامل ردیف چت
+                # مقدار last_sequence را با مقدار قدیمی بازنویسی می‌کرد
                 return status.HTTP_201_CREATED, None
             return status.HTTP_200_OK, None
         return status.HTTP_403_FORBIDDEN, None
@@ -182,7 +211,6 @@ class ChatManagementByDB:
             'creator': self.user,
             'member_count': 2
         }
-        request.user = self.user
         serializer = ChatRoomCreateSerializer(data=data, context={'request': request})
         if serializer.is_valid(raise_exception=True):
             chat_room_new = serializer.save()
@@ -201,14 +229,161 @@ class ChatManagementByDB:
             serializer_participant = ParticipantPVSerializer(data=data_p, many=True)
             if serializer_participant.is_valid(raise_exception=True):
                 serializer_participant.save()
-                result = self.get_chat_rooms(1, chat_room_new.id - 1, request)
-                return status.HTTP_201_CREATED, result[1]
+                participant = self._inbox_queryset(
+                    Participant.objects.filter(user=self.user, chat=chat_room_new)
+                ).get()
+                return status.HTTP_201_CREATED, self._serialize_inbox([participant], request)
         return status.HTTP_403_FORBIDDEN, None
 
     def add(self):  # تابعی برای اضافه کردن کاربران به گروه یا چنل ( چون توی متد جوین یوزر درخواست میده که بپیونده و حتما باید یا پابلیک باشه اون چت یا باید لینک دعوت داشته باشه
         ...
 
-    def messages(self, id, page_size, last_ms_id):
+    def messages(self, id, page_size, before_sequence=None, after_sequence=None,
+                 from_sequence=None, to_sequence=None):
+        if not Participant.objects.filter(chat_id=id, user=self.user).exists():
+            if not ChatRoom.objects.filter(id=id).exists():
+                data = {
+                    'errors': {
+                        'fa': [
+                            'چت پیدا نشد !',
+                        ],
+                        'en': [
+                            'chat not found !',
+                        ]
+                    }
+                }
+                return status.HTTP_404_NOT_FOUND, data
+            data = {
+                'errors': {
+                    'fa': [
+                        'شما به این چت دسترسی ندارید !',
+                    ],
+                    'en': [
+                        'You do not have access to this chat !',
+                    ]
+                }
+            }
+            return status.HTTP_403_FORBIDDEN, data
+
+        messages = MessageSerializer.setup_eager_loading(
+            Message.objects.filter(chat_id=id, is_deleted=False), user=self.user
+        )
+        messages = self.paginate_by_sequence(messages, page_size, before_sequence, after_sequence,
+                                             from_sequence, to_sequence)
+        serializer = MessageSerializer(messages, many=True)
+        return status.HTTP_200_OK, serializer.data
+
+    def paginate_by_sequence(self, queryset, page_size, before_sequence=None, after_sequence=None,
+                             from_sequence=None, to_sequence=None):
+        """
+        صفحه‌بندی پیام‌ها روی sequence_number که در هر چت یکتاست.
+        هر حالت یک range scan روی ایندکس یکتای (chat, sequence_number) است و به پیام مرجع نیازی ندارد.
+        خروجی همیشه از جدید به قدیم مرتب است.
+        - before_sequence: پیام‌های قدیمی‌تر (اسکرول به عقب)
+        - after_sequence: پیام‌های جدیدتر (اسکرول به جلو)
+        - from_sequence / to_sequence: پنجره بسته
+        - هیچ کدام: آخرین پیام‌ها
+        """
+        if from_sequence is not None and to_sequence is not None:
+            return list(
+                queryset
+                .filter(sequence_number__gte=from_sequence, sequence_number__lte=to_sequence)
+                .order_by('-sequence_number')[:page_size]
+            )
+        if after_sequence is not None:
+            messages = list(
+                queryset
+                .filter(sequence_number__gt=after_sequence)
+                .order_by('sequence_number')[:page_size]
+            )
+            messages.reverse()
+            return messages
+        if before_sequence is not None:
+            queryset = queryset.filter(sequence_number__lt=before_sequence)
+        return list(queryset.order_by('-sequence_number')[:page_size])
+
+    def message_reactions(self, id, message_id, page_size, last_reaction_id=None, emoji=None):
+        """
+        لیست کامل واکنش‌دهندگان یک پیام با صفحه‌بندی keyset روی آیدی واکنش (جدیدترین اول)
+        """
+        if not Participant.objects.filter(chat_id=id, user=self.user).exists():
+            data = {
+                'errors': {
+                    'fa': [
+                        'شما به این چت دسترسی ندارید !',
+                    ],
+                    'en': [
+                        'You do not have access to this chat !',
+                    ]
+                }
+            }
+            return status.HTTP_403_FORBIDDEN, data
+        if not Message.objects.filter(id=message_id, chat_id=id, is_deleted=False).exists():
+            data = {
+                'errors': {
+                    'fa': [
+                        'پیام پیدا نشد !',
+                    ],
+                    'en': [
+                        'message not found !',
+                    ]
+                }
+            }
+            return status.HTTP_404_NOT_FOUND, data
+
+        reactions = MessageReaction.objects.filter(message_id=message_id).select_related('user')
+        if emoji:
+            reactions = reactions.filter(emoji=emoji)
+        if last_reaction_id:
+            reactions = reactions.filter(id__lt=last_reaction_id)
+        reactions = reactions.order_by('-id')[:page_size]
+        serializer = MessageReactionSerializer(reactions, many=True)
+        return status.HTTP_200_OK, serializer.data
+
+    def mark_read(self, id, sequence_number=None):
+        """
+        علامت زدن پیام‌های چت به عنوان خوانده شده تا sequence_number (یا تا آخرین پیام ثبت شده)
+        فقط یک UPDATE روی ردیف Participant کاربر است.
+        """
+        # آخرین پیام ثبت شده، نه last_sequence که با BlockSequenceAllocator شماره‌های هنوز استفاده نشده را هم دارد
+        target = ChatRoom.committed_sequence()
+        if sequence_number is not None:
+            target = Least(Value(sequence_number), target)
+        updated = Participant.objects.filter(chat_id=id, user=self.user).update(
+            last_read_sequence=Greatest(F('last_read_sequence'), target)
+        )
+        if not updated:
+            data = {
+                'errors': {
+                    'fa': [
+                        'شما به این چت دسترسی ندارید !',
+                    ],
+                    'en': [
+                        'You do not have access to this chat !',
+                    ]
+                }
+            }
+            return status.HTTP_403_FORBIDDEN, data
+        participant = Participant.objects.only('chat_id', 'last_read_sequence').get(chat_id=id, user=self.user)
+        data = {
+            'last_read_sequence': participant.last_read_sequence,
+            'unread_count': participant.unread_count,
+        }
+        return status.HTTP_200_OK, data
+
+    def is_blocked_in_pv(self, chat_room):
+        """آیا کاربر و طرف مقابل چت خصوصی یکدیگر را مسدود کرده‌اند؟"""
+        other_ids = Participant.objects.filter(chat=chat_room).exclude(user=self.user).values_list('user_id', flat=True)
+        return BlockUser.objects.filter(
+            Q(user=self.user, blocked_user_id__in=other_ids) | Q(user_id__in=other_ids, blocked_user=self.user)
+        ).exists()
+
+    def send_messages_bulk(self, id, messages_data):
+        """
+        ارسال دسته‌ای پیام‌ها به یک چت (ایمپورت، ربات‌ها و برادکست)
+        همه شماره‌های ترتیب یک‌جا رزرو می‌شوند، پیام‌ها با bulk_create درج می‌شوند
+        و اطلاعات آخرین پیام چت فقط یک بار به‌روز می‌شود.
+        """
         chat_room = ChatRoom.objects.filter(id=id).first()
         if not chat_room:
             data = {
@@ -223,56 +398,102 @@ class ChatManagementByDB:
             }
             return status.HTTP_404_NOT_FOUND, data
 
-        if not Participant.objects.filter(chat=chat_room, user=self.user).exists():
+        participant = Participant.objects.filter(chat=chat_room, user=self.user).first()
+        can_send = (
+            participant is not None
+            and participant.can_send_messages
+            and participant.role not in ['RE', 'BA']
+            and (chat_room.type not in ['CH', 'BC'] or participant.role in ['OW', 'AD'])
+        )
+        if not can_send:
             data = {
                 'errors': {
                     'fa': [
-                        'شما به این چت دسترسی ندارید !',
+                        'شما اجازه ارسال پیام در این چت را ندارید !',
                     ],
                     'en': [
-                        'You do not have access to this chat !',
+                        'You are not allowed to send messages to this chat !',
                     ]
                 }
             }
             return status.HTTP_403_FORBIDDEN, data
-        messages = chat_room.messages.filter(is_deleted=False)
-        if messages is not None:
-            messages = self.paginate_queryset(messages, page_size, last_ms_id)
-            if not messages[0]:
-                data = {
-                    'errors': {
-                        'fa': [
-                            'پیام پیدا نشد !',
-                        ],
-                        'en': [
-                            'message not found !',
-                        ]
-                    }
+
+        max_count = getattr(settings, 'CHAT_BULK_MESSAGES_MAX', 1000)
+        if not isinstance(messages_data, list) or not 0 < len(messages_data) <= max_count:
+            data = {
+                'errors': {
+                    'fa': [
+                        f'تعداد پیام‌ها باید بین 1 و {max_count} باشد !',
+                    ],
+                    'en': [
+                        f'messages must contain between 1 and {max_count} items !',
+                    ]
                 }
-                return status.HTTP_404_NOT_FOUND, data
-            serializer = MessageSerializer(messages[1], many=True)
-            return status.HTTP_200_OK, serializer.data
-        return status.HTTP_204_NO_CONTENT, None
+            }
+            return status.HTTP_400_BAD_REQUEST, data
 
-    def paginate_queryset(self, queryset, page_size, last_ms_id=None):
-        """
-        صفحه‌بندی بهینه پیام‌ها با یک کوئری
-        """
-        if last_ms_id:
-            try:
-                last_msg = queryset.only('id', 'date').get(id=last_ms_id)
-            except queryset.model.DoesNotExist:
-                return False, None
+        serializer = MessageBulkCreateSerializer(data=messages_data, many=True, context={'chat': chat_room})
+        if not serializer.is_valid():
+            return status.HTTP_400_BAD_REQUEST, serializer.errors
 
-            messages = (
-                queryset
-                .filter(
-                    Q(date__lt=last_msg.date) |
-                    Q(date=last_msg.date, id__lt=last_msg.id)
-                )
-                .order_by('-date', '-id')[:page_size]
-            )
-        else:
-            messages = queryset.order_by('-date', '-id')[:page_size]
+        # همان محدودیت‌های ارسال تک پیام برای هر آیتم دسته
+        items = serializer.validated_data
+        has_sticker = any(item.get('sticker') or item.get('message_type') == 'sticker' for item in items)
+        has_gif = any(item.get('gif') or item.get('message_type') == 'gif' for item in items)
+        if (has_sticker and not participant.can_send_stickers) or (has_gif and not participant.can_send_gifs):
+            data = {
+                'errors': {
+                    'fa': [
+                        'شما اجازه ارسال استیکر یا گیف در این چت را ندارید !',
+                    ],
+                    'en': [
+                        'You are not allowed to send stickers or gifs to this chat !',
+                    ]
+                }
+            }
+            return status.HTTP_400_BAD_REQUEST, data
+        if chat_room.type == 'PV' and self.is_blocked_in_pv(chat_room):
+            data = {
+                'errors': {
+                    'fa': [
+                        'امکان ارسال پیام به این کاربر وجود ندارد !',
+                    ],
+                    'en': [
+                        'You can not send messages to this user !',
+                    ]
+                }
+            }
+            return status.HTTP_400_BAD_REQUEST, data
+
+        messages = [Message(chat=chat_room, sender=self.user, **item) for item in serializer.validated_data]
+        sequences = get_sequence_allocator().allocate(chat_room.id, len(messages))
+        for message, sequence_number in zip(messages, sequences):
+            message.apply_media_type()
+            message.sequence_number = sequence_number
 
-        return True, messages
+        with transaction.atomic():
+            messages = Message.objects.bulk_create(messages, batch_size=500)
+            last_message = messages[-1]
+            if last_message.pk is None:
+                # دیتابیس‌هایی که آیدی را بعد از bulk_create برنمی‌گردانند
+                last_message = Message.objects.get(chat=chat_room, sequence_number=last_message.sequence_number)
+            # همان ترتیب قفل Message.save: اول ردیف‌های عضو و در آخر ردیف چت
+            Participant.record_chat_messages(chat_room, last_message, count=len(messages))
+            ChatRoom.record_new_messages(chat_room.id, last_message, count=len(messages))
+            message_ids = [message.pk for message in messages]
+            if None in message_ids:
+                message_ids = Message.objects.filter(
+                    chat=chat_room, sequence_number__in=[message.sequence_number for message in messages]
+                ).values_list('id', flat=True)
+            publish_messages(chat_room.id, message_ids)
+
+        data = [
+            {
+                'id': message.pk,
+                'uuid': str(message.uuid),
+                'sequence_number': message.sequence_number,
+                'date': message.date,
+            }
+            for message in messages
+        ]
+        return status.HTTP_201_CREATED, data
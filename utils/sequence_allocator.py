@@ -0,0 +1,128 @@
+import threading
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+
+class BaseSequenceAllocator:
+    """
+    رزرو شماره ترتیب (sequence_number) برای پیام‌های یک چت.
+    خروجی allocate همیشه یک range از شماره‌های یکتا در همان چت است.
+    """
+
+    def allocate(self, chat_id, count=1) -> range:
+        raise NotImplementedError
+
+    def _chat_model(self):
+        from chat.models import ChatRoom
+        return ChatRoom
+
+
+class SelectForUpdateSequenceAllocator(BaseSequenceAllocator):
+    """روش قدیمی: قفل کردن ردیف چت روم و افزایش last_sequence"""
+
+    def allocate(self, chat_id, count=1) -> range:
+        ChatRoom = self._chat_model()
+        with transaction.atomic(using=router.db_for_write(ChatRoom)):
+            chat = ChatRoom.objects.select_for_update().only('id', 'last_sequence').get(pk=chat_id)
+            start = chat.last_sequence + 1
+            ChatRoom.objects.filter(pk=chat_id).update(last_sequence=F('last_sequence') + count)
+        return range(start, start + count)
+
+
+class AtomicUpdateSequenceAllocator(BaseSequenceAllocator):
+    """
+    یک دستور UPDATE ... RETURNING بدون نگه داشتن قفل در طول درج پیام.
+    اگر دیتابیس RETURNING در UPDATE را پشتیبانی نکند به روش قفل ردیف برمی‌گردد.
+    """
+
+    def __init__(self):
+        self._fallback = SelectForUpdateSequenceAllocator()
+
+    def supports_returning(self, connection):
+        if connection.vendor == 'postgresql':
+            return True
+        if connection.vendor == 'sqlite':
+            return connection.Database.sqlite_version_info >= (3, 35, 0)
+        return False
+
+    def allocate(self, chat_id, count=1) -> range:
+        ChatRoom = self._chat_model()
+        connection = connections[router.db_for_write(ChatRoom)]
+        if not self.supports_returning(connection):
+            return self._fallback.allocate(chat_id, count)
+
+        table = connection.ops.quote_name(ChatRoom._meta.db_table)
+        column = connection.ops.quote_name('last_sequence')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET {column} = {column} + %s WHERE id = %s RETURNING {column}',
+                [count, chat_id]
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise ChatRoom.DoesNotExist(f'ChatRoom {chat_id} does not exist')
+        end = row[0]
+        return range(end - count + 1, end + 1)
+
+
+class BlockSequenceAllocator(BaseSequenceAllocator):
+    """
+    هر پروسس یک بلوک از شماره‌ها را یک‌جا رزرو می‌کند و از حافظه تحویل می‌دهد.
+    شماره‌ها یکتا هستند ولی بین پروسس‌ها ترتیب زمانی ندارند و بلوک‌های نیمه‌مصرف
+    شکاف (gap) به جا می‌گذارند، پس last_sequence فقط سقف رزرو شده است.
+    مناسب ایمپورت و ربات‌ها، نه چت‌هایی که ترتیب دقیق لازم دارند.
+    """
+
+    def __init__(self, block_size=None, backend=None):
+        self.block_size = block_size or getattr(settings, 'CHAT_SEQUENCE_BLOCK_SIZE', 100)
+        self.backend = backend or AtomicUpdateSequenceAllocator()
+        self._blocks = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _chat_lock(self, chat_id):
+        """قفل جدا برای هر چت تا رزرو بلوک از دیتابیس برای یک چت، چت‌های دیگر را منتظر نگذارد"""
+        with self._lock:
+            lock = self._locks.get(chat_id)
+            if lock is None:
+                lock = self._locks[chat_id] = threading.Lock()
+            return lock
+
+    def allocate(self, chat_id, count=1) -> range:
+        if count >= self.block_size:
+            return self.backend.allocate(chat_id, count)
+
+        with self._chat_lock(chat_id):
+            block = self._blocks.get(chat_id)
+            if block is None or block[0] + count > block[1]:
+                reserved = self.backend.allocate(chat_id, self.block_size)
+                block = [reserved.start, reserved.stop]
+            start = block[0]
+            block[0] += count
+            self._blocks[chat_id] = block
+        return range(start, start + count)
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_sequence_allocator() -> BaseSequenceAllocator:
+    global _allocator
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                path = getattr(settings, 'CHAT_SEQUENCE_ALLOCATOR',
+                               'utils.sequence_allocator.AtomicUpdateSequenceAllocator')
+                _allocator = import_string(path)()
+    return _allocator
+
+
+def set_sequence_allocator(allocator: BaseSequenceAllocator):
+    """جایگزین کردن allocator فعلی (برای بنچمارک و تست)"""
+    global _allocator
+    with _allocator_lock:
+        _allocator = allocator